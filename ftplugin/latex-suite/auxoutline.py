@@ -10,201 +10,440 @@
 import re
 import os
 import sys
-if sys.version_info <= (3, 0):
-    from StringIO import StringIO
-else:
-    from io import StringIO
+import unicodedata
 
 
 # getFileContents {{{
-def getFileContents(fname):
-    if type(fname) is not str:
-        fname = fname.group(1)
-
+def getFileContents(fname, root=''):
     # Strategy for determining the name of the aux file:
     # If the suffix is '.tex' then throw it away.
     # If the suffix is not '.aux' then add '.aux'.
     fname = re.sub(r'\.tex$','',fname)
     if not re.search(r'\.aux$', fname):
         fname += '.aux'
-    if not os.path.isfile(fname):
+    if not os.path.isfile(os.path.join(root, fname)):
         return ''
 
     # Now we are in position to scan the file.
     try:
         # This longish thing is to make sure that all files are converted into
         # \n seperated lines.
-        contents = '\n'.join(open(fname).read().splitlines())
+        contents = '\n'.join(open(os.path.join(root, fname)).read().splitlines())
     except IOError:
         return ''
 
     # TODO what are all the ways in which an aux file can include another?
     pat = re.compile(r'^\\@input{(.*?)}', re.M)
     # pat = re.compile(r'^\\(@?)(include|input){(.*?)}', re.M)
-    contents = re.sub(pat, getFileContents, contents)
+    contents = re.sub(pat, lambda m: getFileContents(m.group(1), root), contents)
 
     return contents
 
 # }}}
 # utfify {{{
+# inputenc writes every non-ASCII character of the text into the .aux file
+# as \IeC {<command>}, with an accent command applied to a letter, or with
+# a command for a special letter.
+accents = {
+    '`': u'\u0300', "'": u'\u0301', '^': u'\u0302', '~': u'\u0303',
+    '=': u'\u0304', 'u': u'\u0306', '.': u'\u0307', '"': u'\u0308',
+    'r': u'\u030a', 'H': u'\u030b', 'v': u'\u030c', 'd': u'\u0323',
+    'c': u'\u0327', 'k': u'\u0328', 'b': u'\u0331',
+}
+letters = {
+    'ss': u'ß', 'o': u'ø', 'O': u'Ø',
+    'aa': u'å', 'AA': u'Å', 'ae': u'æ', 'AE': u'Æ',
+    'oe': u'œ', 'OE': u'Œ', 'l': u'ł', 'L': u'Ł',
+    'i': u'ı', 'j': u'ȷ', 'dh': u'ð', 'DH': u'Ð',
+    'th': u'þ', 'TH': u'Þ', 'dj': u'đ', 'DJ': u'Đ',
+    'ng': u'ŋ', 'NG': u'Ŋ',
+    'guillemotleft': u'«', 'guillemotright': u'»',
+    'guilsinglleft': u'‹', 'guilsinglright': u'›',
+    'quotedblbase': u'„', 'quotesinglbase': u'‚',
+    'textquotedblleft': u'“', 'textquotedblright': u'”',
+    'textquoteleft': u'‘', 'textquoteright': u'’',
+    'textexclamdown': u'¡', 'textquestiondown': u'¿',
+    'textendash': u'–', 'textemdash': u'—',
+    'textsection': u'§', 'S': u'§', 'textparagraph': u'¶',
+    'P': u'¶', 'pounds': u'£', 'textsterling': u'£',
+    'texteuro': u'€', 'textcopyright': u'©',
+    'textregistered': u'®', 'textdegree': u'°',
+    'textperiodcentered': u'·', 'textmu': u'µ',
+}
+ieCPattern = re.compile(r'\\IeC {((?:[^{}]|{[^{}]*})*)}')
+ieCCommandPattern = re.compile(r'\\([a-zA-Z]+|.) *(?:{ *(.*?) *}|(.*?)) *$')
+
+def decodeIeC(match):
+    """ returns the character encoded by an \\IeC command """
+    try:
+        return decodedIeC[match.group(1)]
+    except KeyError:
+        pass
+
+    content = match.group(1)
+    rep = match.group(0)
+    m = ieCCommandPattern.match(content)
+    if m:
+        (command, base) = (m.group(1), m.group(2) or m.group(3))
+        if not base:
+            rep = letters.get(command, rep)
+        elif command in accents:
+            # A dotless i or j carries the accent instead of the dot.
+            if base in ('\\i', '\\j'):
+                base = base[1]
+            char = unicodedata.normalize('NFC', base + accents[command])
+            if len(char) == 1:
+                rep = char
+    if rep is not match.group(0) and str is bytes:
+        rep = rep.encode('utf-8')
+
+    decodedIeC[content] = rep
+    return rep
+
+decodedIeC = {}
+
 def utfify(text):
-	for (pat,rep) in [['"a','ä'],['"o','ö'],['"u','ü'],['"A','Ä'],['"O','Ö'],['"U','Ü'], ['\'e', 'é']]:
-		text = [re.sub(r'\\IeC {\\' + pat + '}', rep, line) for line in text]
-	return text
+    return [ieCPattern.sub(decodeIeC, line) if '\\IeC' in line else line
+            for line in text]
 # }}}
 # stripComments {{{
+commentPattern = re.compile(r'(?<!\\)(\\\\)*%.*')
+
 def stripComments(contents):
     # remove all comments
     # comment is a '%' preceeded by an even number of '\'
-    uncomm = [re.sub(r'(?<!\\)(\\\\)*%.*', '', line) for line in contents.splitlines()]
+    uncomm = [commentPattern.sub('', line) if '%' in line else line
+              for line in contents.splitlines()]
 
     nonempty = [line for line in uncomm if line.strip()]
 
     return nonempty
 # }}}
-# getSectionLabels_Root {{{
-def getSectionLabels_Root(lineinfo, section_prefix, label_prefix, value_prefix):
-    outstr = StringIO('')
-    indent = ' ' * (2*section_prefix - 2)
-
-    # Check for cleveref
-    if re.search(r'\\newlabel{.*@cref}' , lineinfo ):
-      cleveref = True
-    else:
-      cleveref = False
-
-    for line in lineinfo.splitlines():
-        prev_txt = ''
-        if not line:
-            continue
-
-        # throw away leading white-space
-        line = line.lstrip()
-
-        # we found a label!
-        m = re.search(r'\\newlabel{(%s.*?)(@cref)?}' % label_prefix, line)
-        if m and not re.search(r'^tocindent-?[0-9]*$', m.group(1)):
-            label = m.group(1)
-
-            if cleveref:
-              # Cleveref was detected.
-              n = re.search(r'\\newlabel{(%s.*?)@cref}{{\[(.*)\]\[.*\]\[.*\](.*)}{.*}}' % label_prefix, line)
-              if n:
-                if n.group(2) == 'equation' or n.group(2) == 'subequation':
-                  # Found an equation
-                  prev_txt += '(' + n.group(3) + ')'
+# parseGroups {{{
+simpleGroupPattern = re.compile(r'{([^{}]*)}')
+# Matches a brace group nested at most three levels deep.
+groupPattern = re.compile(r'{((?:[^{}]|{(?:[^{}]|{[^{}]*})*})*)}')
+bracePattern = re.compile(r'[{}]')
+
+def parseGroups(text, pos=0, count=-1):
+    """ returns the contents of the brace groups starting at text[pos]
+
+    At most count groups directly following each other are read. Returns
+    the list of their contents and the position after the last group. A
+    group without its closing brace is left out.
+    """
+    groups = []
+    while count and text.startswith('{', pos):
+        m = groupPattern.match(text, pos)
+        if m:
+            groups.append(m.group(1))
+            pos = m.end()
+        else:
+            depth = 0
+            for b in bracePattern.finditer(text, pos):
+                if b.group() == '{':
+                    depth += 1
                 else:
-                  # Found something different
-                  prev_txt += n.group(2) + '.' + n.group(3)
+                    depth -= 1
+                    if not depth:
+                        break
+            if depth:
+                break
+            groups.append(text[pos + 1:b.start()])
+            pos = b.end()
+        count -= 1
+    return (groups, pos)
+# }}}
+# AuxLabel {{{
+class AuxLabel(object):
+    """ a label defined by a newlabel command of an .aux file
+
+    counter is the type of the labelled object as given by cleveref or by
+    the hyperref anchor, page and anchor are None if they were not given,
+    number is None if the value could not be read.
+    cleveref is set for the additional labels written by cleveref, whose
+    name has the suffix @cref removed.
+    """
+    __slots__ = ('name', 'counter', 'number', 'page', 'anchor', 'cleveref')
+
+    def __init__(self, name, counter, number, page=None, anchor=None,
+                 cleveref=False):
+        self.name = name
+        self.counter = counter
+        self.number = number
+        self.page = page
+        self.anchor = anchor
+        self.cleveref = cleveref
+
+    def text(self):
+        """ returns the counter and number shown for the label """
+        if self.number is None:
+            return ''
+        elif self.cleveref:
+            if self.counter == 'equation' or self.counter == 'subequation':
+                txt = '(' + self.number + ')'
             else:
-              # add the text (without aliascounter:) in the pre-last {} to the text
-              # which will be displayed below this label
-              n = re.search(r'\\newlabel{(%s.*?)}{{(\\relax )?(.*?)}.*{(aliascounter:)?(.*)}{.*?}}' % label_prefix, line)
-              if n:
-                # Hyperref was detected.
-                o = re.search(r'equation\.(.*)', n.group(5))
-                if o:
-                  # Found an equation
-                  prev_txt += '(' + n.group(3) + ')'
-                else:
-                  o = re.search(r'AMS\.(.*)', n.group(5))
-                  if o:
-                    # Found an named equation => try to find the name
-                    # After the name, there is the page number (assumed to be of the form [0-9a-zA-Z]* )
-                    p = re.search(r'\\newlabel{(%s.*?)}{{{(.*?)}}{[0-9a-zA-Z]*}' % label_prefix, line)
-                    if p:
-                      equation_number = p.group(2)
-                      prev_txt += '(' + equation_number + ')'
-                    else:
-                      prev_txt += n.group(5)
-                  else:
-                    prev_txt += re.match(r'^\w*', n.group(5)).group() + '.' + n.group(3)
-              else:
-                # Hyperref was not detected.
-                n = re.search(r'\\newlabel{(%s.*?)}{{(\\relax )?(.*)}{.*}}' % label_prefix, line)
-                prev_txt += n.group(3)
-
-            # Remove all curly braces in prev_txt:
-            prev_txt = re.sub(r'[{}]', '', prev_txt);
-
-            if prev_txt != "" and re.match( value_prefix, prev_txt):
-                # Print label and counter+number:
-                outstr.write('>%s%s\n'   % (indent, label))
-                outstr.write(':%s  %s\n' % (indent, prev_txt))
-
-    return outstr.getvalue()
+                txt = self.counter + '.' + self.number
+        elif self.anchor is None:
+            txt = self.number
+        elif 'equation.' in self.anchor:
+            txt = '(' + self.number + ')'
+        elif 'AMS.' in self.anchor:
+            # A named equation: The name is given within an extra pair of
+            # braces, and is followed by the page number.
+            if (self.number[:1] == '{' and self.number[-1:] == '}'
+                    and pagePattern.match(self.page)):
+                txt = '(' + self.number[1:-1] + ')'
+            else:
+                txt = self.anchor
+        else:
+            txt = self.counter + '.' + self.number
+
+        # Remove all curly braces
+        return txt.replace('{', '').replace('}', '')
+
+pagePattern = re.compile(r'[0-9a-zA-Z]*$')
+counterPattern = re.compile(r'\w*')
+crefPattern = re.compile(r'\[(.*)\]\[.*\]\[.*\](.*)$')
+# }}}
+# parseLabel {{{
+labelPattern = re.compile(r'\s*\\newlabel{([^{}]*)}{(.*)}\s*$')
+newlabelPattern = re.compile(r'\s*\\newlabel(?={)')
+tocindentPattern = re.compile(r'tocindent-?[0-9]*$')
+
+def parseLabel(line):
+    """ returns the AuxLabel defined by a newlabel line, else None
+
+    The value of a label consists of the number and the page, followed by
+    the title, the anchor and one more argument if hyperref is used. The
+    values written by cleveref are [counter][n][prefix]number and
+    [..][..][..]page.
+    """
+    m = labelPattern.match(line)
+    if m:
+        (name, value) = m.groups()
+    else:
+        m = newlabelPattern.match(line)
+        if not m:
+            return None
+        (groups, pos) = parseGroups(line, m.end(), 2)
+        if len(groups) < 2:
+            return None
+        (name, value) = groups
+    if tocindentPattern.match(name):
+        return None
+
+    # The arguments are usually found by a single search, unless they are
+    # nested.
+    args = simpleGroupPattern.findall(value)
+    if sum(map(len, args)) + 2*len(args) != len(value):
+        args = groupPattern.findall(value)
+        if sum(map(len, args)) + 2*len(args) != len(value):
+            (args, pos) = parseGroups(value)
+    if len(args) < 2:
+        return None
+
+    if name.endswith('@cref'):
+        c = crefPattern.match(args[0])
+        if not c:
+            return AuxLabel(name[:-5], None, None, cleveref=True)
+        p = crefPattern.match(args[1])
+        return AuxLabel(name[:-5], c.group(1), c.group(2),
+                        p and p.group(2), cleveref=True)
+
+    number = args[0]
+    if number.startswith('\\relax '):
+        number = number[7:]
+    if len(args) < 3:
+        return AuxLabel(name, '', number, args[1])
+
+    anchor = args[-2]
+    if anchor.startswith('aliascounter:'):
+        anchor = anchor[13:]
+    return AuxLabel(name, counterPattern.match(anchor).group(), number,
+                    args[1], anchor)
+# }}}
+# AuxSection {{{
+class AuxSection(object):
+    """ a node of the section tree built by buildAuxTree()
+
+    level is the index of the sectioning command in the list of section
+    types, or -1 for the root of the tree. The heading is shown with depth
+    depth, the labels in children with depth + 1. Labels written by cleveref
+    replace the other labels of the section if there are any.
+    """
+    __slots__ = ('level', 'sectype', 'heading', 'depth', 'children',
+                 'cleveref')
+
+    def __init__(self, level, sectype, heading, depth):
+        self.level = level
+        self.sectype = sectype
+        self.heading = heading
+        self.depth = depth
+        self.children = []
+        self.cleveref = False
+
+    def sections(self):
+        """ yields all sections below this one, depth first """
+        for child in self.children:
+            if isinstance(child, AuxSection):
+                yield child
+                for sec in child.sections():
+                    yield sec
+
+    def labels(self):
+        """ yields (section, label) for all labels shown below this section """
+        for child in self.children:
+            if isinstance(child, AuxSection):
+                for item in child.labels():
+                    yield item
+            elif child.cleveref == self.cleveref:
+                yield (self, child)
+
+    def title(self):
+        """ returns the number and the name of the section """
+        patterns = headingPatterns.get(self.sectype)
+        if patterns is None:
+            patterns = [re.compile(p % self.sectype) for p in headingFormats]
+            headingPatterns[self.sectype] = patterns
+        (o1, o2, o3, o4) = [p.search(self.heading) for p in patterns]
+        if o1:
+            return (o1.group(2) + ' ', o1.group(3))
+        elif o2:
+            return (o2.group(2) + ' ', o2.group(3))
+        elif o3:
+            if o3.group(2) == "":
+                return (o3.group(3) + ' ', o3.group(4))
+            else:
+                return (o3.group(2) + ' ' + o3.group(3) + ' ', o3.group(4))
+        elif o4:
+            return ('', o4.group(1))
+        print('Unknown heading format "%s"' % self.heading)
+        return ('??', 'Unknown Name')
+
+    def render(self, label_prefix='', value_prefix=''):
+        """ returns the outline text of this section
+
+        Only labels starting with label_prefix and whose text starts with
+        value_prefix are shown, both are regular expressions. Sections
+        without any labels are left out.
+        """
+        label_re = re.compile(label_prefix)
+        value_re = re.compile(value_prefix)
+        return ''.join(self.renderLines(label_re, value_re))
+
+    def renderLines(self, label_re, value_re):
+        indent = ' ' * (2*self.depth)
+        lines = []
+        for child in self.children:
+            if isinstance(child, AuxSection):
+                lines.extend(child.renderLines(label_re, value_re))
+            elif child.cleveref == self.cleveref and label_re.match(child.name):
+                txt = child.text()
+                if txt != "" and value_re.match(txt):
+                    # Print label and counter+number:
+                    lines.append('>%s%s\n'   % (indent, child.name))
+                    lines.append(':%s  %s\n' % (indent, txt))
+
+        if lines and self.level >= 0:
+            (number, name) = self.title()
+            sec_heading = 2*' '*(self.depth-1)
+            sec_heading += '%s%s' % (number, name)
+            sec_heading += '<<<%d\n' % self.depth
+            lines.insert(0, sec_heading)
+        return lines
+
+headingFormats = [
+        r'{%s}{\\numberline {(\\relax )?(.*?)}(.*?)}{[^{}]*}{[^{}]*}}$', # With hyperref
+        r'{%s}{\\numberline {(\\relax )?(.*?)}(.*?)}', # Without hyperref
+        r'{%s}{\\toc(section|chapter) {(.*?)}{(.*?)}{(.*?)}', # amsart,amsbook
+        r'{%s}{(.*?)}']
+headingPatterns = {}
+# }}}
+# buildAuxTree {{{
+def buildAuxTree(lines,
+        sectypes=['part', 'chapter', 'section', 'subsection', 'subsubsection', 'paragraph', 'subparagraph'],
+        section_prefix=1):
+    """ returns the tree of sections and labels of the lines of an .aux file
+
+    The lines are read once, keeping the currently open section of every
+    level on a stack. Every newlabel line is parsed into an AuxLabel.
+    """
+    root = AuxSection(-1, '', '', section_prefix - 1)
+    depth = len(sectypes)
+    # stack[d] is the section which holds the contents of level d.
+    stack = [root] * (depth + 1)
+    if sectypes:
+        heading = re.compile(r'\\@writefile{toc}{\\contentsline {(%s)}'
+                             % '|'.join(sectypes))
+        levels = dict((name, i) for (i, name) in enumerate(sectypes))
+    else:
+        heading = None
+
+    for line in lines:
+        if heading and '\\@writefile' in line:
+            h = heading.search(line)
+            if h:
+                level = levels[h.group(1)]
+                sec = AuxSection(level, h.group(1), line[h.start():],
+                                 stack[level].depth + 1)
+                stack[level].children.append(sec)
+                for d in range(level + 1, depth + 1):
+                    stack[d] = sec
+                continue
+
+        if '\\newlabel' in line:
+            label = parseLabel(line)
+            if label:
+                stack[depth].children.append(label)
+                if label.cleveref:
+                    stack[depth].cleveref = True
+
+    return root
 # }}}
 # getSectionLabels {{{
 def getSectionLabels(lineinfo, 
         sectypes=['part', 'chapter', 'section', 'subsection', 'subsubsection', 'paragraph', 'subparagraph'], 
         section_prefix=1, label_prefix='', value_prefix=''):
-
-    if not sectypes:
-        return getSectionLabels_Root(lineinfo, section_prefix, label_prefix, value_prefix)
-
-    sections = re.split(r'(\\@writefile{toc}{\\contentsline {%s}.*)' % sectypes[0], lineinfo)
-    
-    # there will 1+2n sections, the first containing the "preamble" and the
-    # others containing the child sections as paris of [section_name,
-    # section_text]
-
-    rettext = getSectionLabels(sections[0], sectypes[1:], section_prefix, label_prefix, value_prefix)
- 
-    for i in range(1,len(sections),2):
-
-        section_label_text = getSectionLabels(sections[i+1], sectypes[1:], section_prefix+1, label_prefix, value_prefix)
-
-        if section_label_text:
-          # This section contains labels
-          # Let us determine the section number and the section heading
-          o1 = re.search( r'{%s}{\\numberline {(\\relax )?(.*?)}(.*?)}{[^{}]*}{[^{}]*}}$' % sectypes[0] , sections[i]) # With hyperref
-          o2 = re.search( r'{%s}{\\numberline {(\\relax )?(.*?)}(.*?)}' % sectypes[0] , sections[i]) # Without hyperref
-          o3 = re.search( r'{%s}{\\toc(section|chapter) {(.*?)}{(.*?)}{(.*?)}' % sectypes[0] , sections[i]) # amsart,amsbook
-          o4 = re.search( r'{%s}{(.*?)}' % sectypes[0] , sections[i])
-          if o1:
-            section_name = o1.group(3)
-            section_number = o1.group(2) + ' '
-          elif o2:
-            section_name = o2.group(3)
-            section_number = o2.group(2) + ' '
-          elif o3:
-            section_name = o3.group(4)
-            if o3.group(2) == "":
-              section_number =  o3.group(3) + ' '
-            else:
-              section_number =  o3.group(2) + ' ' + o3.group(3) + ' '
-          elif o4:
-            section_name = o4.group(1)
-            section_number = ''
-          else:
-            print('Unknown heading format "%s"' % sections[i])
-            section_name = "Unknown Name"
-            section_number = "??"
-          sec_heading = 2*' '*(section_prefix-1)
-          sec_heading += '%s%s' % (section_number, section_name)
-          sec_heading += '<<<%d\n' % section_prefix
-
-          rettext += sec_heading + section_label_text
-
-    return rettext
-    
+    tree = buildAuxTree(lineinfo.splitlines(), sectypes, section_prefix)
+    return tree.render(label_prefix, value_prefix)
 # }}}
 
+# getAuxTree {{{
+# The tree of the last .aux file read is kept together with the contents it
+# was built from, so that it is only built again if the file changed.
+auxCache = {}
+
+def getAuxTree(fname, root=''):
+    """ returns the tree of sections and labels of the .aux file of fname
+
+    Relative file names are looked up in the directory root, which is the
+    current directory by default.
+    """
+    contents = getFileContents(fname, root)
+    path = os.path.abspath(os.path.join(root, fname))
+    cached = auxCache.get(path)
+    if cached and cached[0] == contents:
+        return cached[1]
+
+    tree = buildAuxTree(utfify(stripComments(contents)))
+    auxCache.clear()
+    auxCache[path] = (contents, tree)
+    return tree
+
+def readAuxTree(fname, root=''):
+    """ returns the tree of the .aux file of fname as getAuxTree() does,
+    without using auxCache """
+    return buildAuxTree(utfify(stripComments(getFileContents(fname, root))))
+# }}}
 # main {{{
 def main(fname, prefix):
     [head, tail] = os.path.split(fname)
-    if head:
-        os.chdir(head)
-
-    contents = getFileContents(fname)
-    nonempty = stripComments(contents)
-    utftext = utfify(nonempty)
-
-    lineinfo = ''
-    for line in utftext:
-        lineinfo += line + '\n'
-
-    
+    return complete(getAuxTree(tail, head), prefix)
+# }}}
+# complete {{{
+def complete(tree, prefix):
+    """ returns the labels of the tree matching prefix as main() does """
     # Does prefix look like a label or a value?
     o = re.match( r'(\([0-9a-zA-Z.]*|\w*\.[0-9a-zA-Z.]*)' , prefix )
     if o:
@@ -214,7 +453,7 @@ def main(fname, prefix):
         label_prefix = prefix
         value_prefix = ''
 
-    rettext = getSectionLabels(lineinfo, label_prefix=label_prefix, value_prefix=value_prefix)
+    rettext = tree.render(label_prefix, value_prefix)
 
     a = re.findall( r'(^|\n)> *([^ ].*)\n' , rettext)
 
@@ -235,7 +474,80 @@ def main(fname, prefix):
         return rettext
 # }}}
 
+# benchmark {{{
+def benchmark(nlabels=20000, repeat=5):
+    """ times utfify() and main() on a synthetic non-English .aux file
+
+    The titles of all sections and labels consist of words with accented
+    letters, as written by inputenc. Returns a summary and a list of the
+    failures: utfify() must give the words as they were written, and main()
+    the outline of the tree built without auxCache.
+    """
+    import shutil
+    import tempfile
+
+    import texbackend
+
+    words = [(r'M\IeC {\"u}ller', u'Müller'), (r'Stra\IeC {\ss }e', u'Straße'),
+             (r'Caf\IeC {\'e}', u'Café'), (r'Fran\IeC {\c c}ais', u'Français'),
+             (r'\IeC {\v S}koda', u'Škoda'), (r'Erd\IeC {\H o}s', u'Erdős'),
+             (r'\IeC {\L }\IeC {\'o}d\IeC {\'z}', u'Łódź'), (r'\IeC {\aa }r', u'år'),
+             (r'\IeC {\o }l', u'øl'), (r'Espa\IeC {\~n}a', u'España'),
+             (r'\IeC {\'\i }ndice', u'índice')]
+    section = r'\@writefile{toc}{\contentsline {section}{\numberline {%d}%s}{%d}{section.%d}}'
+    label = r'\newlabel{eq:%d}{{%d}{%d}{%s}{equation.%d}{}}'
+    lines = []
+    expected = []
+    for i in range(nlabels):
+        title = ' '.join(words[(i + j) % len(words)][0] for j in range(3))
+        text = u' '.join(words[(i + j) % len(words)][1] for j in range(3))
+        if str is bytes:
+            text = text.encode('utf-8')
+        if i % 10 == 0:
+            lines.append(section % (i, title, i, i))
+            expected.append(section % (i, text, i, i))
+        lines.append(label % (i, i, i, title, i))
+        expected.append(label % (i, i, i, text, i))
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmpdir, 'bench.aux')
+        f = open(fname, 'w')
+        f.write('\n'.join(lines) + '\n')
+        f.close()
+
+        def utfifyFromScratch():
+            decodedIeC.clear()
+            return utfify(lines)
+
+        def mainFromScratch():
+            auxCache.clear()
+            return main(fname, 'eq:1')
+
+        (utfifyTime, decoded) = texbackend.bestTime(utfifyFromScratch, repeat)
+        (mainTime, outline) = texbackend.bestTime(mainFromScratch, repeat)
+        uncached = complete(readAuxTree(fname), 'eq:1')
+    finally:
+        shutil.rmtree(tmpdir)
+
+    failures = []
+    for (line, want) in zip(decoded, expected):
+        if line != want:
+            failures.append('utfify: %r instead of %r' % (line, want))
+            break
+    if outline != uncached:
+        failures.append('main: the outline differs from the one without auxCache')
+    return ('labels: %d, best of %d: utfify %.3f s, main %.3f s' % (
+        nlabels, repeat, utfifyTime, mainTime), failures)
+# }}}
+
 if __name__ == "__main__":
+    if sys.argv[1:2] == ['--benchmark']:
+        import texbackend
+
+        (summary, failures) = benchmark(*[int(arg) for arg in sys.argv[2:4]])
+        texbackend.exitChecks(failures, summary)
+
     if len(sys.argv) > 2:
         prefix = sys.argv[2]
     else:
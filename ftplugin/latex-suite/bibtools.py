@@ -4,19 +4,31 @@
 
 import re
 import os
+import array
+import bisect
+import copy
+import hashlib
+import multiprocessing
+import threading
+import time
+import unicodedata
 
 try:
     from urllib.request import urlopen, pathname2url
 except ImportError:
     from urllib import urlopen, pathname2url
 
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
 # Compatibility functions
-# Check for existence of builtin function next()
+# In python2, intern() is a builtin
 try:
-    next
-except NameError:
-    def next(it):
-        return it.next()
+    from sys import intern
+except ImportError:
+    pass
 
 # Define items(dict) as an iterator over the items
 if not("iteritems" in dir(dict())):
@@ -29,101 +41,208 @@ else:
         return dictionary.iteritems()
 
 
-class Bibliography(dict):
-    def __init__(self, txt, macros={}):
-        r"""
-        txt:
-            a string which represents the entire bibtex entry. A typical
-            entry is of the form:
-                @ARTICLE{ellington:84:part3,
-                  author = {Ellington, C P},
-                  title = {The Aerodynamics of Hovering Insect Flight. III. Kinematics},
-                  journal = {Philosophical Transactions of the Royal Society of London. Series B, Biological Sciences},
-                  year = {1984},
-                  volume = {305},
-                  pages = {41-78},
-                  number = {1122},
-                  owner = {Srinath},
-                  timestamp = {2006.01.02},
-                }
-        """
+# Regular expressions used by the tokenizer. They are always matched at a
+# given position of the file contents, such that the contents never need to
+# be sliced or copied while scanning.
+_entry_re = re.compile(r'@\s*(\w+)\s*([{(])\s*')
+_key_re = re.compile(r'([^\s,={}()"]+)\s*,')
+_sep_re = re.compile(r'[\s,]*')
+_field_re = re.compile(r'([^\s,={}()"#]+)\s*=\s*')
+_word_re = re.compile(r'[^\s,={}()"#]+')
+_space_re = re.compile(r'\s*')
+# Most fields have a single value without nested braces. These are scanned
+# with a single match.
+_simplefield_re = re.compile(
+    r'([^\s,={}()"#]+)\s*=\s*'
+    r'(\{([^{}]*)\}|"([^{}"]*)"|([^\s,={}()"#]+))\s*(?=[,})]|$)')
+# Runs of white space are collapsed into a single space in the field
+# values. Single spaces are not matched, which saves most of the
+# replacements.
+_whitespace_re = re.compile(r'\s\s+|[^\S ]')
+_braces_re = re.compile(r'[{}]')
+_quote_re = re.compile(r'[{}"]')
+
+
+def _closebrace(content, pos):
+    """ returns the position of the brace closing the one at pos or -1 """
+    depth = 0
+    for m in _braces_re.finditer(content, pos):
+        if m.group(0) == '{':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return m.start()
+    return -1
+
+
+def _closequote(content, pos):
+    """ returns the position of the quote closing the one at pos or -1
+
+    As in bibtex, a quote inside braces does not end the value.
+    """
+    depth = 0
+    for m in _quote_re.finditer(content, pos + 1):
+        if m.group(0) == '{':
+            depth += 1
+        elif m.group(0) == '}':
+            depth -= 1
+        elif depth == 0:
+            return m.start()
+    return -1
+
+
+def _value(content, pos):
+    """ scans the value of a field starting at pos
+
+    Returns a tuple (parts, end, pos) where parts is as described in
+    tokenize(), end is the end of the value and pos the position of the
+    first non-white character after it. Returns None if the value is
+    malformed.
+    """
+    parts = []
+    while pos < len(content):
+        c = content[pos]
+        if c == '{':
+            e = _closebrace(content, pos)
+            if e < 0:
+                return None
+            parts.append(('{', content[(pos + 1):e]))
+            pos = e + 1
+        elif c == '"':
+            e = _closequote(content, pos)
+            if e < 0:
+                return None
+            parts.append(('"', content[(pos + 1):e]))
+            pos = e + 1
+        else:
+            w = _word_re.match(content, pos)
+            if not w:
+                return None
+            parts.append(('', w.group(0)))
+            pos = w.end()
+
+        end = pos
+        pos = _space_re.match(content, pos).end()
+        if not content.startswith('#', pos):
+            return (parts, end, pos)
+        pos = _space_re.match(content, pos + 1).end()
 
-        for k, v in items(macros):
-            txt = txt.replace(k, '{' + v + '}')
+    return None
 
-        m = re.match(r'\s*@(\w+)\s*{\s*((\S+),)?(.*)}\s*', txt,
-                     re.MULTILINE | re.DOTALL)
+
+def tokenize(content):
+    r"""
+    Scans the contents of a bibtex file once and yields the entries found in
+    it as tuples of the form
+
+        (bibtype, key, fields, start, bodystart, end)
+
+    bibtype and key are given as in the file, key is None for @string
+    entries and for entries whose key is missing or malformed. start and
+    end are the offsets of the '@' and of the closing delimiter of the
+    entry and the body of the entry starts at bodystart.
+    fields is a list of tuples
+
+        (name, parts, start, end)
+
+    where parts is the list of the values concatenated with '#'. Each value
+    is a tuple (delimiter, text) with delimiter one of '{', '"' or '' (for
+    numbers and macro names). start and end are the offsets of the value.
+
+    As in bibtex, text outside of entries is ignored and @comment and
+    @preamble entries are skipped. A malformed entry is skipped as well and
+    scanning resumes after its '@'.
+    """
+    pos = 0
+    while True:
+        start = content.find('@', pos)
+        if start < 0:
+            return
+
+        m = _entry_re.match(content, start)
         if not m:
-            return None
+            pos = start + 1
+            continue
 
-        self['bibtype'] = m.group(1).capitalize()
-        self['key'] = m.group(3)
-        self['body'] = m.group(4)
+        bibtype = m.group(1)
+        if m.group(2) == '{':
+            close = '}'
+        else:
+            close = ')'
+
+        if bibtype.lower() in ('comment', 'preamble'):
+            pos = m.end()
+            if m.group(2) == '{':
+                end = _closebrace(content, m.end(2) - 1)
+                if end >= 0:
+                    pos = end + 1
+            continue
+
+        pos = m.end()
+        key = None
+        if bibtype.lower() != 'string':
+            k = _key_re.match(content, pos)
+            if k:
+                key = k.group(1)
+                pos = k.end()
+        bodystart = pos
 
-        body = self['body']
-        self['bodytext'] = ''
-        while 1:
-            m = re.search(r'(\S+?)\s*=\s*(.)', body)
-            if not m:
+        fields = []
+        end = -1
+        while True:
+            pos = _sep_re.match(content, pos).end()
+            if pos >= len(content):
+                break
+            if content[pos] == close:
+                end = pos
                 break
 
-            field = m.group(1)
+            f = _simplefield_re.match(content, pos)
+            if f:
+                if f.group(3) is not None:
+                    parts = [('{', f.group(3))]
+                elif f.group(4) is not None:
+                    parts = [('"', f.group(4))]
+                else:
+                    parts = [('', f.group(5))]
+                fields.append((f.group(1), parts, f.start(2), f.end(2)))
+                pos = f.end()
+                continue
 
-            body = body[(m.start(2) + 1):]
-            if m.group(2) == '{':
-                # search for the next closing brace. This is not simply a
-                # matter of searching for the next closing brace since
-                # braces can be nested. The following code basically goes
-                # to the next } which has not already been closed by a
-                # following {.
-                mniter = re.finditer(r'{|}', body)
-
-                count = 1
-                while 1:
-                    try:
-                        mn = next(mniter)
-                    except StopIteration:
-                        return None
-
-                    if mn.group(0) == '{':
-                        count += 1
-                    else:
-                        count -= 1
-
-                    if count == 0:
-                        value = body[:(mn.start(0))]
-                        break
-
-            elif m.group(2) == '"':
-                # search for the next unquoted double-quote. To be more
-                # precise, a double quote which is preceded by an even
-                # number of double quotes.
-                mn = re.search(r'(?!\\)(\\\\)*"', body)
-                if not mn:
-                    return None
+            f = _field_re.match(content, pos)
+            if not f:
+                break
 
-                value = body[:(mn.start(0))]
+            v = _value(content, f.end())
+            if not v:
+                break
+            (parts, valueend, pos) = v
+            fields.append((f.group(1), parts, f.end(), valueend))
 
-            else:
-                # $ always matches. So we do not need to do any
-                # error-checking.
-                mn = re.search(r',|$', body)
-                value = m.group(2) + body[:(mn.start(0))].rstrip()
+        if end < 0:
+            # malformed entry
+            pos = start + 1
+            continue
 
-            self[field.lower()] = re.sub(r'\s+', ' ', value)
-            body = body[(mn.start(0) + 1):]
+        pos = end + 1
+        yield (bibtype, key, fields, start, bodystart, end)
 
-            self['bodytext'] += ('  %s: %s\n' % (field, value))
-            if self['bibtype'].lower() == 'string':
-                self['macro'] = {field: value}
 
-        self['bodytext'] = self['bodytext'].rstrip()
+def expand(parts, macros):
+    """ joins the parts of a value as given by tokenize(), expanding macros """
+    return ''.join([text if delim else macros.get(text.lower(), text)
+                    for (delim, text) in parts])
 
-    def __getitem__(self, key):
-        try:
-            return dict.__getitem__(self, key)
-        except KeyError:
-            return ''
+
+class BibFormat(object):
+    """ formatting and filtering of bibtex entries
+
+    This is shared by Bibliography and BibEntry, which only need to provide
+    the item access of a dictionary.
+    """
+
+    __slots__ = ()
 
     def __str__(self):
         if self['bibtype'].lower() == 'string':
@@ -181,55 +300,708 @@ class Bibliography(dict):
         return True
 
 
+class Bibliography(BibFormat, dict):
+    def __init__(self, txt, macros={}, tokens=None):
+        r"""
+        txt:
+            a string which represents the entire bibtex entry. A typical
+            entry is of the form:
+                @ARTICLE{ellington:84:part3,
+                  author = {Ellington, C P},
+                  title = {The Aerodynamics of Hovering Insect Flight. III. Kinematics},
+                  journal = {Philosophical Transactions of the Royal Society of London. Series B, Biological Sciences},
+                  year = {1984},
+                  volume = {305},
+                  pages = {41-78},
+                  number = {1122},
+                  owner = {Srinath},
+                  timestamp = {2006.01.02},
+                }
+        macros:
+            the @string macros which are expanded in the field values.
+        tokens:
+            the entry as yielded by tokenize(txt). If given, txt may also
+            be the contents of the complete file.
+        """
+
+        if tokens is None:
+            for tokens in tokenize(txt):
+                break
+            else:
+                return None
+
+        (bibtype, key, fields, start, bodystart, end) = tokens
+
+        self['bibtype'] = bibtype.capitalize()
+        self['key'] = key
+        self['body'] = txt[bodystart:end]
+
+        bodytext = []
+        for field, parts, valuestart, valueend in fields:
+            value = expand(parts, macros)
+
+            self[field.lower()] = _whitespace_re.sub(' ', value)
+            bodytext.append('  %s: %s' % (field, value))
+            if self['bibtype'].lower() == 'string':
+                self['macro'] = {field.lower(): value}
+
+        self['bodytext'] = '\n'.join(bodytext).rstrip()
+
+    def __getitem__(self, key):
+        try:
+            return dict.__getitem__(self, key)
+        except KeyError:
+            return ''
+
+
+class BibEntry(BibFormat):
+    r"""
+    A compact representation of a bibtex entry.
+
+    In contrast to a Bibliography, the field values are not copied out of
+    the contents of the file. The entry keeps a reference to the contents
+    (which is shared by all entries of a file) together with the offsets
+    of the field values, and the values are only created when they are
+    accessed. For values which contain macro names, the parts of the value
+    are stored and the macros are expanded on access, using the dictionary
+    of macros assigned to the entry. Fields which are missing in the entry
+    are looked up in the entries it inherits from (via crossref or xdata),
+    see BibFile.link(). Item access works as for a Bibliography.
+    """
+
+    __slots__ = ('content', 'bibtype', 'key', 'names', 'rawnames', 'spans',
+                 'parts', 'macros', 'parents', 'bodystart', 'end', 'extra',
+                 'id', 'file')
+
+    # These fields are not inherited.
+    private = ('crossref', 'xdata', 'ids')
+
+    def __init__(self, content, tokens, macros=None):
+        (bibtype, key, fields, start, bodystart, end) = tokens
+
+        self.content = content
+        self.bibtype = intern(bibtype.capitalize())
+        self.key = key
+        self.bodystart = bodystart
+        self.end = end
+        self.parts = None
+        self.macros = macros
+        self.parents = None
+        self.extra = None
+        self.id = ''
+        self.file = ''
+
+        names = []
+        rawnames = []
+        spans = array.array('L')
+        for field, parts, valuestart, valueend in fields:
+            rawnames.append(intern(field))
+            names.append(intern(field.lower()))
+            if len(parts) == 1 and parts[0][0]:
+                # a single braced or quoted value
+                spans.extend((valuestart + 1, valueend - 1))
+            elif len(parts) == 1 and parts[0][1].isdigit():
+                # a number
+                spans.extend((valuestart, valueend))
+            else:
+                spans.extend((0, 0))
+                if self.parts is None:
+                    self.parts = {}
+                self.parts[names[-1]] = tuple(parts)
+
+        self.names = tuple(names)
+        if rawnames == names:
+            self.rawnames = self.names
+        else:
+            self.rawnames = tuple(rawnames)
+        self.spans = spans
+
+    def __getstate__(self):
+        return (self.content, self.bibtype, self.key, self.names,
+                self.rawnames, self.spans, self.parts, self.macros,
+                self.parents, self.bodystart, self.end, self.extra, self.id,
+                self.file)
+
+    def __setstate__(self, state):
+        (self.content, self.bibtype, self.key, self.names,
+         self.rawnames, self.spans, self.parts, self.macros,
+         self.parents, self.bodystart, self.end, self.extra, self.id,
+         self.file) = state
+
+    def __copy__(self):
+        new = BibEntry.__new__(BibEntry)
+        new.__setstate__(self.__getstate__())
+        if new.extra is not None:
+            new.extra = dict(new.extra)
+        return new
+
+    def ownvalue(self, key):
+        """ returns the value of a field of the entry, without inheritance """
+        if key not in self.names:
+            return ''
+        return _whitespace_re.sub(' ', self.rawvalue(self.names.index(key)))
+
+    def rawvalue(self, i):
+        """ returns the value of the i-th field with macros expanded """
+        if self.parts is not None and self.names[i] in self.parts:
+            return expand(self.parts[self.names[i]], self.macros or {})
+        return self.content[self.spans[2 * i]:self.spans[2 * i + 1]]
+
+    def __getitem__(self, key):
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        if key in ('bibtype', 'key', 'id', 'file'):
+            return getattr(self, key)
+        if key == 'body':
+            return self.content[self.bodystart:self.end]
+        if key == 'bodytext':
+            return '\n'.join(['  %s: %s' % (self.rawnames[i], self.rawvalue(i))
+                              for i in range(len(self.names))]).rstrip()
+        try:
+            i = self.names.index(key)
+        except ValueError:
+            if self.parents is not None and key not in self.private:
+                for p in self.parents:
+                    if key in p.names:
+                        return p[key]
+            return ''
+        return _whitespace_re.sub(' ', self.rawvalue(i))
+
+    def __setitem__(self, key, value):
+        if key in ('bibtype', 'key', 'id', 'file'):
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        # As bibtex, we use the first one of repeated fields.
+        keys = ['bibtype', 'key', 'body']
+        keys += [k for (i, k) in enumerate(self.names)
+                 if k not in self.names[:i]]
+        if self.parents is not None:
+            for p in self.parents:
+                keys += [k for k in p.names
+                         if k not in keys and k not in self.private]
+        keys.append('bodytext')
+        if self.file != '':
+            keys.append('file')
+        if self.id != '':
+            keys.append('id')
+        if self.extra is not None:
+            keys += [k for k in self.extra if k not in keys]
+        return keys
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    iteritems = items
+
+
+class BibIndex:
+    r"""
+    An inverted index over the fields of bibtex entries.
+
+    For every field which is filtered on, the index holds the postings of
+    the words occurring in the field and a table of the field values sorted
+    for prefix lookups. Both are built on first use only.
+
+    entries must be given in the order of their 'id'.
+    """
+
+    # Filters which consist of plain text (possibly anchored with '^') can
+    # be looked up in the index.
+    literal = re.compile(r'(\^?)([^\\.^$*+?{}\[\]|()]+)$')
+    word = re.compile(r'\w+$')
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.postings = {}
+        self.prefixes = {}
+
+    def getpostings(self, field):
+        if field not in self.postings:
+            postings = {}
+            for b in self.entries:
+                for token in re.findall(r'\w+', b[field].lower()):
+                    postings.setdefault(token, set()).add(b['id'])
+            self.postings[field] = postings
+        return self.postings[field]
+
+    def getprefixes(self, field):
+        if field not in self.prefixes:
+            table = sorted([(b[field].lower(), b['id']) for b in self.entries])
+            self.prefixes[field] = ([v for v, i in table], [i for v, i in table])
+        return self.prefixes[field]
+
+    def lookup(self, field, regexp):
+        """ returns the set of ids of the entries which may satisfy the filter
+
+        Returns None if the filter cannot be looked up in the index.
+        """
+        m = self.literal.match(regexp)
+        if not m:
+            return None
+        text = m.group(2).lower()
+
+        if m.group(1):
+            # The value has to start with text.
+            (values, ids) = self.getprefixes(field)
+            found = set()
+            i = bisect.bisect_left(values, text)
+            while i < len(values) and values[i].startswith(text):
+                found.add(ids[i])
+                i += 1
+            return found
+
+        if self.word.match(text):
+            # A match of a single word lies within a single token of the
+            # field.
+            found = set()
+            for token, ids in items(self.getpostings(field)):
+                if text in token:
+                    found |= ids
+            return found
+
+        return None
+
+
+class BibCache:
+    r"""
+    A persistent cache of parsed bibtex files.
+
+    For every file, the parsed entries and the @string macros defined in it
+    are stored together with the size, modification time and a hash of the
+    contents of the file. Since the macros defined in previously loaded
+    files are expanded in the entries, a digest of these macros is also
+    recorded.
+
+    maxsize bounds the total size (in bytes) of the bibtex files kept in
+    the cache. When the cache is saved, the least recently used files are
+    thrown out first. A cache file which cannot be read is silently
+    discarded, which means that all files are parsed again.
+
+    The cache may be used by several threads, the project index of texindex
+    reads bibtex files in the background.
+    """
+
+    # Increase this whenever the format of the cached entries changes.
+    version = 5
+
+    def __init__(self, filename='', maxsize=64 * 1024 * 1024):
+        if not filename:
+            cachedir = os.environ.get('XDG_CACHE_HOME') or \
+                os.path.join(os.path.expanduser('~'), '.cache')
+            filename = os.path.join(cachedir, 'vim-latex', 'bibcache')
+        self.filename = filename
+        self.maxsize = maxsize
+        self.records = None
+        self.dirty = False
+        self.lock = threading.RLock()
+
+    def load(self):
+        self.records = {}
+        self.dirty = False
+        try:
+            fp = open(self.filename, 'rb')
+            try:
+                data = pickle.load(fp)
+            finally:
+                fp.close()
+        except Exception:
+            # The cache does not exist or is corrupt. Start from scratch.
+            return
+
+        if type(data) is dict and data.get('version') == self.version:
+            self.records = data['records']
+
+    def get(self, path, digest=None):
+        """ returns the cached (entries, strings) of a file or None
+
+        The size and modification time of the file are checked first. If
+        they do not match, but the digest of the contents is given, the
+        file is still considered unchanged if the digest matches.
+        """
+        with self.lock:
+            if self.records is None:
+                self.load()
+
+            rec = self.records.get(path)
+            if not rec:
+                return None
+
+            try:
+                st = os.stat(path)
+            except OSError:
+                return None
+
+            if rec['size'] != st.st_size:
+                return None
+            if rec['mtime'] != st.st_mtime:
+                if rec['digest'] != digest:
+                    return None
+                rec['mtime'] = st.st_mtime
+                self.dirty = True
+
+            # The time of use is only written to disk together with other
+            # changes, rewriting the cache for every hit would be too costly.
+            rec['used'] = time.time()
+            return ([copy.copy(b) for b in rec['entries']], rec['strings'])
+
+    def put(self, path, digest, entries, strings):
+        with self.lock:
+            if self.records is None:
+                self.load()
+
+            try:
+                st = os.stat(path)
+            except OSError:
+                return
+
+            self.records[path] = {
+                'size': st.st_size,
+                'mtime': st.st_mtime,
+                'digest': digest,
+                'used': time.time(),
+                'entries': [copy.copy(b) for b in entries],
+                'strings': strings,
+            }
+            self.dirty = True
+
+    def evict(self):
+        total = 0
+        for path, rec in sorted(items(self.records),
+                                key=lambda x: x[1]['used'], reverse=True):
+            total += rec['size']
+            if total > self.maxsize:
+                del self.records[path]
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+
+            self.evict()
+
+            # Write to a temporary file first, such that an interrupted write
+            # does not leave a corrupt cache behind.
+            tmpname = '%s.%d' % (self.filename, os.getpid())
+            try:
+                if not os.path.isdir(os.path.dirname(self.filename)):
+                    os.makedirs(os.path.dirname(self.filename))
+                fp = open(tmpname, 'wb')
+                try:
+                    pickle.dump({'version': self.version, 'records': self.records},
+                                fp, pickle.HIGHEST_PROTOCOL)
+                finally:
+                    fp.close()
+                getattr(os, 'replace', os.rename)(tmpname, self.filename)
+            except (IOError, OSError):
+                return
+
+            self.dirty = False
+
+
+_caches = {}
+
+
+def getcache(filename='', maxsize=64):
+    """ returns the BibCache for filename, maxsize is given in MB
+
+    The caches are kept around, such that they need to be read from disk
+    only once per session.
+    """
+    if filename not in _caches:
+        _caches[filename] = BibCache(filename)
+    _caches[filename].maxsize = maxsize * 1024 * 1024
+    return _caches[filename]
+
+
+# Markup which is removed or replaced for sorting
+_sortaccent_re = re.compile(r'\\(?:[\'"`^~=.]|[uvHckbdrt](?![a-zA-Z]))\s*')
+_sortletter_re = re.compile(r'\\(ss|ae|AE|oe|OE|aa|AA|o|O|l|L|i|j)(?![a-zA-Z])\s*')
+_sortletters = {'ss': 'ss', 'ae': 'ae', 'AE': 'AE', 'oe': 'oe', 'OE': 'OE',
+                'aa': 'a', 'AA': 'A', 'o': 'o', 'O': 'O', 'l': 'l', 'L': 'L',
+                'i': 'i', 'j': 'j'}
+_sortcommand_re = re.compile(r'\\[a-zA-Z]+\*?\s*')
+_sortescape_re = re.compile(r'\\([^a-zA-Z])')
+_sortyear_re = re.compile(r'\d+')
+
+
+def sortkey(value, field=''):
+    """ returns the key by which a field value is sorted
+
+    LaTeX markup is removed, accents are dropped (both LaTeX accents and
+    accented unicode characters) and the case is folded. Years are compared
+    numerically.
+    """
+    value = _sortaccent_re.sub('', value)
+    value = _sortletter_re.sub(lambda m: _sortletters[m.group(1)], value)
+    value = _sortcommand_re.sub('', value)
+    value = _sortescape_re.sub(r'\1', value)
+    value = value.replace('~', ' ').replace('{', '').replace('}', '').replace('$', '')
+    value = unicodedata.normalize('NFKD', value)
+    value = ''.join([c for c in value if not unicodedata.combining(c)])
+    value = ' '.join(value.split())
+    try:
+        value = value.casefold()
+    except AttributeError:
+        value = value.lower()
+
+    if field == 'year':
+        # Entries without a year come last.
+        m = _sortyear_re.search(value)
+        if m:
+            return (0, int(m.group(0)), value)
+        return (1, 0, value)
+
+    return value
+
+
+def readfile(path):
+    return urlopen('file://' + pathname2url(path)).read()
+
+
+def parse(content):
+    """ parses the contents of a bibtex file
+
+    Returns the list of entries (as BibEntry without macros) and the list
+    of the @string macros defined in the file as (name, parts) in the order
+    of their definition.
+    """
+    try:
+      content_str = content.decode('utf-8')
+    except UnicodeDecodeError:
+      content_str = content.decode('latin1')
+
+    entries = []
+    strings = []
+    for t in tokenize(content_str):
+        if t[0].lower() == 'string':
+            strings += [(name.lower(), tuple(parts))
+                        for (name, parts, start, end) in t[2]]
+        elif t[1] is not None:
+            entries.append(BibEntry(content_str, t))
+
+    return (entries, strings)
+
+
+def parsefile(path):
+    """ reads and parses a file, returns (digest, entries, strings)
+
+    This is run by the worker processes of BibFile.addfiles().
+    """
+    content = readfile(path)
+    return (hashlib.sha1(content).hexdigest(),) + parse(content)
+
+
 class BibFile:
 
-    def __init__(self, filelist=''):
+    def __init__(self, filelist='', cache=None, processes=0):
         self.bibentries = []
         self.filters = []
         self.macros = {}
         self.sortfields = []
+        self.cache = cache
+        self.index = None
+        self.matches = None
+        self.rendered = {}
+        self.orders = {}
         if filelist:
-            for f in filelist.splitlines():
-                self.addfile(f)
+            self.addfiles(filelist.splitlines(), processes)
 
     def addfile(self, file):
-        content = urlopen('file://' + pathname2url(os.path.abspath(file))).read()
+        self.addfiles([file])
 
-        try:
-          content_str = content.decode('utf-8')
-        except UnicodeDecodeError:
-          content_str = content.decode('latin1')
+    def addfiles(self, files, processes=0):
+        """ adds a list of bibtex files
 
-        fields = content_str.split('@')
-        for f in fields:
-            if not (f and re.match('string', f, re.I)):
-                continue
+        If processes > 1, the files which are not found in the cache are
+        parsed in parallel by that many worker processes. The files are
+        added in the given order in any case, such that the macros, the ids
+        and the file of the entries are the same as if the files were
+        added one after the other.
+        """
+        paths = [os.path.abspath(f) for f in files]
+
+        parsed = {}
+        if self.cache is not None:
+            for path in paths:
+                hit = self.cache.get(path)
+                if hit is not None:
+                    parsed[path] = hit
+
+        todo = []
+        for path in paths:
+            if path not in parsed and path not in todo:
+                todo.append(path)
+
+        if processes > 1 and len(todo) > 1 and os.name == 'posix':
+            # The workers are forked: In vim, sys.executable is not
+            # necessarily a python interpreter which could be spawned.
+            try:
+                ctx = multiprocessing.get_context('fork')
+            except AttributeError:
+                ctx = multiprocessing
+            pool = ctx.Pool(min(processes, len(todo)))
+            try:
+                results = pool.map(parsefile, todo)
+            finally:
+                pool.close()
+                pool.join()
+
+            for path, (digest, entries, strings) in zip(todo, results):
+                parsed[path] = (entries, strings)
+                if self.cache is not None:
+                    self.cache.put(path, digest, entries, strings)
+        else:
+            for path in todo:
+                content = readfile(path)
+                digest = hashlib.sha1(content).hexdigest()
+                if self.cache is not None:
+                    parsed[path] = self.cache.get(path, digest)
+                if parsed.get(path) is None:
+                    parsed[path] = parse(content)
+                    if self.cache is not None:
+                        self.cache.put(path, digest, *parsed[path])
+
+        merged = set()
+        for file, path in zip(files, paths):
+            (entries, strings) = parsed[path]
+            if path in merged:
+                entries = [copy.copy(b) for b in entries]
+            merged.add(path)
+            self.merge(file, entries, strings)
+
+        self.link()
+
+        if self.cache is not None:
+            self.cache.save()
+
+    def merge(self, file, entries, strings):
+        """ adds the parsed entries and macros of a file """
+        for name, parts in strings:
+            self.macros[name] = expand(parts, self.macros)
 
-            b = Bibliography('@' + f)
-            self.macros.update(b['macro'])
+        # The entries of a file only see the macros defined up to the end
+        # of the file.
+        macros = dict(self.macros)
+        for b in entries:
+            b.macros = macros
+            b['file'] = file
+            b['id'] = len(self.bibentries)
+            self.bibentries += [b]
 
-        for f in fields:
-            if not f or re.match('string', f, re.I):
+        self.index = None
+        self.orders = {}
+
+    def link(self):
+        """ resolves the crossref and xdata fields of all entries
+
+        Every entry gets the list of entries it inherits from: first the
+        entries given by xdata, then the crossref'd entry, each followed by
+        the entries these inherit from in turn.
+        """
+        # As bibtex, we use the first entry with a given key.
+        bykey = {}
+        for b in self.bibentries:
+            if b['key']:
+                bykey.setdefault(b['key'].lower(), b)
+
+        def direct(b):
+            keys = [k.strip().lower() for k in b.ownvalue('xdata').split(',')]
+            keys.append(b.ownvalue('crossref').strip().lower())
+            return [bykey[k] for k in keys if k in bykey]
+
+        for b in self.bibentries:
+            b.parents = None
+            if 'crossref' not in b.names and 'xdata' not in b.names:
                 continue
 
-            b = Bibliography('@' + f, self.macros)
-            if b:
-                b['file'] = file
-                b['id'] = len(self.bibentries)
-                self.bibentries += [b]
+            parents = []
+            todo = direct(b)
+            while todo:
+                p = todo.pop(0)
+                if p is not b and p not in parents:
+                    parents.append(p)
+                    todo += direct(p)
+            b.parents = tuple(parents)
+
+        self.rendered = {}
+        self.orders = {}
 
     def addfilter(self, filterspec):
-        self.filters += [filterspec.split()]
+        filt = filterspec.split(None, 1)
+        self.filters += [filt]
+        if len(filt) != 2:
+            return
+        (field, regexp) = filt
+
+        # The entries which satisfy all filters are narrowed down: The
+        # index gives the candidates and only these are matched against
+        # the regular expression.
+        if self.index is None:
+            self.index = BibIndex(sorted(self.bibentries, key=lambda b: b['id']))
+        entries = self.index.entries
+
+        if self.matches is None:
+            survivors = range(len(entries))
+        else:
+            survivors = self.matches
+        candidates = self.index.lookup(field, regexp)
+        if candidates is not None:
+            survivors = candidates.intersection(survivors)
+
+        self.matches = set([i for i in survivors
+                            if re.search(regexp, entries[i][field], re.I)])
 
     def rmfilters(self):
         self.filters = []
+        self.matches = None
 
-    def __str__(self):
-        s = ''
+    def reset(self):
+        """ removes all filters and sort fields and restores the file order """
+        self.rmfilters()
+        self.rmsortfields()
+        self.bibentries.sort(key=lambda b: b['id'])
+
+    def render(self):
+        """ yields the formatted text of all entries satisfying the filters
+
+        The entries are formatted only when they are needed and the text is
+        remembered for the next time.
+        """
         for b in self.bibentries:
-            if b['key'] and b.satisfies(self.filters):
-                s += '%s\n\n' % b
-        return s
+            if b['key'] and (self.matches is None or b['id'] in self.matches):
+                try:
+                    yield self.rendered[b['id']]
+                except KeyError:
+                    txt = self.rendered[b['id']] = str(b)
+                    yield txt
+
+    def pages(self, size):
+        """ yields the lines of __str__() in pages of at least size lines
+
+        Every page ends after a complete entry.
+        """
+        page = []
+        for txt in self.render():
+            page += txt.splitlines() + ['']
+            if len(page) >= size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def __str__(self):
+        return ''.join(['%s\n\n' % txt for txt in self.render()])
 
     def addsortfield(self, field):
         self.sortfields += [field]
@@ -237,11 +1009,146 @@ class BibFile:
     def rmsortfields(self):
         self.sortfields = []
 
+    def getorder(self, field):
+        """ returns the ids of the entries sorted by a field and their ranks
+
+        The ranks are the positions of the entries in this order, where
+        entries with equal sort keys get the same rank. Both are computed
+        once per field.
+        """
+        if field not in self.orders:
+            byid = [None] * len(self.bibentries)
+            for b in self.bibentries:
+                byid[b['id']] = b
+            keys = [sortkey(b[field], field) for b in byid]
+
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+            ranks = [0] * len(keys)
+            rank = 0
+            for n, i in enumerate(order):
+                if n and keys[i] != keys[order[n - 1]]:
+                    rank = n
+                ranks[i] = rank
+
+            self.orders[field] = (order, ranks)
+        return self.orders[field]
+
     def sort(self):
-        self.bibentries.sort(key=lambda x:[x[field] for field in self.sortfields])
+        if not self.sortfields:
+            return
+
+        if len(self.sortfields) == 1:
+            byid = [None] * len(self.bibentries)
+            for b in self.bibentries:
+                byid[b['id']] = b
+            self.bibentries = [byid[i] for i in self.getorder(self.sortfields[0])[0]]
+        else:
+            ranks = [self.getorder(field)[1] for field in self.sortfields]
+            self.bibentries.sort(key=lambda b: [r[b['id']] for r in ranks])
+
+
+def memorybenchmark(filename):
+    """ compares the memory used by Bibliography and BibEntry for a file
+
+    Returns a summary and a list of the failures: BibEntry must format each
+    entry as Bibliography does.
+    """
+    import tracemalloc
+
+    raw = open(filename, 'rb').read()
+    try:
+        content = raw.decode('utf-8')
+    except UnicodeDecodeError:
+        content = raw.decode('latin1')
+    del raw
+    tokens = list(tokenize(content))
+
+    lines = ['contents of %s: %.1f MB' % (filename, len(content) / 1048576.0)]
+    formatted = {}
+    for cls in (Bibliography, BibEntry):
+        tracemalloc.start()
+        if cls is BibEntry:
+            entries = [BibEntry(content, t) for t in tokens if t[1] is not None]
+        else:
+            entries = [cls(content, {}, t) for t in tokens if t[1] is not None]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        lines.append('%-12s %8d entries %8.1f MB' % (cls.__name__, len(entries),
+                                                    size / 1048576.0))
+        formatted[cls] = [str(entry) for entry in entries]
+        del entries
+
+    failures = ['entry %d: %r instead of %r' % (i, entry, wanted)
+                for (i, (entry, wanted)) in enumerate(
+                    zip(formatted[BibEntry], formatted[Bibliography]))
+                if entry != wanted]
+    return ('\n'.join(lines), failures)
+
+
+def parallelcheck(processes=4, count=200):
+    """ compares BibFile.addfiles() in worker processes with the serial
+    path, returns a list of the differences
+
+    The files redefine each other's macros, inherit across files with
+    crossref, and one of them is given twice.
+    """
+    import shutil
+    import tempfile
+
+    sources = {
+        'a.bib': ('@string{jan = "January"}\n@string{pub = "Publisher A"}\n',
+                  '@article{a%d, title = {Title %d}, month = jan,\n'
+                  '  publisher = pub, crossref = {c%d}}\n'),
+        'b.bib': ('@string{pub = "Publisher B"}\n@string{jan = "Jan."}\n',
+                  '@book{b%d, title = "Book " # pub # " %d",\n'
+                  '  month = jan, note = {b%d}}\n'),
+        'c.bib': ('@string{ed = pub # " Press"}\n',
+                  '@collection{c%d, booktitle = {Collection %d},\n'
+                  '  editor = ed, year = 20%02d}\n'),
+    }
+
+    def describe(bf):
+        entries = [(b['id'], b['file'], b['bibtype'], b['key'],
+                    b['bodytext'], b['booktitle'],
+                    [p['key'] for p in b.parents or ()])
+                   for b in bf.bibentries]
+        return (sorted(bf.macros.items()), entries, str(bf))
+
+    root = tempfile.mkdtemp()
+    try:
+        for (name, (head, entry)) in sources.items():
+            with open(os.path.join(root, name), 'w') as fp:
+                fp.write(head)
+                for i in range(count):
+                    fp.write(entry % (i, i, i % 100))
+        files = [os.path.join(root, name)
+                 for name in ('a.bib', 'b.bib', 'c.bib', 'a.bib')]
+        serial = describe(BibFile('\n'.join(files)))
+        parallel = describe(BibFile('\n'.join(files), processes=processes))
+    finally:
+        shutil.rmtree(root)
+
+    differences = []
+    for (what, s, p) in zip(('macros', 'entries', 'output'), serial, parallel):
+        if s != p:
+            differences.append('%s differ' % what)
+    if len(serial[1]) != 4 * count:
+        differences.append('%d entries instead of %d' % (len(serial[1]), 4 * count))
+    return differences
+
 
 if __name__ == "__main__":
     import sys
 
-    bf = BibFile(sys.argv[1])
-    print(bf)
+    if len(sys.argv) > 2 and sys.argv[1] == '--memory':
+        import texbackend
+
+        (summary, failures) = memorybenchmark(sys.argv[2])
+        texbackend.exitChecks(failures, summary)
+    elif len(sys.argv) > 1 and sys.argv[1] == '--parallel-check':
+        import texbackend
+
+        texbackend.exitChecks(parallelcheck())
+    else:
+        bf = BibFile(sys.argv[1])
+        print(bf)
@@ -162,6 +162,10 @@ endfunction " }}}
 function! Tex_RunLaTeX()
 	call Tex_Debug('+Tex_RunLaTeX, b:fragmentFile = '.exists('b:fragmentFile'), 'comp')
 
+	if Tex_GetVarValue('Tex_AsyncCompile') && Tex_UsePython() && has('timers')
+		return Tex_RunLaTeXAsync()
+	endif
+
 	let dir = expand("%:p:h").'/'
 	let l:origdir = fnameescape(getcwd())
 	call Tex_CD(expand("%:p:h"))
@@ -218,6 +222,140 @@ function! Tex_RunLaTeX()
 	call Tex_Debug("-Tex_RunLaTeX", "comp")
 endfunction
 
+" }}}
+" Tex_RunLaTeXAsync: compiles the file in the background {{{
+" Description: runs the same chain of commands as Tex_RunLaTeX() in a python
+" thread (see texbuild.py) and returns immediately. Tex_PollBuilds() shows
+" the progress of the build and fills the quickfix list when it is finished.
+" A build of the same file which is still running is cancelled.
+function! Tex_RunLaTeXAsync()
+	if exists('b:fragmentFile')
+		let mainfname = expand('%:p')
+	else
+		let mainfname = Tex_GetMainFileName(':p')
+	endif
+	let maindir = fnamemodify(mainfname, ':h')
+
+	if Tex_GetVarValue('Tex_FormatDependency_'.s:target) != ''
+		let dependency = Tex_GetVarValue('Tex_FormatDependency_'.s:target)
+		if dependency !~ ','.s:target.'$'
+			let dependency = dependency.','.s:target
+		endif
+	else
+		let dependency = s:target
+	endif
+	call Tex_Debug('Tex_RunLaTeXAsync: getting dependency chain = ['.dependency.']', 'comp')
+
+	let useMakefile = Tex_GetVarValue('Tex_UseMakefile')
+		\ && (filereadable(maindir.'/makefile') || filereadable(maindir.'/Makefile'))
+
+	" Every step is the rule of a target, the name of the file it compiles
+	" and whether it is compiled multiple times, see Tex_CompileLatex().
+	let steps = []
+	for target in split(dependency, ',')
+		if useMakefile
+			let rule = 'make "'.target.'"'
+			let name = ''
+		else
+			let rule = Tex_GetVarValue('Tex_CompileRule_'.target)
+			if rule == ''
+				echomsg 'No compile rule defined for target '.target
+				return
+			endif
+			let name = fnamemodify(mainfname, rule =~ '\$\*\.\w\+' ? ':t:r' : ':t')
+		endif
+		call add(steps, [rule, name, Tex_GetVarValue('Tex_MultipleCompileFormats') =~ '\<'.target.'\>'])
+	endfor
+
+	let build = {'mainfile': mainfname, 'steps': steps,
+		\ 'bibtex': Tex_GetVarValue('Tex_BibtexFlavor'),
+		\ 'makeindex': Tex_GetVarValue('Tex_MakeIndexFlavor')}
+	call Tex_Debug('Tex_RunLaTeXAsync: starting build ['.string(build).']', 'comp')
+	exec g:Tex_PythonCmd . ' texbuild.startVimBuild(vim.eval("build"))'
+
+	" The errors are parsed with the 'efm' of this buffer.
+	let s:buildBuffers[mainfname] = bufnr('%')
+	if !exists('s:buildTimer')
+		let s:buildTimer = timer_start(200, 'Tex_PollBuilds', {'repeat': -1})
+	endif
+	echomsg 'Compiling '.fnamemodify(mainfname, ':t').' in the background...'
+endfunction
+
+let s:buildBuffers = {}
+
+" }}}
+" Tex_PollBuilds: shows the progress of background builds {{{
+" Description: called by a timer while builds are running.
+function! Tex_PollBuilds(timer)
+	exec g:Tex_PythonCmd . ' texbuild.setBuildStatus()'
+
+	for message in retval.messages
+		echomsg message
+	endfor
+	for build in retval.finished
+		call Tex_FinishBuild(build)
+	endfor
+
+	if retval.running == 0
+		call timer_stop(a:timer)
+		unlet! s:buildTimer
+	endif
+endfunction
+
+" }}}
+" Tex_FinishBuild: fills the quickfix list after a background build {{{
+" Description: reads the .log file of the build into the quickfix list. The
+" error window is only opened if the main file is edited in the current
+" window and vim is in normal mode, so as not to interrupt typing.
+function! Tex_FinishBuild(build)
+	call Tex_Debug('Tex_FinishBuild: '.a:build.mainfile.' is '.a:build.status, 'comp')
+	let bufnum = get(s:buildBuffers, a:build.mainfile, -1)
+	if has_key(s:buildBuffers, a:build.mainfile)
+		unlet s:buildBuffers[a:build.mainfile]
+	endif
+	if a:build.status == 'cancelled'
+		return
+	endif
+
+	let l:origdir = fnameescape(getcwd())
+	call Tex_CD(fnamemodify(a:build.mainfile, ':h'))
+
+	let origefm = &l:efm
+	if bufnum != bufnr('%') && getbufvar(bufnum, '&efm') != ''
+		let &l:efm = getbufvar(bufnum, '&efm')
+	endif
+	call Tex_ReadLogFile(fnamemodify(a:build.mainfile, ':t:r').'.log')
+	let &l:efm = origefm
+
+	if a:build.status == 'error'
+		echomsg 'There were errors compiling '.fnamemodify(a:build.mainfile, ':t')
+	endif
+	if &ft == 'tex' && mode() ==# 'n' && bufnum == bufnr('%')
+		let s:origwinnum = winnr()
+		call Tex_SetupErrorWindow()
+	endif
+
+	exe 'cd '.l:origdir
+endfunction
+
+" }}}
+" Tex_RestartBuild: starts a background build again {{{
+" Description: a build which is running when a file of the document is
+" written compiles an outdated version of it, so it is cancelled and started
+" again.
+function! Tex_RestartBuild()
+	if !exists('s:buildTimer') || &ft != 'tex'
+		return
+	endif
+	if exists('b:fragmentFile')
+		let mainfname = expand('%:p')
+	else
+		let mainfname = Tex_GetMainFileName(':p')
+	endif
+	call Tex_Debug('Tex_RestartBuild: restarting a running build of '.mainfname, 'comp')
+	exec g:Tex_PythonCmd . ' texbuild.restartBuild(r"""' . mainfname . '""")'
+endfunction
+
 " }}}
 " Tex_ViewLaTeX: opens viewer {{{
 " Description: opens the DVI viewer for the file being currently edited.
@@ -576,14 +714,17 @@ function! Tex_CompileMultipleTimes()
 	let idxFileName = mainFileName_root.'.idx'
 	let auxFileName = mainFileName_root.'.aux'
 
+	" The files are compared by their digests. The digests after one run are
+	" the ones before the next run.
+	let idxDigestsBefore = Tex_FileDigests(idxFileName, 0)
+	let auxDigestsBefore = Tex_FileDigests(auxFileName, 1)
+
 	let runCount = 0
 	let needToRerun = 1
 	while needToRerun == 1 && runCount < 5
 		" assume we need to run only once.
 		let needToRerun = 0
-
-		let idxlinesBefore = Tex_CatFile(idxFileName)
-		let auxlinesBefore = Tex_GetAuxFile(auxFileName)
+		let rerunReasons = []
 
 		" first run latex.
 		echomsg "latex run number : ".(runCount+1)
@@ -603,17 +744,18 @@ function! Tex_CompileMultipleTimes()
 			return
 		endif
 
-		let idxlinesAfter = Tex_CatFile(idxFileName)
+		let idxDigestsAfter = Tex_FileDigests(idxFileName, 0)
 
 		" If .idx file changed, then run makeindex to generate the new .ind
 		" file and remember to rerun latex.
-		if runCount == 0 && glob(idxFileName) != '' && idxlinesBefore != idxlinesAfter
+		if runCount == 0 && glob(idxFileName) != '' && idxDigestsBefore != idxDigestsAfter
 			echomsg "Running makeindex..."
 			let temp_mp = &mp | let &mp = Tex_GetVarValue('Tex_MakeIndexFlavor')
 			exec 'silent! make "'.mainFileName_root.'"'
 			let &mp = temp_mp
 
 			let needToRerun = 1
+			call add(rerunReasons, 'the index changed')
 		endif
 
 		" The first time we see if we need to generate the bibliography and if the .bbl file
@@ -622,32 +764,39 @@ function! Tex_CompileMultipleTimes()
 		if runCount == 0 && Tex_IsPresentInFile('\\bibdata|\\abx', mainFileName_root.'.aux')
 			let bibFileName = mainFileName_root.'.bbl'
 
-			let biblinesBefore = Tex_CatFile(bibFileName)
+			let bibDigestsBefore = Tex_FileDigests(bibFileName, 0)
 
 			echomsg "Running '".Tex_GetVarValue('Tex_BibtexFlavor')."' ..."
 			let temp_mp = &mp | let &mp = Tex_GetVarValue('Tex_BibtexFlavor')
 			exec 'silent! make "'.mainFileName_root.'"'
 			let &mp = temp_mp
 
-			let biblinesAfter = Tex_CatFile(bibFileName)
+			let bibDigestsAfter = Tex_FileDigests(bibFileName, 0)
 
 			" If the .bbl file changed after running bibtex, we need to
 			" latex again.
-			if biblinesAfter != biblinesBefore
+			if bibDigestsAfter != bibDigestsBefore
 				echomsg 'Need to rerun because bibliography file changed...'
-				call Tex_Debug('Tex_CompileMultipleTimes: Need to rerun because bibliography file changed...', 'comp')
 				let needToRerun = 1
+				call add(rerunReasons, bibFileName.' changed')
 			endif
 		endif
 
 		" check if latex asks us to rerun
-		let auxlinesAfter = Tex_GetAuxFile(auxFileName)
-		if auxlinesAfter != auxlinesBefore
+		let auxDigestsAfter = Tex_FileDigests(auxFileName, 1)
+		let changedAuxFiles = Tex_ChangedFiles(auxDigestsBefore, auxDigestsAfter)
+		if !empty(changedAuxFiles)
 			echomsg "Need to rerun because the AUX file changed..."
-			call Tex_Debug("Tex_CompileMultipleTimes: Need to rerun to get cross-references right...", 'comp')
 			let needToRerun = 1
+			call add(rerunReasons, 'to get cross-references right, changed: '.join(changedAuxFiles, ', '))
+		endif
+
+		if needToRerun
+			call Tex_Debug("Tex_CompileMultipleTimes: Need to rerun after run ".(runCount+1)." because ".join(rerunReasons, '; '), 'comp')
 		endif
 
+		let idxDigestsBefore = idxDigestsAfter
+		let auxDigestsBefore = auxDigestsAfter
 		let runCount = runCount + 1
 	endwhile
 
@@ -660,14 +809,80 @@ function! Tex_CompileMultipleTimes()
 	" After all compiler calls are done, reparse the .log file for
 	" errors/warnings to handle the situation where the clist might have been
 	" emptied because of bibtex/makeindex being run as the last step.
+	call Tex_ReadLogFile(mainFileName_root.'.log')
 	if Tex_GetVarValue('Tex_GotoError') == 1
-		exec 'silent! cfile '.mainFileName_root.'.log'
-	else
-		exec 'silent! cgetfile '.mainFileName_root.'.log'
+		silent! cfirst
 	end
 
 	exe 'cd '.l:origdir
 endfunction " }}}
+" Tex_FileDigests: get digests of a file and the AUX files it includes {{{
+" Description: returns a dictionary from the file names to their digests. If
+" a:aux is 1, the file is an AUX file and the @\input'ted AUX files are
+" included, ignoring lines which do not depend on the latex run. Without
+" python, the contents of the file are used as digest.
+if Tex_UsePython()
+	function! Tex_FileDigests(filename, aux)
+		exec g:Tex_PythonCmd . ' texbuild.setFileDigests(r"'.a:filename.'", '.a:aux.')'
+
+		return retval
+	endfunction
+else
+	function! Tex_FileDigests(filename, aux)
+		if a:aux
+			return {a:filename : Tex_GetAuxFile(a:filename)}
+		endif
+		return {a:filename : Tex_CatFile(a:filename)}
+	endfunction
+endif " }}}
+" Tex_ChangedFiles: get the files whose digests differ {{{
+" Description: returns the list of files which are in only one of the
+" dictionaries a:before and a:after, or have different digests in them.
+function! Tex_ChangedFiles(before, after)
+	let changed = []
+	for fname in keys(a:after)
+		if !has_key(a:before, fname) || a:before[fname] !=# a:after[fname]
+			call add(changed, fname)
+		endif
+	endfor
+	for fname in keys(a:before)
+		if !has_key(a:after, fname)
+			call add(changed, fname)
+		endif
+	endfor
+	return sort(changed)
+endfunction " }}}
+" Tex_ReadLogFile: fills the quickfix list from a .log file {{{
+" Description: with python, the messages are read by texlog.py, which keeps
+" track of the files latex opened, otherwise by :cgetfile with the 'efm' of
+" compiler/tex.vim. The 'efm' is also used when all lines of the log are
+" shown, see :TCLevel strict.
+if Tex_UsePython()
+	function! Tex_ReadLogFile(logfile)
+		if !Tex_GetVarValue('Tex_UseLogParser') || Tex_GetVarValue('Tex_ShowallLines')
+					\ || !Tex_GetVarValue('Tex_IgnoreUnmatched', 1)
+			exec 'silent! cgetfile '.fnameescape(a:logfile)
+			return
+		endif
+
+		let ignored = Tex_GetIgnoredWarnings()
+		exec g:Tex_PythonCmd . ' texlog.setLogQuickfix(r"""' . a:logfile . '""", vim.eval("ignored"))'
+	endfunction
+else
+	function! Tex_ReadLogFile(logfile)
+		exec 'silent! cgetfile '.fnameescape(a:logfile)
+	endfunction
+endif " }}}
+" Tex_GetIgnoredWarnings: get the patterns of ignored warnings {{{
+" Description: returns the first g:Tex_IgnoreLevel patterns of
+" g:Tex_IgnoredWarnings, the ones compiler/tex.vim adds to the 'efm'.
+function! Tex_GetIgnoredWarnings()
+	let level = Tex_GetVarValue('Tex_IgnoreLevel')
+	if level <= 0
+		return []
+	endif
+	return split(Tex_GetVarValue('Tex_IgnoredWarnings'), "\n")[: level - 1]
+endfunction " }}}
 " Tex_GetAuxFile: get the contents of the AUX file {{{
 " Description: get the contents of the AUX file recursively including any
 " @\input'ted AUX files.
@@ -922,6 +1137,7 @@ augroup LatexSuite
 	au LatexSuite User LatexSuiteFileType
 		\ call Tex_Debug('compiler.vim: Catching LatexSuiteFileType event', 'comp') |
 		\ call <SID>Tex_SetCompilerMaps()
+	au LatexSuite BufWritePost * call Tex_RestartBuild()
 augroup END
 
 command! -nargs=0 -range=% TPartCompile :<line1>, <line2> silent! call Tex_PartCompile()
@@ -136,6 +136,16 @@ function! MakeTexFolds(force, manual)
 								\. 'subsection,subsubsection,paragraph'
 	endif
 
+	" The folds of the items below can also be found in python, which only
+	" looks at the lines which changed since the last time.
+	if Tex_UsePython() && Tex_GetVarValue('Tex_PythonFolding')
+		call Tex_MakePythonFolds(a:force)
+		if !a:manual && !g:Tex_AutoFolding
+			normal! zR
+		endif
+		return
+	endif
+
 	" the order in which these calls are made decides the nestedness. in
 	" latex, a table environment will always be embedded in either an item or
 	" a section etc. not the other way around. so we first fold up all the
@@ -362,6 +372,40 @@ function! MakeTexFolds(force, manual)
 	endif
 endfunction
 
+" }}}
+" Tex_MakePythonFolds: creates the folds of MakeTexFolds() in python {{{
+" Description: Does what MakeSyntaxFolds() does with the fold items of
+"     MakeTexFolds(), see texfolds.py.
+function! Tex_MakePythonFolds(force)
+	if exists('b:doneFolding') && a:force == 0
+		return
+	end
+	let start = reltime()
+
+	" Save cursor position
+	if exists('*getcurpos')
+		let curpos = getcurpos()
+	else
+		let curpos = getpos('.')
+	endif
+
+	setlocal fdm=manual
+	normal! zE
+
+	exec g:Tex_PythonCmd . ' texfolds.makeFolds()'
+
+	" Close all folds.
+	normal! zM
+
+	call setpos('.', curpos)
+	if foldlevel(curpos[1]) > 1
+		exe "normal! ".(foldlevel(curpos[1]) - 1)."zo"
+	end
+	let b:doneFolding = 0
+
+	call Tex_Debug('Finished folding in python in ' . reltimestr(reltime(start)) . ' seconds.', 'SyntaxFolds')
+endfunction
+
 " }}}
 " TexFoldTextFunction: create fold text for folds {{{
 function! TexFoldTextFunction()
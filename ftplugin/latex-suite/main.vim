@@ -950,6 +950,29 @@ function! Tex_UsePython()
 	return g:Tex_HasPython && Tex_GetVarValue('Tex_UsePython')
 endfunction
 " }}}
+" Python helpers: loaded by texbackend.py on first use {{{
+" Description: The helper modules are global names of python, each a
+" stand-in which imports the module when it is first used. texbackend.py
+" records the time taken by the imports and the calls, see :TexPyStats.
+if Tex_UsePython()
+	exec g:Tex_PythonCmd . " import sys, vim"
+	exec g:Tex_PythonCmd . " sys.path += [r'" . s:path . "']"
+	exec g:Tex_PythonCmd . " import texbackend"
+	exec g:Tex_PythonCmd . " from texbackend import auxoutline, bibtools, pytools, texbuild,"
+		\ . " texfolds, texindex, texlog, texpackages, texscan, vimbridge"
+endif
+" }}}
+" Tex_PyStats: echoes the import times and call latencies of the helpers {{{
+function! Tex_PyStats()
+	if !Tex_UsePython()
+		echo 'Latex-Suite does not use python, see g:Tex_UsePython'
+		return
+	endif
+	exec g:Tex_PythonCmd . ' vimbridge.setVar("retval", texbackend.report())'
+	echo join(retval, "\n")
+endfunction
+com! -nargs=0 TexPyStats :call Tex_PyStats()
+" }}}
 
 " source texproject.vim before other files
 exe 'source '.fnameescape(s:path.'/texproject.vim')
@@ -1089,7 +1112,7 @@ endfunction " }}}
 " Tex_IsPresentInFile: finds if a regexp, is present in filename {{{
 if Tex_UsePython()
 	function! Tex_IsPresentInFile(regexp, filename)
-		exec g:Tex_PythonCmd . ' isPresentInFile(r"'.a:regexp.'", r"'.a:filename.'")'
+		exec g:Tex_PythonCmd . ' pytools.isPresentInFile(r"'.a:regexp.'", r"'.a:filename.'")'
 
 		return retval
 	endfunction
@@ -1127,7 +1150,7 @@ if exists('*readfile')
 elseif Tex_UsePython()
 	function! Tex_CatFile(filename)
 		" catFile assigns a value to retval
-		exec g:Tex_PythonCmd . ' catFile(r"'.a:filename.'")'
+		exec g:Tex_PythonCmd . ' pytools.catFile(r"'.a:filename.'")'
 
 		return retval
 	endfunction
@@ -1163,7 +1186,7 @@ endif
 " Description: 
 if Tex_UsePython()
 	function! Tex_DeleteFile(filename)
-		exec g:Tex_PythonCmd . ' deleteFile(r"'.a:filename.'")'
+		exec g:Tex_PythonCmd . ' pytools.deleteFile(r"'.a:filename.'")'
 		
 		if exists('retval')
 			return retval
@@ -1181,9 +1204,4 @@ endif
 
 let &cpo = s:save_cpo
 
-" Define the functions in python if available.
-if Tex_UsePython()
-	exec g:Tex_PythonFileCmd . ' ' . fnameescape(expand('<sfile>:p:h')).'/pytools.py'
-endif
-
 " vim:fdm=marker:ff=unix:noet:ts=4:sw=4:nowrap
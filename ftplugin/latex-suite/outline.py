@@ -9,174 +9,473 @@
 import re
 import os
 import sys
-if sys.version_info <= (3, 0):
-    from StringIO import StringIO
-else:
-    from io import StringIO
+import array
 
+import texdeps
 
-def getFileContents(fname):
-    if type(fname) is not str:
-        fname = fname.group(3)
 
-    # If neither the file or file.tex exists, then we just give up.
-    if not os.path.isfile(fname):
-        if os.path.isfile(fname + '.tex'):
-            fname += '.tex'
+class LineTable(object):
+    """ the lines of a document and the file and line number of every line
+
+    The name of the file of every line is kept as an index into files, the
+    line numbers in an array and the text of all lines in a single string,
+    separated by newlines.
+    """
+    __slots__ = ('files', 'fileids', 'linenos', 'text')
+
+    def __init__(self, fname=None, linenos=(), lines=()):
+        if fname is None or not linenos:
+            self.files = []
+            self.fileids = array.array('I')
         else:
-            return ''
+            self.files = [fname]
+            self.fileids = array.array('I', [0]) * len(linenos)
+        self.linenos = array.array('L', linenos)
+        self.text = '\n'.join(lines)
+
+    def __len__(self):
+        return len(self.linenos)
+
+    def __iter__(self):
+        """ yields (fname, lineno, text) for every line """
+        if not self.linenos:
+            return iter(())
+        files = self.files
+        return ((files[i], n, line) for (i, n, line) in
+                zip(self.fileids, self.linenos, self.text.split('\n')))
+
+    @staticmethod
+    def concat(tables):
+        """ returns a table of the lines of all tables in order """
+        result = LineTable()
+        fileindex = {}
+        texts = []
+        for table in tables:
+            if not table.linenos:
+                continue
+            ids = []
+            for fname in table.files:
+                if fname not in fileindex:
+                    fileindex[fname] = len(result.files)
+                    result.files.append(fname)
+                ids.append(fileindex[fname])
+            if len(ids) == 1:
+                result.fileids.extend(array.array('I', ids) * len(table))
+            else:
+                result.fileids.extend(array.array('I', [ids[i] for i in table.fileids]))
+            result.linenos.extend(table.linenos)
+            texts.append(table.text)
+        result.text = '\n'.join(texts)
+        return result
+
+
+# The processed contents of every file read by getLineTable() are kept
+# between calls in the python process hosted by vim. For every file, the
+# record holds its modification time and size, its contents split into
+# pieces of numbered lines and included files, and the line table of the
+# file with all included files expanded, together with the versions of all
+# files this table was built from.
+fileCache = {}
+cacheStats = {'hits': 0, 'misses': 0, 'reads': 0}
+_version = [0]
+
+includePattern = re.compile(r'^\s*\\(@?)(include|input){(.*?)}', re.M)
+commentPattern = re.compile(r'(?<!\\)%.*')
+
+
+def resolveFileName(fname, root=''):
+    """ returns fname or fname.tex, whichever exists in root, or None
+
+    The files are looked up in the directory listings of texdeps.resolver.
+    """
+    if texdeps.resolver.isfile(os.path.join(root, fname)):
+        return fname
+    if texdeps.resolver.isfile(os.path.join(root, fname + '.tex')):
+        return fname + '.tex'
+    return None
+
+
+def getFileRecord(path, name, checked):
+    """ returns the cache record of a file, reading it if it changed
+
+    checked is the set of files which were already checked during the
+    present call of getLineTable(). Returns None if the file does not
+    exist.
+    """
+    if path in checked:
+        return fileCache.get(path)
+    checked.add(path)
 
     try:
-        # This longish thing is to make sure that all files are converted into
-        # \n seperated lines.
-        contents = '\n'.join(open(fname).read().splitlines())
+        st = os.stat(path)
+    except OSError:
+        fileCache.pop(path, None)
+        return None
+
+    rec = fileCache.get(path)
+    if rec and rec['mtime'] == st.st_mtime and rec['size'] == st.st_size:
+        return rec
+
+    try:
+        contents = open(path).read()
     except IOError:
-        return ''
+        fileCache.pop(path, None)
+        return None
+    cacheStats['reads'] += 1
+
+    pieces = []
+    start = 0
+    lineno = 1
+    for m in includePattern.finditer(contents):
+        pieces.append(('text', numberLines(contents[start:m.start()], name, lineno)))
+        pieces.append(('include', m.group(3)))
+        lineno += contents.count('\n', start, m.end())
+        start = m.end()
+    pieces.append(('text', numberLines(contents[start:], name, lineno)))
+
+    _version[0] += 1
+    rec = {'mtime': st.st_mtime, 'size': st.st_size, 'version': _version[0],
+           'pieces': pieces, 'lines': None, 'deps': None, 'cwd': None}
+    fileCache[path] = rec
+    return rec
+
+
+def currentVersion(path, checked):
+    """ returns the version of the cached file, -1 if it changed since
+
+    Returns None if the file does not exist.
+    """
+    if path not in checked:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        rec = fileCache.get(path)
+        if not rec or rec['mtime'] != st.st_mtime or rec['size'] != st.st_size:
+            return -1
+        checked.add(path)
+
+    rec = fileCache.get(path)
+    return rec and rec['version']
+
+
+def numberLines(contents, fname, lineno=1):
+    """ returns a LineTable of the lines of contents
+
+    The first line of contents is line lineno of the file. Comments and
+    lines containing only white-space are removed.
+    """
+    linenos = []
+    lines = []
+    for line in contents.split('\n'):
+        line = commentPattern.sub('', line.rstrip('\r'))
+        if line.strip():
+            linenos.append(lineno)
+            lines.append(line)
+        lineno += 1
+    return LineTable(fname, linenos, lines)
+
+
+def getLineTable(fname, checked=None, stack=(), root=None):
+    """ returns the lines of a file and all files included in it
+
+    The lines are stripped of comments as done by stripComments() and
+    returned as a LineTable. Only files which changed since the last call
+    are read again, and the table of a file is only put together again if
+    the file or one of the files it includes changed.
+
+    Relative file names are looked up in the directory root, which is the
+    current directory by default.
+
+    Returns the table and a dictionary of the versions of all files used.
+    """
+    if checked is None:
+        checked = set()
+        texdeps.resolver.newGeneration()
+    if root is None:
+        root = os.getcwd()
+
+    # A missing file is a dependency as well: It might be created later.
+    deps = {}
+    name = resolveFileName(fname, root)
+    for candidate in (fname, fname + '.tex'):
+        deps[os.path.abspath(os.path.join(root, candidate))] = None
+        if candidate == name:
+            break
+    if name is None:
+        return (LineTable(), deps)
+
+    path = os.path.abspath(os.path.join(root, name))
+    if path in stack:
+        return (LineTable(), deps)
+
+    rec = getFileRecord(path, name, checked)
+    if rec is None:
+        return (LineTable(), deps)
+
+    if rec['lines'] is not None and rec['cwd'] == root:
+        for p, version in rec['deps'].items():
+            if currentVersion(p, checked) != version:
+                break
+        else:
+            cacheStats['hits'] += 1
+            return (rec['lines'], rec['deps'])
+    cacheStats['misses'] += 1
+
+    tables = []
+    deps[path] = rec['version']
+    for kind, value in rec['pieces']:
+        if kind == 'text':
+            tables.append(value)
+        else:
+            (childlines, childdeps) = getLineTable(value, checked,
+                                                   stack + (path,), root)
+            tables.append(childlines)
+            deps.update(childdeps)
+
+    lines = LineTable.concat(tables)
+    rec['lines'] = lines
+    rec['deps'] = deps
+    rec['cwd'] = root
+    return (lines, deps)
 
-    # TODO what are all the ways in which a tex file can include another?
-    pat = re.compile(r'^\s*\\(@?)(include|input){(.*?)}', re.M)
-    contents = re.sub(pat, getFileContents, contents)
 
-    return ('%%==== FILENAME: %s' % fname) + '\n' + contents
+def getCacheStats():
+    """ returns a summary of the file cache """
+    return 'files: %d, hits: %d, misses: %d, reads: %d' % (
+        len(fileCache), cacheStats['hits'], cacheStats['misses'],
+        cacheStats['reads'])
 
 
 def stripComments(contents):
-    # remove all comments except those of the form
-    # %%==== FILENAME: <filename.tex>
+    # remove all comments
     # BUG: This comment right after a new paragraph is not recognized:
     # foo\\%comment
-    uncomm = [re.sub('(?<!\\\\)%(?!==== FILENAME: ).*', '', line)
-              for line in contents.splitlines()]
+    uncomm = [commentPattern.sub('', line) for line in contents.splitlines()]
     # also remove all only-whitespace lines.
     nonempty = [line for line in uncomm if line.strip()]
 
     return nonempty
 
 
-def addFileNameAndNumber(lines):
-    filename = ''
-    retval = ''
-    for line in lines:
-        if re.match('%==== FILENAME: ', line):
-            filename = line.split('%==== FILENAME: ')[1]
-        else:
-            retval += '<%s>%s\n' % (filename, line)
+class LabelScanner(object):
+    """ finds the labels in a sequence of tagged lines
 
-    return retval
+    For every label, the text shown below it in the outline is collected from
+    the preceding line or from the surrounding environment. The state is kept
+    between calls of scan() and is reset at the start of every section.
+    """
+    def __init__(self, label_prefix=''):
+        self.labelPattern = re.compile(r'\\(?:nl)?label{(%s.*?)}' % label_prefix)
+        self.reset()
 
+    def reset(self):
+        self.prev_txt = ''
+        self.inside_env = 0
+        self.prev_env = ''
 
-def getSectionLabels_Root(lineinfo, section_prefix, label_prefix):
-    prev_txt = ''
-    inside_env = 0
-    prev_env = ''
-    outstr = StringIO('')
-    pres_depth = len(section_prefix)
-    indent = ' ' * (2*pres_depth + 2)
-
-    #print '+getSectionLabels_Root: lineinfo = [%s]' % lineinfo
-    for line in lineinfo.splitlines():
-        if not line:
-            continue
+    def scan(self, line):
+        """ returns (label, text) if the line contains a label, else None """
+        result = None
 
         # throw away leading white-space
-        m = re.search('<(.*?)>(.*)', line)
-
-        fname = m.group(1)
-        line = m.group(2).lstrip()
+        line = line.lstrip()
 
         # we found a label!
-        m = re.search(r'\\(?:nl)?label{(%s.*?)}' % label_prefix, line)
+        m = self.labelPattern.search(line)
         if m:
             # Get the corresponding label
             label = m.group(1)
 
             # add the current line (except the \label command) to the text
             # which will be displayed below this label
-            prev_txt += re.search(r'(^.*?)\\(?:nl)?label{', line).group(1)
+            self.prev_txt += labelTextPattern.search(line).group(1)
 
             # for the figure environment however, just display the caption.
             # instead of everything since the \begin command.
-            if prev_env == 'figure':
-                cm = re.search(r'\\caption(\[.*?\]\s*)?{(.*?)}', prev_txt)
+            if self.prev_env == 'figure':
+                cm = captionPattern.search(self.prev_txt)
                 if cm:
-                    prev_txt = cm.group(2)
+                    self.prev_txt = cm.group(2)
 
-            # print a nice formatted text entry like so
-            #
-            # >        eqn:label
-            # :          e^{i\pi} + 1 = 0
-            #
-            # Use the current "section depth" for the leading indentation.
-            outstr.write('>%s%s\t\t<%s>\n' % (indent, label, fname))
-            outstr.write(':%s  %s\n'       % (indent, prev_txt))
-
-            prev_txt = ''
+            result = (label, self.prev_txt)
+            self.prev_txt = ''
 
         # If we just encoutered the start or end of an environment or a
         # label, then do not remember this line.
         # NOTE: This assumes that there is no equation text on the same
         # line as the \begin or \end command. The text on the same line as
         # the \label was already handled.
-        if re.search(r'\\begin{(equation|align|figure)', line):
-            prev_txt = ''
-            prev_env = re.search(r'\\begin{(.*?)}', line).group(1)
-            inside_env = 1
+        if beginPattern.search(line):
+            self.prev_txt = ''
+            self.prev_env = envPattern.search(line).group(1)
+            self.inside_env = 1
 
-        elif re.search(r'\\(?:nl)?label', line):
-            prev_txt = ''
+        elif anyLabelPattern.search(line):
+            self.prev_txt = ''
 
-        elif re.search(r'\\end{(equation|align|figure)', line):
-            inside_env = 0
-            prev_env = ''
+        elif endPattern.search(line):
+            self.inside_env = 0
+            self.prev_env = ''
 
         else:
             # If we are inside an environment, then the text displayed with
             # the label is the complete text within the environment,
             # otherwise its just the previous line.
-            if inside_env:
-                prev_txt += line
+            if self.inside_env:
+                self.prev_txt += line
             else:
-                prev_txt = line
+                self.prev_txt = line
 
-    return outstr.getvalue()
+        return result
 
 
-def getSectionLabels(lineinfo,
+labelTextPattern = re.compile(r'(^.*?)\\(?:nl)?label{')
+captionPattern = re.compile(r'\\caption(\[.*?\]\s*)?{(.*?)}')
+beginPattern = re.compile(r'\\begin{(equation|align|figure)')
+envPattern = re.compile(r'\\begin{(.*?)}')
+anyLabelPattern = re.compile(r'\\(?:nl)?label')
+endPattern = re.compile(r'\\end{(equation|align|figure)')
+
+
+class OutlineLabel(object):
+    __slots__ = ('name', 'text', 'fname', 'lineno')
+
+    def __init__(self, name, text, fname, lineno):
+        self.name = name
+        self.text = text
+        self.fname = fname
+        self.lineno = lineno
+
+
+class OutlineSection(object):
+    """ a node of the section tree built by buildSectionTree()
+
+    level is the index of the sectioning command in the list of section
+    types, or -1 for the root of the tree. children holds the sections and
+    labels in the order of the document. Labels are numbered relative to
+    childprefix.
+    """
+    __slots__ = ('level', 'number', 'name', 'prefix', 'childprefix',
+                 'fname', 'lineno', 'children')
+
+    def __init__(self, level, number, name, prefix, fname='', lineno=0):
+        self.level = level
+        self.number = number
+        self.name = name
+        self.prefix = prefix
+        if level < 0:
+            self.childprefix = prefix
+        else:
+            self.childprefix = prefix + '%d.' % number
+        self.fname = fname
+        self.lineno = lineno
+        self.children = []
+
+    def sections(self):
+        """ yields all sections below this one, depth first """
+        for child in self.children:
+            if isinstance(child, OutlineSection):
+                yield child
+                for sec in child.sections():
+                    yield sec
+
+    def labels(self):
+        """ yields (section, label) for all labels below this section """
+        for child in self.children:
+            if isinstance(child, OutlineSection):
+                for item in child.labels():
+                    yield item
+            else:
+                yield (self, child)
+
+    def render(self):
+        """ returns the outline text of this section
+
+        Sections without any labels are left out.
+        """
+        indent = ' ' * (2*len(self.childprefix) + 2)
+        out = []
+        for child in self.children:
+            if isinstance(child, OutlineSection):
+                out.append(child.render())
+            else:
+                # print a nice formatted text entry like so
+                #
+                # >        eqn:label
+                # :          e^{i\pi} + 1 = 0
+                #
+                # Use the current "section depth" for the leading indentation.
+                out.append('>%s%s\t\t<%s>\n' % (indent, child.name, child.fname))
+                out.append(':%s  %s\n' % (indent, child.text))
+        text = ''.join(out)
+
+        if text and self.level >= 0:
+            heading = 2 * ' ' * len(self.prefix) + self.prefix
+            heading += '%d. %s' % (self.number, self.name)
+            heading += '<<<%d\n' % (len(self.prefix) // 2 + 1)
+            text = heading + text
+        return text
+
+
+def buildSectionTree(lines,
                      sectypes=['chapter', 'section',
                                'subsection', 'subsubsection'],
                      section_prefix='', label_prefix=''):
+    """ returns the tree of sections and labels of a LineTable
+
+    The lines are read once, keeping the currently open section of every
+    level on a stack. A section is numbered within the enclosing section of
+    any higher level, so that a section which is not preceded by a section
+    of the next higher level is numbered as its child.
+    """
+    root = OutlineSection(-1, 0, '', section_prefix)
+    depth = len(sectypes)
+    # stack[d] is the section which holds the contents of level d, counts[d]
+    # the number of sections of type sectypes[d] seen in stack[d].
+    stack = [root] * (depth + 1)
+    counts = [0] * depth
+    scanner = LabelScanner(label_prefix)
+
+    if sectypes:
+        heading = re.compile(r'\\(%s){(.*?)}' % '|'.join(sectypes))
+        levels = dict((name, i) for (i, name) in enumerate(sectypes))
+    else:
+        heading = None
 
-    if not sectypes:
-        return getSectionLabels_Root(lineinfo, section_prefix, label_prefix)
-
-    ##print 'sectypes[0] = %s, section_prefix = [%s], lineinfo = [%s]' % (
-    ##        sectypes[0], section_prefix, lineinfo)
+    for (fname, lineno, line) in lines:
+        h = heading and heading.match(line)
+        if h:
+            level = levels[h.group(1)]
+            counts[level] += 1
+            for d in range(level + 1, depth):
+                counts[d] = 0
 
-    sections = re.split(r'(<.*?>\\%s{.*})' % sectypes[0], lineinfo)
+            sec = OutlineSection(level, counts[level], h.group(2),
+                                 stack[level].childprefix, fname, lineno)
+            stack[level].children.append(sec)
+            for d in range(level + 1, depth + 1):
+                stack[d] = sec
+            scanner.reset()
 
-    # there will 1+2n sections, the first containing the "preamble" and the
-    # others containing the child sections as paris of [section_name,
-    # section_text]
+        found = scanner.scan(line)
+        if found:
+            stack[depth].children.append(
+                OutlineLabel(found[0], found[1], fname, lineno))
 
-    rettext = getSectionLabels(
-        sections[0], sectypes[1:], section_prefix, label_prefix)
+    return root
 
-    for i in range(1, len(sections), 2):
-        sec_num = (i + 1) / 2
-        section_name = re.search(
-            r'\\%s{(.*?)}' % sectypes[0], sections[i]).group(1)
-        section_label_text = getSectionLabels(
-            sections[i] + sections[i + 1], sectypes[1:],
-            section_prefix + ('%d.' % sec_num), label_prefix)
 
-        if section_label_text:
-            sec_heading = 2 * ' ' * len(section_prefix) + section_prefix
-            sec_heading += '%d. %s' % (sec_num, section_name)
-            sec_heading += '<<<%d\n' % (len(section_prefix) / 2 + 1)
+def getSectionLabels_Root(lineinfo, section_prefix, label_prefix):
+    return buildSectionTree(lineinfo, [], section_prefix, label_prefix).render()
 
-            rettext += sec_heading + section_label_text
 
-    return rettext
+def getSectionLabels(lineinfo,
+                     sectypes=['chapter', 'section',
+                               'subsection', 'subsubsection'],
+                     section_prefix='', label_prefix=''):
+    return buildSectionTree(lineinfo, sectypes,
+                            section_prefix, label_prefix).render()
 
 
 def main(fname, label_prefix):
@@ -184,14 +483,80 @@ def main(fname, label_prefix):
     if head:
         os.chdir(head)
 
-    contents = getFileContents(fname)
-    nonempty = stripComments(contents)
-    lineinfo = addFileNameAndNumber(nonempty)
-
-    return getSectionLabels(lineinfo, label_prefix=label_prefix)
+    lines = getLineTable(fname)[0]
+
+    return getSectionLabels(lines, label_prefix=label_prefix)
+
+
+def benchmark(nsections=5000, repeat=5):
+    """ times the outline of a synthetic document with nsections sections,
+    read from scratch and from the cache
+
+    Every section holds a few paragraphs, an equation and a figure with a
+    label each. The main file \\input's a file for every 100 sections.
+    Returns a summary and a list of the failures: the outline from the cache
+    must be the one read from scratch, and show all labels.
+    """
+    import shutil
+    import tempfile
+
+    import texbackend
+
+    sectypes = ['chapter', 'section', 'subsection', 'subsubsection']
+    parts = []
+    for i in range(nsections):
+        if i % 100 == 0:
+            parts.append([])
+        contents = parts[-1]
+        contents.append('\\%s{Section %d}\n' % (sectypes[i % 7 % 4], i))
+        contents.append('Some text of section %d. %% a comment\n' % i)
+        contents.append('\\begin{equation}\n')
+        contents.append('  e^{i\\pi} + 1 = 0\n')
+        contents.append('  \\label{eq:%d}\n' % i)
+        contents.append('\\end{equation}\n')
+        contents.append('More text.\n\n' * 5)
+        contents.append('\\begin{figure}\n')
+        contents.append('  \\caption{Figure %d}\\label{fig:%d}\n' % (i, i))
+        contents.append('\\end{figure}\n')
+
+    tmpdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        mainfile = os.path.join(tmpdir, 'bench.tex')
+        with open(mainfile, 'w') as fp:
+            for (i, contents) in enumerate(parts):
+                fp.write('\\input{part%d}\n' % i)
+                with open(os.path.join(tmpdir, 'part%d.tex' % i), 'w') as part:
+                    part.write(''.join(contents))
+
+        def fromScratch():
+            texdeps.clearCaches()
+            fileCache.clear()
+            return main(mainfile, '')
+
+        (first, outline) = texbackend.bestTime(fromScratch, repeat)
+        (cached, again) = texbackend.bestTime(lambda: main(mainfile, ''), repeat)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir)
+
+    failures = []
+    if again != outline:
+        failures.append('the outline from the cache differs')
+    labels = outline.count('\n>')
+    if labels != 2 * nsections:
+        failures.append('%d labels instead of %d' % (labels, 2 * nsections))
+    return ('sections: %d, best of %d: from scratch %.3f s, cached %.3f s' % (
+        nsections, repeat, first, cached), failures)
 
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ['--benchmark']:
+        import texbackend
+
+        (summary, failures) = benchmark(*[int(arg) for arg in sys.argv[2:4]])
+        texbackend.exitChecks(failures, summary)
+
     if len(sys.argv) > 2:
         prefix = sys.argv[2]
     else:
@@ -68,9 +68,23 @@ function! Tex_pack_check(package)
 	" Use Tex_FindInRtp() function to get first name from packages list in all
 	" rtp directories conforming with latex-suite directories hierarchy
 	" Store names in variables to process functions only once.
-	let packname = Tex_FindInRtp(a:package, 'packages')
+	let entry = s:GetIndexedPackage(a:package)
+	if !empty(entry)
+		" The lists of the package are taken from packages.index instead of
+		" sourcing the package file.
+		let packname = a:package
+		let g:TeX_package_option_{a:package} = entry.options
+		let g:TeX_package_{a:package} = entry.commands
+		if entry.guard != ''
+			let g:{entry.guard} = 1
+		endif
+	else
+		let packname = Tex_FindInRtp(a:package, 'packages')
+		if packname != ''
+			exe 'runtime! ftplugin/latex-suite/packages/' . a:package
+		endif
+	endif
 	if packname != ''
-		exe 'runtime! ftplugin/latex-suite/packages/' . a:package
 		if has("gui_running")
 			call Tex_pack(a:package)
 		endif
@@ -95,6 +109,60 @@ function! Tex_pack_check(package)
 	let g:Tex_package_supported = substitute(g:Tex_package_supported, '^,', '', '')
 endfunction
 
+" }}}
+" s:GetIndexedPackage: returns the entry of a package in packages.index {{{
+" Description: packages.index is made by texpackindex.py from the package
+"   files which only define the lists g:TeX_package_option_<name> and
+"   g:TeX_package_<name>. It is read in one go the first time a package is
+"   checked, and the line of a package is only split when it is used. The
+"   entry of a package is only returned if 'runtimepath' has no other file
+"   for it, and its file still has the size recorded in the index. A file
+"   newer than the index must also have the recorded sha256 digest, since
+"   git and cp do not keep the modification times of the files; the check
+"   is remembered until the file changes. Otherwise {} is returned and the
+"   file is sourced.
+let s:packageIndexFile = expand('<sfile>:p:h').'/packages.index'
+let s:checkedPackages = {}
+
+function! s:GetIndexedPackage(package)
+	if !exists('s:packageIndex')
+		let s:packageIndex = {}
+		if Tex_GetVarValue('Tex_UsePackageIndex', 1) && filereadable(s:packageIndexFile)
+			let lines = readfile(s:packageIndexFile)
+			if get(lines, 0, '') =~ '^" latex-suite package index 3,'
+				for line in lines[1:]
+					if line !~ '^"'
+						let s:packageIndex[matchstr(line, "^[^\t]*")] = line
+					endif
+				endfor
+			endif
+			let s:packageIndexTime = getftime(s:packageIndexFile)
+		endif
+	endif
+	if !has_key(s:packageIndex, a:package)
+		return {}
+	endif
+
+	let indexed = fnamemodify(s:packageIndexFile, ':h').'/packages/'.a:package
+	let files = split(globpath(&rtp, 'ftplugin/latex-suite/packages/'.a:package), "\n")
+	if len(files) != 1 || fnamemodify(files[0], ':p') != indexed
+		return {}
+	endif
+
+	let fields = split(s:packageIndex[a:package], "\t", 1)
+	if getfsize(indexed) != str2nr(fields[4])
+		return {}
+	endif
+	let time = getftime(indexed)
+	if time > s:packageIndexTime && get(s:checkedPackages, a:package, -1) != time
+		if !exists('*sha256') || sha256(join(readfile(indexed, 'b'), "\n")) !=# fields[5]
+			return {}
+		endif
+		let s:checkedPackages[a:package] = time
+	endif
+	return {'guard': fields[1], 'options': fields[2], 'commands': fields[3]}
+endfunction
+
 " }}}
 " Tex_pack_uncheck: removes package from menu and 'dict' settings. {{{
 function! Tex_pack_uncheck(package)
@@ -120,13 +188,24 @@ function! Tex_pack_updateall(force)
 	" Find out which file we need to scan.
 	let fname = Tex_GetMainFileName(':p')
 
+	" With python, the file is scanned right away, which does not take any
+	" time if it did not change since the last scan. The key of the scan
+	" only changes if the packages, commands or environments found do.
+	if Tex_UsePython()
+		let scan = s:ScanFileForPackages(fname, 0)
+		let key = scan.key
+	else
+		let key = ''
+	endif
+
 	" If this is the same as last time, don't repeat.
 	if !a:force && exists('s:lastScannedFile') &&
-				\ s:lastScannedFile == fname
+				\ s:lastScannedFile == fname && s:lastScannedKey == key
 		return
 	endif
 	" Remember which file we scanned for next time.
 	let s:lastScannedFile = fname
+	let s:lastScannedKey = key
 
 	" Remember which packages we detected last time.
 	if exists('g:Tex_package_detected')
@@ -141,16 +220,20 @@ function! Tex_pack_updateall(force)
 	let g:Tex_PromptedEnvironments = g:Tex_PromptedEnvironmentsDefault
 	let g:Tex_PromptedCommands = g:Tex_PromptedCommandsDefault
 
-	if expand('%:p') != fname
-		call Tex_Debug(':Tex_pack_updateall: sview '.fnameescape(fname), 'pack')
-		exe 'sview '.fnameescape(fname)
+	if Tex_UsePython()
+		call s:AddScannedPackages(scan)
 	else
-		call Tex_Debug(':Tex_pack_updateall: split', 'pack')
-		split
+		if expand('%:p') != fname
+			call Tex_Debug(':Tex_pack_updateall: sview '.fnameescape(fname), 'pack')
+			exe 'sview '.fnameescape(fname)
+		else
+			call Tex_Debug(':Tex_pack_updateall: split', 'pack')
+			split
+		endif
+
+		call Tex_ScanForPackages()
+		q
 	endif
-		
-	call Tex_ScanForPackages()
-	q
 
 	call Tex_Debug(':Tex_pack_updateall: detected ['.g:Tex_package_detected.'] in first run', 'pack')
 	
@@ -188,6 +271,22 @@ function! Tex_pack_updateall(force)
 			continue
 		endif 
 
+		" With python, the package is scanned without opening it.
+		if Tex_UsePython()
+			let package_file = findfile(fnameescape(packname).'.sty')
+			if package_file != ''
+				let packpath = fnamemodify(package_file, ':p')
+				let &complete = &complete.',s'.packpath
+
+				call Tex_Debug(':Tex_pack_updateall: found custom package '.packpath, 'pack')
+				call s:AddScannedPackages(s:ScanFileForPackages(packpath, 1))
+			endif
+			let scannedPackages = scannedPackages.','.packname
+			let i = i + 1
+			let packname = Tex_Strntok(g:Tex_package_detected, ',', i)
+			continue
+		endif
+
 		" Split this window in two. The packages/files being found will open
 		" in this new window and we also need not bother with files being
 		" modified etc.
@@ -222,7 +321,7 @@ function! Tex_pack_updateall(force)
 		" otherwise we are presently editing a custom package, scan it for
 		" more \usepackage lines from the first line to the last.
 		let packpath = expand('%:p')
-		let &complete = &complete.'s'.packpath
+		let &complete = &complete.',s'.packpath
 
 		call Tex_Debug(':Tex_pack_updateall: found custom package '.packpath, 'pack')
 		call Tex_ScanForPackages(line('$'), line('$'))
@@ -323,6 +422,15 @@ endfunction
 function! Tex_ScanForPackages(...)
 	call Tex_Debug("+Tex_ScanForPackages", "pack")
 
+	" With python, the file is scanned in one pass, without moving the
+	" cursor or opening the folds.
+	if Tex_UsePython()
+		exec g:Tex_PythonCmd . ' texpackages.setBufferScan(' . (a:0 >= 2) . ')'
+		call s:AddScannedPackages(retval)
+		call Tex_Debug("-Tex_ScanForPackages", "pack")
+		return
+	endif
+
 	let pos = Tex_GetPos()
 
 	" For package files without \begin and \end{document}, we might be told to
@@ -472,6 +580,45 @@ function! Tex_ScanForPackages(...)
 	call Tex_Debug("-Tex_ScanForPackages", "pack")
 endfunction
    
+" }}}
+" s:ScanFileForPackages: scans a file for packages in python {{{
+" Description: returns the dictionary of texpackages.setScanResult() for the
+"   file fname. If whole is 1, all lines are scanned, as for package files
+"   which have no \begin{document}.
+function! s:ScanFileForPackages(fname, whole)
+	exec g:Tex_PythonCmd . ' texpackages.setFileScan(r"""' . a:fname . '""", ' . a:whole . ')'
+	return retval
+endfunction
+
+" }}}
+" s:AddScannedPackages: adds the result of a scan in python {{{
+" Description: does with the dictionary of texpackages.setScanResult() what
+"   Tex_ScanForPackages() does with the lines it finds. The class and its
+"   options are kept in g:Tex_documentclass and g:Tex_documentclass_options.
+function! s:AddScannedPackages(scan)
+	if a:scan.documentclass != ''
+		let g:Tex_documentclass = a:scan.documentclass
+		let g:Tex_documentclass_options = a:scan.classoptions
+	endif
+
+	for [packname, options] in a:scan.packages
+		let g:Tex_package_detected = g:Tex_package_detected.','.packname
+		" Only names which can be part of a variable name get options.
+		if packname =~ '^\w\+$'
+			let g:Tex_{packname}_options = options
+		endif
+	endfor
+	let g:Tex_package_detected = substitute(g:Tex_package_detected, '^,', '', '')
+	call Tex_Debug(":s:AddScannedPackages: detected packages = ".g:Tex_package_detected, "pack")
+
+	for newcommand in a:scan.commands
+		let g:Tex_PromptedCommands = g:Tex_PromptedCommands . ',' . newcommand
+	endfor
+	for newenvironment in a:scan.environments
+		let g:Tex_PromptedEnvironments = g:Tex_PromptedEnvironments . ',' . newenvironment
+	endfor
+endfunction
+
 " }}}
 " Tex_pack_supp_menu: sets up a menu for package files {{{
 "   found in the packages directory groups the packages thus found into groups
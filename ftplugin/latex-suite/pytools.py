@@ -1,10 +1,8 @@
 import glob
 import os
 import re
-import string
 
-
-import vim
+import vimbridge
 
 
 def catFile(filename):
@@ -16,9 +14,7 @@ def catFile(filename):
     except FileNotFoundError:
         lines = ''
 
-    # escape double quotes and backslashes before quoting the string so
-    # everything passes throught.
-    vim.command("""let retval = "%s" """ % re.sub(r'"|\\', r'\\\g<0>', lines))
+    vimbridge.setVar('retval', lines)
     return lines
 
 
@@ -29,13 +25,13 @@ def isPresentInFile(regexp, filename):
         fcontents = fp.read()
         fp.close()
         if re.search(regexp, fcontents):
-            vim.command('let retval = 1')
+            vimbridge.setVar('retval', 1)
             return 1
         else:
-            vim.command('let retval = 0')
+            vimbridge.setVar('retval', 0)
             return None
     except FileNotFoundError:
-        vim.command('let retval = 0')
+        vimbridge.setVar('retval', 0)
         return None
 
 
@@ -53,8 +49,8 @@ def deleteFile(filepattern):
                 for filename in glob.glob(filepattern):
                     os.remove(filename)
             else:
-                vim.command('let retval = -1')
+                vimbridge.setVar('retval', -1)
     except:
-        vim.command('let retval = -1')
+        vimbridge.setVar('retval', -1)
 
 # vim:ff=unix:noet:ts=4:sw=4:nowrap
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+# Part of Latex-Suite
+#
+# Description:
+#   This file loads the python helpers of latex-suite for vim. main.vim
+#   imports the helpers from here, and gets for each of them a stand-in
+#   which imports the module on its first use only, so that opening a latex
+#   file does not wait for modules it may never need. Once imported, the
+#   modules stay loaded with their caches between calls.
+#
+#   The time taken by importing each module and by every call of one of
+#   its functions is recorded, see :TexPyStats. Outside of vim,
+#       python texbackend.py
+#   imports all helpers which do not need vim and prints their import times.
+#
+#   The benchmarks and checks run by the helpers outside of vim, such as
+#       python texfolds.py --benchmark file.tex
+#   time their code and report their results with the functions at the end
+#   of this file.
+
+import sys
+import time
+
+
+# The helper modules, which vim uses as global names of python.
+helpers = ('auxoutline', 'bibtools', 'pytools', 'texbuild', 'texfolds',
+           'texindex', 'texlog', 'texpackages', 'texscan', 'vimbridge')
+
+# The seconds taken by importing each helper module, by name. The helpers it
+# imports itself are counted in, and have None.
+imports = {}
+
+# The calls of the functions of the helpers, by 'module.function', as
+# [count, total seconds, longest seconds].
+calls = {}
+
+# The functions to call with a helper module once it is imported, by name.
+pending = {}
+
+
+def load(name):
+    """ returns a helper module, importing it on the first call """
+    module = sys.modules.get(name)
+    if module is None:
+        start = time.time()
+        module = __import__(name)
+        imports[name] = time.time() - start
+    elif name not in imports:
+        imports[name] = None
+    for (function, args) in pending.pop(name, ()):
+        getattr(module, function)(*args)
+    return module
+
+
+def onLoad(name, function, *args):
+    """ calls function of a helper module with args once it is imported,
+    right away if it already is """
+    if name in imports:
+        getattr(load(name), function)(*args)
+    else:
+        pending.setdefault(name, []).append((function, args))
+
+
+def record(key, elapsed):
+    entry = calls.get(key)
+    if entry is None:
+        calls[key] = [1, elapsed, elapsed]
+    else:
+        entry[0] += 1
+        entry[1] += elapsed
+        if elapsed > entry[2]:
+            entry[2] = elapsed
+
+
+def timed(key, function):
+    """ returns function, recording the time of its calls under key """
+    def call(*args, **kwargs):
+        start = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record(key, time.time() - start)
+    return call
+
+
+class LazyModule(object):
+    """ the stand-in of a helper module, which imports it when one of its
+    attributes is first looked up
+
+    Functions and classes of the module are returned timed, other values as
+    they are.
+    """
+    def __init__(self, name):
+        self.__name = name
+
+    def __getattr__(self, attr):
+        value = getattr(load(self.__name), attr)
+        if not callable(value):
+            return value
+        value = timed('%s.%s' % (self.__name, attr), value)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        return '<latex-suite helper %s, %s>' % (
+            self.__name, self.__name in imports and 'loaded' or 'not loaded')
+
+
+for name in helpers:
+    globals()[name] = LazyModule(name)
+
+
+def report():
+    """ returns the import times and call latencies as a list of lines """
+    lines = ['imports:']
+    for name in helpers:
+        if imports.get(name) is not None:
+            lines.append('  %-12s %8.1f ms' % (name, 1000 * imports[name]))
+        elif name in sys.modules:
+            lines.append('  %-12s imported by another helper' % name)
+        else:
+            lines.append('  %-12s not loaded' % name)
+    lines.append('calls:%33s %10s %10s %10s' % ('count', 'total', 'mean', 'longest'))
+    for key in sorted(calls):
+        (count, total, longest) = calls[key]
+        lines.append('  %-30s %6d %7.1f ms %7.1f ms %7.1f ms' % (
+            key, count, 1000 * total, 1000 * total / count, 1000 * longest))
+    return lines
+
+
+def bestTime(function, repeat=5):
+    """ returns the shortest time in seconds of repeat calls of function,
+    and the result of the last call """
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        result = function()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return (best, result)
+
+
+def vimString(s):
+    """ quotes a string for use in a vim expression """
+    return "'" + s.replace("'", "''") + "'"
+
+
+def bestVimTime(commands, repeat=5, after=(), before=(), encoding='utf-8'):
+    """ returns the shortest time in seconds vim takes to run a list of Ex
+    commands, each time in a vim started for it
+
+    The commands run in a script sourced by vim -u NONE, and only they are
+    timed, not the start of vim. The commands before and after are run
+    before and after them, e.g. to load a file and to write the results
+    into a file for a check.
+    """
+    import os
+    import shutil
+    import subprocess
+    import tempfile
+
+    tmpdir = tempfile.mkdtemp()
+    script = os.path.join(tmpdir, 'benchmark.vim')
+    try:
+        with open(script, 'wb') as fp:
+            fp.write('\n'.join(
+                list(before) + ['let s:start = reltime()'] + list(commands) +
+                ['call writefile([reltimestr(reltime(s:start))], %s)'
+                 % vimString(script + '.out')] + list(after) +
+                ['qa!', '']).encode(encoding))
+        best = None
+        for i in range(repeat):
+            subprocess.call(['vim', '-Nu', 'NONE', '-es',
+                             '--cmd', 'set enc=' + encoding, '-S', script])
+            with open(script + '.out') as fp:
+                elapsed = float(fp.read())
+            if best is None or elapsed < best:
+                best = elapsed
+    finally:
+        shutil.rmtree(tmpdir)
+    return best
+
+
+def exitChecks(failures, summary=None):
+    """ prints the summary and the failures of the checks of a helper, and
+    exits with status 1 if there are any """
+    if summary:
+        print(summary)
+    for failure in failures:
+        print(failure)
+    print(failures and 'FAILED' or 'ok')
+    sys.exit(failures and 1 or 0)
+
+
+if __name__ == "__main__":
+    for name in helpers:
+        try:
+            load(name)
+        except ImportError:
+            pass
+    print('\n'.join(report()[:len(helpers) + 1]))
@@ -0,0 +1,539 @@
+#!/usr/bin/env python
+
+# Part of Latex-Suite
+#
+# Description:
+#   This file compiles latex documents in the background. A build runs the
+#   chain of commands of Tex_RunLaTeX() in a thread: latex as many times as
+#   needed to get the cross-references right, with makeindex and bibtex in
+#   between. Vim polls the builds with a timer to show their progress and
+#   to fill the quickfix list when they are finished.
+#
+#   Check reruns, cancelling and restarting with a stub latex:
+#       python texbuild.py --selftest
+
+import hashlib
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+
+auxInputPattern = re.compile(br'\\@input{([^}]*)}')
+# Lines of .aux files which do not depend on the previous run of latex:
+# comments, which some packages use for timestamps, and empty lines.
+# The pattern starts with the newline before the line, so that re can
+# search for it quickly.
+volatileAuxPattern = re.compile(br'\n[ \t]*(?:%[^\n]*)?(?=\r?\n)')
+
+
+def digestFiles(filename, aux=False, blocksize=65536, root=''):
+    """ returns a dictionary of digests of a file and the files it includes
+
+    The files are hashed in blocks of whole lines instead of being read as
+    a whole. If aux is true, the .aux files \\@input by the file are
+    hashed as well, and volatile lines are skipped. The digest of a missing
+    file is ''. Relative file names are taken relative to root.
+    """
+    digests = {}
+    pending = [filename]
+    while pending:
+        name = pending.pop()
+        if name in digests:
+            continue
+        digests[name] = ''
+        try:
+            fp = open(os.path.join(root, name), 'rb')
+        except IOError:
+            continue
+        md5 = hashlib.md5()
+        rest = b''
+        with fp:
+            block = fp.read(blocksize)
+            while block:
+                nextblock = fp.read(blocksize)
+                if aux:
+                    # Only whole lines are filtered, an incomplete last line
+                    # is kept for the next block.
+                    block = rest + block
+                    if nextblock:
+                        end = block.rfind(b'\n') + 1
+                        (block, rest) = (block[:end], block[end:])
+                    elif not block.endswith(b'\n'):
+                        block += b'\n'
+                    block = volatileAuxPattern.sub(b'', b'\n' + block)[1:]
+                    pending.extend(child.decode('latin1')
+                                   for child in auxInputPattern.findall(block))
+                md5.update(block)
+                block = nextblock
+        digests[name] = md5.hexdigest()
+    return digests
+
+
+def setFileDigests(filename, aux=False):
+    """ sets the local variable retval to the result of digestFiles() """
+    import vimbridge
+
+    vimbridge.setVar('retval', digestFiles(filename, aux))
+
+
+def changedFiles(before, after):
+    """ returns the sorted names of the files whose digests differ """
+    names = set(before) | set(after)
+    return sorted(name for name in names if before.get(name) != after.get(name))
+
+
+def expandRule(rule, name):
+    """ returns the command of a rule for a file, as :make would run it
+
+    $* is replaced by name. A rule without $* gets name as argument.
+    """
+    if '$*' in rule:
+        return rule.replace('$*', name)
+    if name:
+        return '%s "%s"' % (rule, name)
+    return rule
+
+
+# The lines of the log file which the 'efm' of compiler/tex.vim takes for
+# errors.
+errorPattern = re.compile(br'^(?:! |[^:\n]+:\d+: )', re.M)
+bibdataPattern = re.compile(br'\\bibdata|\\abx')
+
+
+class BuildCancelled(Exception):
+    pass
+
+
+class Build(object):
+    """ a background build of a latex document
+
+    steps is a list of (rule, name, multiple) for every format of the
+    dependency chain: rule is the compile rule of the format, name the
+    argument substituted for $*, and multiple is true for formats which are
+    compiled as often as needed, running makeindex and bibtex in between.
+    The chain stops at the first step after which the log file has errors.
+    If previous is the cancelled build of the same document, its commands
+    are waited for before the first command of this build runs, so that
+    they do not write the same files.
+    """
+    def __init__(self, mainfile, steps, bibtex='bibtex',
+                 makeindex='makeindex "$*.idx"', maxruns=5, previous=None):
+        self.mainfile = os.path.abspath(mainfile)
+        self.root = os.path.dirname(self.mainfile)
+        self.base = os.path.splitext(os.path.basename(self.mainfile))[0]
+        self.steps = steps
+        self.bibtex = bibtex
+        self.makeindex = makeindex
+        self.maxruns = maxruns
+        self.previous = previous
+
+        self.status = 'running'
+        self.runs = 0
+        self.started = None
+        self.elapsed = 0.0
+        self.messages = []
+        self.process = None
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        self.started = time.time()
+        self.thread = threading.Thread(target=self.run,
+                                       name='latex-suite build')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def cancel(self):
+        """ stops the build, killing the command it is running """
+        self.cancelled.set()
+        with self.lock:
+            process = self.process
+        if process is not None:
+            killProcess(process)
+
+    def stop(self, timeout=2.0):
+        """ cancels the build and waits until its command has exited
+
+        A command which is still running after timeout seconds is killed
+        for good.
+        """
+        if not self.cancelled.is_set():
+            self.cancel()
+        if self.thread is None:
+            return
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            with self.lock:
+                process = self.process
+            if process is not None:
+                killProcess(process, True)
+            self.thread.join(timeout)
+
+    def running(self):
+        return self.status == 'running'
+
+    def report(self, message):
+        with self.lock:
+            self.messages.append(message)
+
+    def takeMessages(self):
+        """ returns the messages reported since the last call """
+        with self.lock:
+            (messages, self.messages) = (self.messages, [])
+        return messages
+
+    def path(self, ext):
+        return os.path.join(self.root, self.base + ext)
+
+    def call(self, rule, name):
+        """ runs a command in the directory of the main file """
+        with self.lock:
+            if self.cancelled.is_set():
+                raise BuildCancelled()
+            devnull = open(os.devnull, 'rb')
+            try:
+                self.process = subprocess.Popen(
+                    expandRule(rule, name), shell=True, cwd=self.root,
+                    stdin=devnull, stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT, **processGroupArgs)
+            finally:
+                devnull.close()
+        output = self.process.communicate()[0]
+        with self.lock:
+            (process, self.process) = (self.process, None)
+        if self.cancelled.is_set():
+            raise BuildCancelled()
+        if process.returncode == 127:
+            raise OSError('command not found: %s'
+                          % output.decode('latin1').strip())
+        return process.returncode
+
+    def hasErrors(self):
+        """ returns whether the log file of the last latex run has errors """
+        try:
+            with open(self.path('.log'), 'rb') as fp:
+                return errorPattern.search(fp.read()) is not None
+        except IOError:
+            return False
+
+    def compileLatex(self, rule, name):
+        self.runs += 1
+        self.report('latex run number : %d' % self.runs)
+        self.call(rule, name)
+
+    def compileMultipleTimes(self, rule, name):
+        """ compiles like Tex_CompileMultipleTimes() """
+        idxname = self.base + '.idx'
+        auxname = self.base + '.aux'
+        bblname = self.base + '.bbl'
+
+        idxBefore = digestFiles(idxname, root=self.root)
+        auxBefore = digestFiles(auxname, True, root=self.root)
+
+        runCount = 0
+        needToRerun = True
+        while needToRerun and runCount < self.maxruns:
+            needToRerun = False
+            reasons = []
+
+            self.compileLatex(rule, name)
+            if self.hasErrors():
+                return
+
+            idxAfter = digestFiles(idxname, root=self.root)
+            if (runCount == 0 and os.path.exists(self.path('.idx'))
+                    and idxBefore != idxAfter):
+                self.report('Running makeindex...')
+                self.call(self.makeindex, self.base)
+                needToRerun = True
+                reasons.append('the index changed')
+
+            try:
+                with open(self.path('.aux'), 'rb') as fp:
+                    hasBibdata = bibdataPattern.search(fp.read()) is not None
+            except IOError:
+                hasBibdata = False
+            if runCount == 0 and hasBibdata:
+                bblBefore = digestFiles(bblname, root=self.root)
+                self.report("Running '%s' ..." % self.bibtex)
+                self.call(self.bibtex, self.base)
+                if digestFiles(bblname, root=self.root) != bblBefore:
+                    needToRerun = True
+                    reasons.append(bblname + ' changed')
+
+            auxAfter = digestFiles(auxname, True, root=self.root)
+            changed = changedFiles(auxBefore, auxAfter)
+            if changed:
+                needToRerun = True
+                reasons.append('to get cross-references right, changed: '
+                               + ', '.join(changed))
+
+            if needToRerun:
+                self.report('Need to rerun because ' + '; '.join(reasons))
+
+            idxBefore = idxAfter
+            auxBefore = auxAfter
+            runCount += 1
+
+    def run(self):
+        try:
+            if self.previous is not None:
+                self.previous.stop()
+                self.previous = None
+            for (rule, name, multiple) in self.steps:
+                if multiple:
+                    self.compileMultipleTimes(rule, name)
+                else:
+                    self.compileLatex(rule, name)
+                if self.hasErrors():
+                    status = 'error'
+                    break
+            else:
+                status = 'done'
+        except BuildCancelled:
+            status = 'cancelled'
+        except Exception as e:
+            self.report('Build failed: %s' % e)
+            status = 'failed'
+        self.elapsed = time.time() - self.started
+        if status == 'cancelled':
+            self.report('Build of %s cancelled' % self.base)
+        else:
+            self.report('Ran latex %d time(s) in %.1f s'
+                        % (self.runs, self.elapsed))
+        self.status = status
+
+
+if os.name == 'posix':
+    # Every command runs in its own process group, so that cancelling a
+    # build kills latex and not only the shell which started it. preexec_fn
+    # is not safe in a process with threads, it is only used by python 2,
+    # which has no start_new_session.
+    if sys.version_info >= (3, 2):
+        processGroupArgs = {'start_new_session': True}
+    else:
+        processGroupArgs = {'preexec_fn': os.setsid}
+
+    def killProcess(process, force=False):
+        try:
+            os.killpg(process.pid, force and signal.SIGKILL or signal.SIGTERM)
+        except OSError:
+            pass
+else:
+    processGroupArgs = {}
+
+    def killProcess(process, force=False):
+        try:
+            process.kill()
+        except OSError:
+            pass
+
+
+# The builds by main file. A build is kept until vim is told that it
+# finished.
+builds = {}
+lock = threading.Lock()
+
+
+def startBuild(mainfile, steps, bibtex='bibtex', makeindex='makeindex "$*.idx"'):
+    """ starts a build of a document, cancelling the running one
+
+    Returns at once: the thread of the new build waits for the commands of
+    the old one to exit.
+    """
+    with lock:
+        old = builds.get(os.path.abspath(mainfile))
+        build = Build(mainfile, steps, bibtex, makeindex, previous=old)
+        builds[build.mainfile] = build
+    if old is not None:
+        old.cancel()
+    build.start()
+    return build
+
+
+def restartBuild(mainfile):
+    """ starts a running build of a document again
+
+    Returns the new build, or None if no build of mainfile is running.
+    """
+    with lock:
+        old = builds.get(os.path.abspath(mainfile))
+    if old is None or not old.running():
+        return None
+    return startBuild(old.mainfile, old.steps, old.bibtex, old.makeindex)
+
+
+def cancelBuild(mainfile):
+    """ cancels the build of a document, returns whether one was running """
+    with lock:
+        build = builds.get(os.path.abspath(mainfile))
+    if build is None or not build.running():
+        return False
+    build.cancel()
+    return True
+
+
+def pollBuilds():
+    """ returns (messages, finished, running) of all builds
+
+    messages are the messages reported since the last call, finished the
+    builds which finished since then, and running the number of builds
+    which are still running.
+    """
+    messages = []
+    finished = []
+    with lock:
+        for (mainfile, build) in list(builds.items()):
+            # The status is read before the messages, so that the last
+            # message of a finished build is not missed.
+            running = build.running()
+            messages.extend(build.takeMessages())
+            if not running:
+                finished.append(build)
+                del builds[mainfile]
+        return (messages, finished, len(builds))
+
+
+def setBuildStatus():
+    """ sets the local variable retval to the result of pollBuilds() """
+    import vimbridge
+
+    (messages, finished, running) = pollBuilds()
+    vimbridge.setVar('retval', {
+        'messages': list(messages),
+        'finished': [{'mainfile': build.mainfile, 'status': build.status,
+                      'runs': build.runs} for build in finished],
+        'running': running})
+
+
+def startVimBuild(config):
+    """ starts a build of the dictionary config given by vim.eval() """
+    steps = [(rule, name, int(multiple)) for (rule, name, multiple) in config['steps']]
+    startBuild(config['mainfile'], steps, config['bibtex'], config['makeindex'])
+
+
+# A stand-in for latex, used by selftest(). Every run writes an .aux file
+# which changes in the first two runs, and then waits for the number of
+# seconds in the file delay. SIGTERM makes it exit only 0.3 s later, like a
+# latex which is slow to stop. Its start and exit are logged to stub.log.
+stubLatex = r'''
+import os, signal, sys, time
+
+def log(event):
+    with open('stub.log', 'a') as fp:
+        fp.write('%s %d %.6f\n' % (event, os.getpid(), time.time()))
+
+def terminate(signum, frame):
+    time.sleep(0.3)
+    log('exit')
+    sys.exit(1)
+
+signal.signal(signal.SIGTERM, terminate)
+log('start')
+with open('stub.log') as fp:
+    runs = len([line for line in fp if line.startswith('start')])
+with open(sys.argv[1] + '.aux', 'w') as fp:
+    fp.write('\\relax\n\\newlabel{stub}{{%d}{1}}\n' % min(runs, 2))
+with open(sys.argv[1] + '.log', 'w') as fp:
+    fp.write('This is stub latex, run %d\n' % runs)
+if os.path.exists('delay'):
+    with open('delay') as fp:
+        time.sleep(float(fp.read()))
+log('exit')
+'''
+
+
+def selftest():
+    """ checks the reruns, cancelling and restarting of builds with a stub
+    latex, returns a list of the failures """
+    import shutil
+    import tempfile
+
+    def readLog():
+        with open(os.path.join(root, 'stub.log')) as fp:
+            return [line.split() for line in fp]
+
+    def setDelay(seconds):
+        with open(os.path.join(root, 'delay'), 'w') as fp:
+            fp.write('%g' % seconds)
+
+    def wait(build):
+        while build.running():
+            time.sleep(0.05)
+        build.thread.join()
+
+    failures = []
+    root = tempfile.mkdtemp()
+    try:
+        stub = os.path.join(root, 'stublatex.py')
+        with open(stub, 'w') as fp:
+            fp.write(stubLatex)
+        mainfile = os.path.join(root, 'main.tex')
+        open(mainfile, 'w').close()
+        steps = [('"%s" "%s" "$*"' % (sys.executable, stub), 'main', 1)]
+
+        # The .aux file changes in the first and second run.
+        build = startBuild(mainfile, steps, makeindex='true')
+        wait(build)
+        if (build.status, build.runs) != ('done', 3):
+            failures.append('rerun: %s after %d runs, expected done after 3'
+                            % (build.status, build.runs))
+
+        os.remove(os.path.join(root, 'stub.log'))
+        setDelay(5)
+        build = startBuild(mainfile, steps, makeindex='true')
+        time.sleep(0.5)
+        cancelBuild(mainfile)
+        wait(build)
+        events = [event for (event, pid, stamp) in readLog()]
+        if build.status != 'cancelled' or events != ['start', 'exit']:
+            failures.append('cancel: %s, stub %s' % (build.status, ' '.join(events)))
+
+        # The restarted build has to wait for the old latex to exit.
+        os.remove(os.path.join(root, 'stub.log'))
+        old = startBuild(mainfile, steps, makeindex='true')
+        time.sleep(0.5)
+        setDelay(0)
+        start = time.time()
+        build = restartBuild(mainfile)
+        elapsed = time.time() - start
+        wait(build)
+        log = readLog()
+        if elapsed > 0.1:
+            failures.append('restart: restartBuild() took %.2f s' % elapsed)
+        if old.status != 'cancelled' or build is None or build.status != 'done':
+            failures.append('restart: old build %s, new build %s'
+                            % (old.status, build and build.status))
+        elif [event for (event, pid, stamp) in log[:3]] != ['start', 'exit', 'start']:
+            failures.append('restart: latex runs overlap: %s'
+                            % ', '.join(' '.join(entry) for entry in log))
+        pollBuilds()
+    finally:
+        shutil.rmtree(root)
+    return failures
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--selftest':
+        import texbackend
+
+        texbackend.exitChecks(selftest())
+    # texbuild.py file.tex [rule]: builds a document in the foreground.
+    if len(sys.argv) > 2:
+        rule = sys.argv[2]
+    else:
+        rule = 'latex -interaction=nonstopmode -file-line-error-style "$*"'
+    build = startBuild(sys.argv[1], [(rule, os.path.basename(sys.argv[1]), 1)])
+    while True:
+        (messages, finished, running) = pollBuilds()
+        for message in messages:
+            print(message)
+        if finished:
+            print(finished[0].status)
+            break
+        time.sleep(0.1)
@@ -0,0 +1,449 @@
+#!/usr/bin/env python
+
+# Part of Latex-Suite
+#
+# Description:
+#   This file keeps the dependency graph of latex projects: the files every
+#   file \input's or \include's, its bibliographies and graphics, and the
+#   .aux files of the included files. Files are looked up the way kpathsea
+#   does, in directory listings which are only read again when the directory
+#   changes, so that looking up a file, or finding that it does not exist,
+#   rarely costs a system call.
+
+import re
+import os
+import sys
+
+
+def readFile(fname):
+    """ returns the contents of a file, decoded if strings are unicode """
+    try:
+        with open(fname, 'rb') as fp:
+            contents = fp.read()
+    except IOError:
+        return None
+    if str is bytes:
+        return contents
+    try:
+        return contents.decode('utf-8')
+    except UnicodeDecodeError:
+        return contents.decode('latin1')
+
+
+def splitPath(path):
+    """ splits a comma separated path as used by vim's 'path' option """
+    dirs = []
+    for entry in re.split(r'(?<!\\)[, ]', path):
+        dirs.append(entry.replace('\\,', ',').replace('\\ ', ' '))
+    return dirs
+
+
+class PathResolver(object):
+    """ finds files like vim's findfile() in cached directory listings
+
+    The listing of a directory is read once and then kept until the
+    modification time of the directory changes. Every directory is checked
+    at most once per generation; a new generation is started for every
+    query of the graph, so that files created in between are found.
+
+    The results of all lookups are memoized as well, those for missing files
+    included, together with the versions of the listings they were taken
+    from.
+    """
+    def __init__(self):
+        self.generation = 0
+        self.listings = {}
+        self.lookups = {}
+        self.stats = {'lookups': 0, 'hits': 0, 'listings': 0}
+
+    def newGeneration(self):
+        self.generation += 1
+
+    def listing(self, dirname):
+        """ returns [version, files, subdirs] of a directory
+
+        files is a set of the names of the files in the directory and
+        subdirs a sorted list of the names of its subdirectories, both empty
+        if the directory does not exist. The version changes whenever the
+        listing is read again.
+        """
+        rec = self.listings.get(dirname)
+        if rec is not None and rec[0] == self.generation:
+            return rec[1]
+        try:
+            mtime = os.stat(dirname).st_mtime
+        except OSError:
+            mtime = None
+        if rec is not None and rec[2] == mtime:
+            rec[0] = self.generation
+            return rec[1]
+
+        files = set()
+        subdirs = []
+        if mtime is not None:
+            try:
+                names = os.listdir(dirname)
+            except OSError:
+                names = []
+            for name in names:
+                full = os.path.join(dirname, name)
+                if os.path.isdir(full):
+                    subdirs.append(name)
+                else:
+                    files.add(name)
+            subdirs.sort()
+        self.stats['listings'] += 1
+        version = (mtime, len(self.listings), self.generation)
+        self.listings[dirname] = [self.generation, [version, files, subdirs], mtime]
+        return self.listings[dirname][1]
+
+    def isfile(self, fname):
+        """ returns whether fname is an existing file, looked up in the listing """
+        (dirname, name) = os.path.split(os.path.abspath(fname))
+        return name in self.listing(dirname)[1]
+
+    def subdirs(self, top):
+        """ returns top and all directories below it, as searched by 'dir/**' """
+        dirs = []
+        stack = [top]
+        while stack:
+            dirname = stack.pop()
+            dirs.append(dirname)
+            stack.extend(os.path.join(dirname, name)
+                         for name in reversed(self.listing(dirname)[2]))
+        return dirs
+
+    def searchDirs(self, path, curdir):
+        """ returns the directories in which to search for files
+
+        The directories are given as for vim's findfile(): '.' is the
+        directory of the current file, an empty entry the current directory,
+        and entries ending in '**' include all subdirectories.
+        """
+        dirs = []
+        for entry in splitPath(path):
+            if entry == '.' or entry == '':
+                dirs.append(curdir)
+                continue
+            if entry.startswith('./'):
+                entry = os.path.join(curdir, entry[2:])
+            else:
+                entry = os.path.join(curdir, os.path.expanduser(entry))
+            if entry.endswith('**'):
+                dirs.extend(self.subdirs(os.path.normpath(entry[:-2] or '.')))
+            else:
+                dirs.append(os.path.normpath(entry))
+        return dirs
+
+    def find(self, fname, path='.', suffixes=('.tex',), curdir=''):
+        """ finds a file like vim's findfile() with 'suffixesadd' set
+
+        Returns the absolute name of the file or None.
+        """
+        if not fname:
+            return None
+        self.stats['lookups'] += 1
+        curdir = os.path.abspath(curdir)
+        key = (fname, path, tuple(suffixes), curdir)
+        memo = self.lookups.get(key)
+        if memo is not None:
+            for (dirname, version) in memo[1]:
+                if self.listing(dirname)[0] != version:
+                    break
+            else:
+                self.stats['hits'] += 1
+                return memo[0]
+
+        names = [fname] + [fname + suffix for suffix in suffixes
+                           if not fname.endswith(suffix)]
+        fname = os.path.expanduser(fname)
+        if os.path.isabs(fname) or fname.startswith('./') or fname.startswith('../'):
+            dirs = [curdir]
+        else:
+            dirs = self.searchDirs(path, curdir)
+
+        # Every directory searched up to the file found is a dependency of
+        # the result. A new subdirectory below 'dir/**' changes the listing
+        # of its parent, which is searched before it.
+        used = []
+        found = None
+        for dirname in dirs:
+            for name in names:
+                (head, tail) = os.path.split(os.path.join(dirname, name))
+                head = os.path.normpath(head)
+                used.append((head, self.listing(head)[0]))
+                if tail in self.listing(head)[1]:
+                    found = os.path.join(head, tail)
+                    break
+            if found is not None:
+                break
+        self.lookups[key] = (found, used)
+        return found
+
+
+resolver = PathResolver()
+
+
+includePattern = re.compile(r'^[ \t]*\\(?:input|include)\b.*$', re.M)
+includeNamePattern = re.compile(r'\\(?:input|include){(.*?)}')
+bibCommandPattern = re.compile(
+    r'\\((?:no)?bibliography|addbibresource)(?:\[[^]]*\])?{([^}]*)}')
+graphicsPattern = re.compile(r'\\includegraphics\*?(?:\[[^]]*\])*{([^}]*)}')
+graphicspathPattern = re.compile(r'\\graphicspath{((?:{[^{}]*})*)}')
+auxInputPattern = re.compile(r'^\\@input{([^}]*)}', re.M)
+commentPattern = re.compile(r'(?<!\\)((?:\\\\)*)%.*')
+
+graphicsSuffixes = ('.pdf', '.png', '.jpg', '.jpeg', '.eps', '.ps', '.mps')
+
+
+def parseTex(contents):
+    """ returns the names of the files a latex file depends on
+
+    Included files are taken from lines starting with \\input or \\include,
+    the same way as vim's search() did it before; bibliographies and
+    graphics only outside comments.
+    """
+    includes = []
+    for m in includePattern.finditer(contents):
+        name = includeNamePattern.search(m.group(0))
+        if name is not None:
+            includes.append(name.group(1))
+
+    uncommented = commentPattern.sub(r'\1', contents)
+    bibnames = []
+    for m in bibCommandPattern.finditer(uncommented):
+        bibnames.extend(name for name in re.sub(r'\s', '', m.group(2)).split(',')
+                        if name)
+        if m.group(1) != 'addbibresource':
+            # Only one \[no]bibliography is allowed by LaTeX
+            break
+
+    graphicspath = []
+    for m in graphicspathPattern.finditer(uncommented):
+        graphicspath = re.findall(r'{([^{}]*)}', m.group(1))
+
+    return {'includes': includes,
+            'bibnames': bibnames,
+            'graphics': [name.strip() for name in graphicsPattern.findall(uncommented)],
+            'graphicspath': graphicspath}
+
+
+def parseAux(contents):
+    """ returns the names of the .aux files \\@input by an .aux file """
+    return auxInputPattern.findall(contents)
+
+
+# The parsed contents of every file read are kept between calls in the
+# python process hosted by vim, together with the modification time and
+# size of the file they were read from. Different parsers of the same file
+# are cached independently.
+fileCache = {}
+cacheStats = {'hits': 0, 'reads': 0}
+
+
+def getParsed(fname, parse, buffers=None):
+    """ returns parse(contents) of a file, or None if it cannot be read
+
+    The result is cached until the file changes. buffers maps the names of
+    files which are modified in vim to their contents, which are parsed
+    instead of the files.
+    """
+    if buffers and fname in buffers:
+        return parse(buffers[fname])
+    key = (fname, parse.__module__, parse.__name__)
+    try:
+        st = os.stat(fname)
+    except OSError:
+        fileCache.pop(key, None)
+        return None
+    rec = fileCache.get(key)
+    if rec and rec[0] == (st.st_mtime, st.st_size):
+        cacheStats['hits'] += 1
+        return rec[1]
+    contents = readFile(fname)
+    if contents is None:
+        fileCache.pop(key, None)
+        return None
+    cacheStats['reads'] += 1
+    parsed = parse(contents)
+    fileCache[key] = ((st.st_mtime, st.st_size), parsed)
+    return parsed
+
+
+class ProjectGraph(object):
+    """ the files of a latex project and the files each of them uses
+
+    For every latex file, edges maps the kinds 'include', 'bibliography',
+    'graphics' and 'aux' to lists of absolute file names, and 'unresolved'
+    to the names of the bibliographies which were not found as files, such
+    as URLs. Included files are
+    looked up relative to the including file, then to the directory of the
+    main file, then in texpath; bibliographies (.bib, else .bbl) in bibpath
+    instead of texpath, and graphics in the \\graphicspath of the file.
+    For the .aux file of the main file, 'aux' holds the .aux files of the
+    \\include'd files.
+
+    update() brings the graph up to date: only files which changed are read
+    again, and only directories which changed are listed again.
+    """
+    def __init__(self, mainfile, texpath='', bibpath=''):
+        self.mainfile = os.path.abspath(mainfile)
+        self.root = os.path.dirname(self.mainfile)
+        self.texpath = texpath
+        self.bibpath = bibpath
+        self.edges = {}
+        self.order = []
+
+    def resolveAll(self, names, path, suffixes, curdir, missing=None):
+        found = []
+        for name in names:
+            for suffix in suffixes:
+                fname = resolver.find(name, path, (suffix,), curdir)
+                if fname is not None:
+                    found.append(fname)
+                    break
+            else:
+                if missing is not None:
+                    missing.append(name)
+        return found
+
+    def update(self, buffers=None):
+        """ walks the project again and returns the graph """
+        resolver.newGeneration()
+        edges = {}
+        order = []
+        stack = [self.mainfile]
+        while stack:
+            fname = stack.pop()
+            if fname in edges:
+                continue
+            rec = getParsed(fname, parseTex, buffers)
+            if rec is None:
+                continue
+            order.append(fname)
+
+            curdir = os.path.dirname(fname)
+            texpath = '.,' + self.root + ',' + self.texpath
+            bibpath = '.,' + self.root + ',' + self.bibpath
+            graphicspath = ','.join(['.', self.root] +
+                                    [os.path.join(self.root, d).replace(',', '\\,')
+                                     for d in rec['graphicspath']])
+            unresolved = []
+            edges[fname] = {
+                'include': self.resolveAll(rec['includes'], texpath, ('.tex',), curdir),
+                'bibliography': self.resolveAll(rec['bibnames'], bibpath,
+                                                ('.bib', '.bbl'), curdir, unresolved),
+                'unresolved': unresolved,
+                'graphics': self.resolveAll(rec['graphics'], graphicspath,
+                                            graphicsSuffixes, curdir),
+            }
+            stack.extend(reversed(edges[fname]['include']))
+
+        auxfiles = []
+        stack = [os.path.splitext(self.mainfile)[0] + '.aux']
+        while stack:
+            fname = stack.pop()
+            if fname in auxfiles:
+                continue
+            names = getParsed(fname, parseAux)
+            if names is None:
+                continue
+            auxfiles.append(fname)
+            children = [os.path.join(self.root, name) for name in names]
+            edges.setdefault(fname, {})['aux'] = children
+            stack.extend(reversed(children))
+
+        self.edges = edges
+        self.order = order
+        return self
+
+    def texfiles(self):
+        """ returns the latex files of the project, in the order included """
+        return list(self.order)
+
+    def children(self, fname, kind='include'):
+        """ returns the files of the given kind used by a file """
+        return list(self.edges.get(fname, {}).get(kind, ()))
+
+    def includes(self):
+        """ returns the files included by every latex file of the project """
+        return dict((fname, self.children(fname)) for fname in self.order)
+
+    def bibfiles(self):
+        """ returns all .bib files of the project """
+        return [name for fname in self.order
+                for name in self.children(fname, 'bibliography')
+                if name.endswith('.bib')]
+
+    def files(self):
+        """ returns all files of the project, of every kind """
+        result = set(self.edges)
+        for edges in self.edges.values():
+            for kind, names in edges.items():
+                if kind != 'unresolved':
+                    result.update(names)
+        return result
+
+
+graphs = {}
+
+
+def getGraph(mainfile, texpath='', bibpath='', buffers=None):
+    """ returns the updated dependency graph of a project """
+    key = (os.path.abspath(mainfile), texpath, bibpath)
+    graph = graphs.get(key)
+    if graph is None:
+        graph = graphs[key] = ProjectGraph(*key)
+    return graph.update(buffers)
+
+
+def clearCaches():
+    """ forgets all graphs, directory listings and parsed files """
+    graphs.clear()
+    fileCache.clear()
+    resolver.listings.clear()
+    resolver.lookups.clear()
+
+
+def getStats():
+    """ returns a summary of the caches """
+    return ('graphs: %d, listings: %d, lookups: %d (%d memoized), '
+            'files read: %d (%d from cache)' % (
+                len(graphs), resolver.stats['listings'],
+                resolver.stats['lookups'], resolver.stats['hits'],
+                cacheStats['reads'], cacheStats['hits']))
+
+
+def benchmark(mainfile, texpath='', bibpath='', repeat=5):
+    """ times building the graph of a project, without and with cache
+
+    Returns a summary and a list of the failures: the updated graph must be
+    the one built from scratch.
+    """
+    import texbackend
+
+    clearCaches()
+    (first, graph) = texbackend.bestTime(
+        lambda: getGraph(mainfile, texpath, bibpath), 1)
+    (edges, order) = (graph.edges, graph.order)
+    (best, graph) = texbackend.bestTime(
+        lambda: getGraph(mainfile, texpath, bibpath), repeat)
+    failures = []
+    if graph.edges != edges or graph.order != order:
+        failures.append('the updated graph differs from the one built from scratch')
+    return ('%d files, first %.4f s, updated %.4f s\n%s' % (
+        len(graph.files()), first, best, getStats()), failures)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--benchmark':
+        import texbackend
+
+        (summary, failures) = benchmark(*sys.argv[2:5])
+        texbackend.exitChecks(failures, summary)
+    else:
+        graph = getGraph(*sys.argv[1:4])
+        for fname in sorted(graph.edges):
+            for kind, names in sorted(graph.edges[fname].items()):
+                for name in names:
+                    print('%s -> %s (%s)' % (fname, name, kind))
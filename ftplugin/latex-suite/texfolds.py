@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+
+# Part of Latex-Suite
+#
+# Description:
+#   This file computes the folds of MakeTexFolds() in python. Every line is
+#   matched once against the patterns of all fold items, and the result is
+#   kept by the text of the line, so that after an edit only the changed
+#   lines are matched again. The fold ranges are then found like
+#   MakeSyntaxFolds() of plugin/SyntaxFolds.vim finds them with search(),
+#   and created by vim with :fold.
+
+import bisect
+import re
+import sys
+
+
+# The characters of which every regexp needs one, except for the end of
+# comments.
+matchChars = re.compile(r'[\\%<>}]')
+
+# A comment line which may precede a section, see Tex_FoldSections().
+commentRulePattern = r'^%[% =-]*$'
+
+# The end of a section which is not the start of another one.
+sectionEndPattern = (r'^\s*\\(?:frontmatter|mainmatter|backmatter)|'
+                     r'^\s*\\begin\{thebibliography|^\s*\\endinput|'
+                     r'^\s*\\begin\{slide|^\s*\\(?:begin|end)\{document|'
+                     r'^\s*\\(?:(?:begin|end)\{appendix\}|appendix)')
+
+
+class LinePattern(object):
+    """ a pattern of a fold item, which is matched against single lines
+
+    plain and ruled are bit masks of the regexps of a FoldEngine. A line
+    matches the pattern if it matches one of them. The regexps in ruled
+    also match a line preceded by a comment rule, and the match then starts
+    at the comment rule.
+    """
+    def __init__(self, plain, ruled=0):
+        self.plain = plain
+        self.ruled = ruled
+        self.mask = plain | ruled
+
+
+class FoldItem(object):
+    """ the arguments of a call to AddSyntaxFoldItem() """
+    def __init__(self, start, end, startoff, endoff, skipstart=None, skipend=None):
+        self.start = start
+        self.end = end
+        self.startoff = startoff
+        self.endoff = endoff
+        self.skipstart = skipstart
+        self.skipend = skipend
+
+
+class LineIndex(object):
+    """ the lines at which the matches of a LinePattern start
+
+    The methods return len(lines) + 1 if there is no match, like s:MySearch()
+    of SyntaxFolds.vim.
+    """
+    def __init__(self, pattern, masks, rules, missing):
+        starts = set()
+        self.ends = {}
+        for (lnum, mask) in masks:
+            if mask & pattern.mask:
+                starts.add(lnum)
+            if mask & pattern.ruled and lnum - 1 in rules:
+                starts.add(lnum - 1)
+                self.ends[lnum - 1] = lnum
+        self.starts = sorted(starts)
+        self.missing = missing
+
+    def first(self, lnum):
+        """ returns the first match at or after line lnum """
+        i = bisect.bisect_left(self.starts, lnum)
+        if i < len(self.starts):
+            return self.starts[i]
+        return self.missing
+
+    def after(self, lnum):
+        """ returns the first match after line lnum """
+        i = bisect.bisect_right(self.starts, lnum)
+        if i < len(self.starts):
+            return self.starts[i]
+        return self.missing
+
+    def end(self, lnum):
+        """ returns the line at which the match starting at lnum ends """
+        return self.ends.get(lnum, lnum)
+
+
+def inRegions(lnum, regions):
+    for (first, last) in regions:
+        if first <= lnum <= last:
+            return True
+    return False
+
+
+def wordIn(word, lst):
+    return re.search(r'(?<!\w)' + re.escape(word) + r'(?!\w)', lst) is not None
+
+
+class FoldEngine(object):
+    """ the fold items of MakeTexFolds() for a set of g:Tex_Folded* options
+
+    All regexps of the items are numbered, and every line is described by
+    the bit mask of the regexps it matches. The masks are cached by the text
+    of the lines.
+    """
+    def __init__(self, misc, commands, environments, sections, maxcache=200000):
+        self.regexps = []
+        self.bits = {}
+        self.maxcache = maxcache
+        self.cache = {}
+        # Whether a line without any of the characters of matchChars can
+        # match one of the regexps.
+        self.anyLine = False
+        self.rule = self.bit(commentRulePattern)
+        self.items = []
+        self.addItems(misc, commands, environments, sections)
+
+    def bit(self, regexp):
+        """ returns the bit of a regexp, numbering it if it is new """
+        if regexp not in self.bits:
+            self.bits[regexp] = 1 << len(self.regexps)
+            self.regexps.append(re.compile(regexp))
+        return self.bits[regexp]
+
+    def pattern(self, plain, ruled=()):
+        mask = 0
+        for regexp in plain:
+            mask |= self.bit(regexp)
+        rulemask = 0
+        for regexp in ruled:
+            rulemask |= self.bit(regexp)
+        return LinePattern(mask, rulemask)
+
+    def add(self, start, end, startoff, endoff, skipstart=None, skipend=None):
+        if skipstart is not None:
+            skipstart = self.pattern([skipstart])
+            skipend = self.pattern([skipend])
+        self.items.append(FoldItem(self.pattern([start]), self.pattern([end]),
+                                   startoff, endoff, skipstart, skipend))
+
+    def addSections(self, sections):
+        """ adds the items of Tex_FoldSections(), the deepest first """
+        levels = []
+        for level in sections.split(','):
+            if '%%fakesection' in level:
+                levels.append(([r'^\s*' + re.escape(level)], []))
+            else:
+                labels = []
+                for label in level.split('|'):
+                    labels.append(r'\\' + re.escape(label))
+                    labels.append(re.escape('%%fake' + label))
+                levels.append(([], [r'^\s*(?:%s)(?:\W|$)' % '|'.join(labels)]))
+        for depth in range(len(levels) - 1, -1, -1):
+            (plain, ruled) = levels[depth]
+            endplain = [sectionEndPattern]
+            endruled = []
+            for (p, r) in levels[:depth + 1]:
+                endplain.extend(p)
+                endruled.extend(r)
+            self.items.append(FoldItem(self.pattern(plain, ruled),
+                                       self.pattern(endplain, endruled), 0, -1))
+
+    def addItems(self, misc, commands, environments, sections):
+        """ adds the fold items in the order of MakeTexFolds() """
+        lists = r'(?:enumerate|itemize|description)'
+        if wordIn('comments', misc):
+            self.add(r'^%.', r'^[^%]', 0, -1)
+            self.anyLine = True
+        if wordIn('item', misc):
+            self.add(r'^\s*\\item', r'^\s*\\item|^\s*\\end\{%s\}' % lists, 0, -1,
+                     r'^\s*\\begin\{%s\}' % lists, r'^\s*\\end\{%s\}' % lists)
+        if wordIn('title', misc):
+            self.add(r'^\s*\\title\W', r'^\s*\\maketitle', 0, 0)
+
+        for name in commands.split(','):
+            if name:
+                # Only commands which do not end on the same line.
+                self.add(r'^\s*\\%s\{[^{}]*$' % re.escape(name), r'^[^}]*\}', 0, 0)
+        for name in environments.split(','):
+            if name:
+                start = r'^\s*\\begin\{' + re.escape(name)
+                end = r'(?:^|\s)\s*\\end\{' + re.escape(name)
+                if re.search('itemize|enumerate|description|align|gather', name):
+                    # These environments can nest.
+                    self.add(start, end, 0, 0, start, end)
+                else:
+                    self.add(start, end, 0, 0)
+
+        if sections:
+            self.addSections(sections)
+        if wordIn('slide', misc):
+            self.add(r'^\s*\\begin\{slide',
+                     r'^\s*\\appendix\W|^\s*\\chapter\W|^\s*\\end\{slide|^\s*\\end\{document',
+                     0, 0)
+        if wordIn('preamble', misc):
+            self.add(r'^\s*\\document(?:class|style)\b', r'^\s*\\begin\{document\}', 0, -1)
+        if re.search(r'(?:^|,)<<<(?:,|$)', misc):
+            self.add(r'<<<', r'>>>', 0, 0)
+
+    def classify(self, line):
+        """ returns the bit mask of the regexps matching a line """
+        mask = self.cache.get(line)
+        if mask is None:
+            mask = 0
+            # Most lines do not contain any of the characters the regexps
+            # need.
+            if self.anyLine or matchChars.search(line):
+                for (i, regexp) in enumerate(self.regexps):
+                    if regexp.search(line):
+                        mask |= 1 << i
+            if len(self.cache) >= self.maxcache:
+                self.cache.clear()
+            self.cache[line] = mask
+        return mask
+
+    def folds(self, masks, nlines):
+        """ returns the folds of the lines described by their masks
+
+        masks is a list of (lnum, mask) for the lines whose mask is not 0.
+        The folds are (first, last) pairs in the order in which
+        MakeSyntaxFolds() creates them.
+        """
+        masks = [(lnum, mask) for (lnum, mask) in masks if mask]
+        rules = set(lnum for (lnum, mask) in masks if mask & self.rule)
+        indices = {}
+
+        def index(pattern):
+            key = (pattern.plain, pattern.ruled)
+            if key not in indices:
+                indices[key] = LineIndex(pattern, masks, rules, nlines + 1)
+            return indices[key]
+
+        folds = []
+        for item in self.items:
+            if item.skipstart is not None:
+                self.foldWithSkip(item, index, masks, folds)
+            else:
+                self.foldNoSkip(item, index(item.start), index(item.end),
+                                1, nlines, [], folds)
+        return folds
+
+    def foldNoSkip(self, item, starts, ends, line1, line2, skipped, folds):
+        """ adds the folds of an item between two lines, see
+        s:FoldRegionsWithNoSkip() """
+        begin = starts.first(line1)
+        while begin <= line2:
+            if inRegions(begin, skipped):
+                begin = starts.after(begin)
+                continue
+            end = ends.after(starts.end(begin))
+            while inRegions(end, skipped) and end <= line2:
+                end = ends.after(end)
+            if end > line2:
+                folds.append((begin + item.startoff, line2))
+                break
+            folds.append((begin + item.startoff, end + item.endoff))
+            begin = starts.first(end)
+
+    def foldWithSkip(self, item, index, masks, folds):
+        """ adds the folds of an item which can nest, see
+        s:FoldRegionsWithSkip() """
+        starts = index(item.start)
+        ends = index(item.end)
+        begins = []
+        regions = []
+        for (lnum, mask) in masks:
+            if mask & item.skipend.mask:
+                if begins:
+                    first = begins.pop()
+                    skipped = regions.pop()
+                    self.foldNoSkip(item, starts, ends, first, lnum, skipped, folds)
+                    if regions:
+                        regions[-1].append((first, lnum))
+            elif mask & item.skipstart.mask:
+                begins.append(lnum)
+                regions.append([])
+
+
+class BufferFolds(object):
+    """ the folds of a buffer, computed again only if it changed """
+    def __init__(self):
+        self.changedtick = None
+        self.engine = None
+        self.lines = []
+        self.masks = []
+        self.folds = []
+
+    def update(self, engine, lines, changedtick=None):
+        """ returns the folds of the lines of the buffer
+
+        If changedtick is the one of the last call, the lines are not looked
+        at. Otherwise only the lines between the unchanged lines at the
+        start and the end of the buffer are classified again.
+        """
+        if changedtick is not None and changedtick == self.changedtick \
+                and engine is self.engine:
+            return self.folds
+        if engine is not self.engine:
+            (self.lines, self.masks) = ([], [])
+        old = self.lines
+        n = min(len(old), len(lines))
+        head = 0
+        while head < n and old[head] == lines[head]:
+            head += 1
+        tail = 0
+        while tail < n - head and old[-1 - tail] == lines[-1 - tail]:
+            tail += 1
+        middle = [engine.classify(line) for line in lines[head:len(lines) - tail]]
+        self.masks = self.masks[:head] + middle + self.masks[len(old) - tail:]
+        self.lines = list(lines)
+        self.engine = engine
+        self.changedtick = changedtick
+        self.folds = engine.folds(
+            [(lnum + 1, mask) for (lnum, mask) in enumerate(self.masks) if mask],
+            len(lines))
+        return self.folds
+
+
+engines = {}
+buffers = {}
+
+
+def getEngine(misc, commands, environments, sections):
+    key = (misc, commands, environments, sections)
+    if key not in engines:
+        engines[key] = FoldEngine(misc, commands, environments, sections)
+    return engines[key]
+
+
+def getFolds(bufnr, lines, changedtick, misc, commands, environments, sections):
+    """ returns the folds of a buffer, see BufferFolds.update() """
+    if bufnr not in buffers:
+        buffers[bufnr] = BufferFolds()
+    engine = getEngine(misc, commands, environments, sections)
+    return buffers[bufnr].update(engine, lines, changedtick)
+
+
+def foldCommands(folds, chunk=500):
+    """ returns the :fold commands which create folds, joined by | in chunks
+
+    The folds are created in the order of MakeSyntaxFolds(), which opens
+    all folds after creating one, so that the range of the next fold is not
+    extended to a closed fold it starts or ends in.
+    """
+    commands = ['%d,%dfold|%d,%dfoldopen' % (first, last, first, last)
+                for (first, last) in folds]
+    return ['|'.join(commands[i:i + chunk]) for i in range(0, len(commands), chunk)]
+
+
+def makeFolds():
+    """ creates the folds of MakeTexFolds() in the current buffer of vim """
+    import vim
+
+    buf = vim.current.buffer
+    folds = getFolds(buf.number, buf[:], int(vim.eval('b:changedtick')),
+                     vim.eval('g:Tex_FoldedMisc'), vim.eval('g:Tex_FoldedCommands'),
+                     vim.eval('g:Tex_FoldedEnvironments'),
+                     vim.eval('g:Tex_FoldedSections'))
+    for command in foldCommands(folds):
+        vim.command(command)
+    return len(folds)
+
+
+def defaultOptions():
+    return ('item,slide,preamble,<<<', '',
+            'verbatim,comment,eq,gather,align,figure,table,thebibliography,'
+            'keywords,abstract,titlepage',
+            'part,chapter,section,subsection,subsubsection,paragraph')
+
+
+def readLines(fname):
+    with open(fname, 'rb') as fp:
+        contents = fp.read()
+    try:
+        contents = contents.decode('utf-8')
+    except UnicodeDecodeError:
+        contents = contents.decode('latin1')
+    return contents.split('\n')[:-1] if contents.endswith('\n') else contents.split('\n')
+
+
+# Lines of a vim script which define s:Folds(), returning the folds of the
+# current buffer as 'first,last', level by level. Folds of a single line are
+# only closed with 'foldminlines' at 0.
+vimFoldsFunction = [
+    'function! s:Folds()',
+    '\tsetlocal foldminlines=0',
+    '\tlet folds = []',
+    '\tlet level = 0',
+    '\twhile 1',
+    '\t\tlet &l:foldlevel = level',
+    "\t\tlet closed = filter(range(1, line('$')), 'foldclosed(v:val) == v:val')",
+    '\t\tif closed == []',
+    '\t\t\treturn folds',
+    '\t\tendif',
+    "\t\tcall extend(folds, map(closed, 'v:val.\",\".foldclosedend(v:val)'))",
+    '\t\tlet level += 1',
+    '\tendwhile',
+    'endfunction',
+]
+
+
+def benchmark(fname, repeat=5):
+    """ times computing the folds of a file, from scratch, unchanged and
+    after changing one line in the middle, and MakeTexFolds() of vim
+    without python
+
+    Returns a summary and a list of the failures: the folds of the changed
+    file must be the ones computed from scratch, and the folds of the file
+    the ones MakeSyntaxFolds() creates in a vim started for it.
+    """
+    import os
+    import shutil
+    import tempfile
+
+    import texbackend
+
+    lines = readLines(fname)
+    options = defaultOptions()
+    timings = []
+    failures = []
+
+    def fromScratch():
+        engines.clear()
+        buffers.clear()
+        return getFolds(0, lines, 1, *options)
+
+    (first, folds) = texbackend.bestTime(fromScratch, 1)
+    timings.append(('first', first))
+    timings.append(('unchanged', texbackend.bestTime(
+        lambda: getFolds(0, lines, 1, *options), repeat)[0]))
+
+    def changeLine():
+        lines[len(lines) // 2] += ' x'
+        return getFolds(0, lines, None, *options)
+
+    (changed, refolded) = texbackend.bestTime(changeLine, repeat)
+    timings.append(('one line changed', changed))
+    if refolded != fromScratch():
+        failures.append('the folds after changing a line differ from scratch')
+
+    # vim folds the file with MakeTexFolds() and then with the folds of
+    # python, and writes the folds of both.
+    plugin = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    tmpdir = tempfile.mkdtemp()
+    output = os.path.join(tmpdir, 'folds')
+    try:
+        vim = texbackend.bestVimTime(
+            ['call MakeTexFolds(1, 1)'], repeat,
+            ['call writefile(s:Folds(), %s)' % texbackend.vimString(output + '.vim'),
+             'normal! zE'] + foldCommands(folds) +
+            ['call writefile(s:Folds(), %s)' % texbackend.vimString(output + '.py')],
+            ['exe "source" fnameescape(%s)' % texbackend.vimString(
+                os.path.join(os.path.dirname(plugin), 'plugin', 'SyntaxFolds.vim')),
+             'exe "source" fnameescape(%s)' % texbackend.vimString(
+                 os.path.join(plugin, 'latex-suite', 'folding.vim')),
+             'function! Tex_UsePython()', '\treturn 0', 'endfunction',
+             'function! Tex_GetVarValue(name, ...)',
+             "\treturn exists('g:'.a:name) ? g:{a:name} : (a:0 ? a:1 : '')",
+             'endfunction',
+             'function! Tex_Debug(...)', 'endfunction'] + vimFoldsFunction +
+            ['exe "edit" fnameescape(%s)' % texbackend.vimString(fname),
+             'setlocal ft=tex'])
+        timings.append(('vim', vim))
+        with open(output + '.vim') as fp:
+            vimFolds = sorted(fp.read().split())
+        with open(output + '.py') as fp:
+            pythonFolds = sorted(fp.read().split())
+    finally:
+        shutil.rmtree(tmpdir)
+    if vimFolds != pythonFolds:
+        failures.append('folds of MakeSyntaxFolds() only: %s; of python only: %s' % (
+            ' '.join(sorted(set(vimFolds) - set(pythonFolds))),
+            ' '.join(sorted(set(pythonFolds) - set(vimFolds)))))
+
+    return ('%d lines, %d folds: %s' % (len(lines), len(folds), ', '.join(
+        '%s %.4f s' % timing for timing in timings)), failures)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == '--benchmark':
+        import texbackend
+
+        (summary, failures) = benchmark(sys.argv[2])
+        texbackend.exitChecks(failures, summary)
+    else:
+        lines = readLines(sys.argv[1])
+        for command in foldCommands(getFolds(0, lines, None, *defaultOptions())):
+            print(command)
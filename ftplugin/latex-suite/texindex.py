@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+
+# Part of Latex-Suite
+#
+# Description:
+#   This file keeps an index of the labels, sections, citation keys and
+#   included files of latex projects in the python process hosted by vim.
+#   The index is refreshed by a background thread which polls the
+#   modification times of all files used, so that completions are answered
+#   from memory.
+
+import os
+import sys
+import threading
+import time
+
+import outline
+import auxoutline
+import bibtools
+import texdeps
+
+
+# Guards the indices and the counters of the service. The background thread
+# builds the parts of an index from the files directly, and leaves the file
+# caches of outline and auxoutline to vim.
+lock = threading.RLock()
+# Bibtex files are read holding only this lock, so that outline completions
+# are not blocked while the background thread reads them. It is always taken
+# before lock.
+biblock = threading.Lock()
+
+
+def stamp(path):
+    """ returns the modification time and size of a file, None if missing """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+
+def changed(stamps):
+    """ returns whether any of the files of a dictionary of stamps changed """
+    for path, st in stamps.items():
+        if stamp(path) != st:
+            return True
+    return False
+
+
+class ProjectIndex(object):
+    """ the index of a latex project given by its main file
+
+    The index is made of three parts which are refreshed independently: the
+    sections and labels of the latex files, the sections and labels of the
+    .aux file, and the entries of the bibtex files. Every part remembers the
+    stamps of the files it was built from, and is only built again if one of
+    them changed. The part of the latex files is only built when it is asked
+    for, since completions find labels with texscan.
+    """
+    def __init__(self, mainfile):
+        self.mainfile = os.path.abspath(mainfile)
+        self.root = os.path.dirname(self.mainfile)
+        self.used = time.time()
+
+        self.texstamps = None
+        self.sections = None
+        self.includes = {}
+
+        self.auxstamps = None
+        self.auxtree = None
+
+        self.bibnames = []
+        self.bibstamps = None
+        self.bibfile = None
+        self.bibcache = None
+
+    def refreshtex(self):
+        if self.texstamps is not None and not changed(self.texstamps):
+            return
+        (lines, deps) = outline.getLineTable(self.mainfile, root=self.root)
+        self.sections = outline.buildSectionTree(lines)
+
+        self.includes = texdeps.getGraph(self.mainfile).includes()
+        self.texstamps = dict((path, stamp(path)) for path in deps)
+
+    def refreshaux(self):
+        # LaTeX writes all .aux files of a document in every run, so the
+        # main .aux file tells whether any of them changed.
+        auxname = os.path.splitext(self.mainfile)[0] + '.aux'
+        if self.auxstamps is not None and not changed(self.auxstamps):
+            return
+        self.auxstamps = {auxname: stamp(auxname)}
+        self.auxtree = auxoutline.readAuxTree(os.path.basename(auxname), self.root)
+
+    def refreshbib(self, processes=0):
+        """ reads the bibtex files again if one of them changed
+
+        The files are read without holding lock, and the new BibFile
+        replaces the old one when it is complete.
+        """
+        with biblock:
+            with lock:
+                bibnames = self.bibnames
+                if not bibnames:
+                    return
+                if self.bibfile is not None and not changed(self.bibstamps):
+                    return
+                cache = self.bibcache
+            stamps = dict((path, stamp(path)) for path in bibnames)
+            bibfile = bibtools.BibFile('\n'.join(bibnames), cache, processes)
+            with lock:
+                if bibnames == self.bibnames:
+                    (self.bibstamps, self.bibfile) = (stamps, bibfile)
+
+    def refresh(self):
+        """ builds the parts of the .aux and the bibtex files again if their
+        files changed
+
+        This is what the background thread does. The part of the latex
+        files is left to getlabels() and getincludes(), since it is built
+        with the file cache of outline.
+        """
+        with lock:
+            self.refreshaux()
+        self.refreshbib()
+
+    def getoutline(self, prefix):
+        """ returns the outline of the labels of the .aux file
+
+        The result is the same as the one of auxoutline.main().
+        """
+        with lock:
+            self.used = time.time()
+            self.refreshaux()
+            return auxoutline.complete(self.auxtree, prefix)
+
+    def getbibfile(self, bibnames, cache=None, processes=0):
+        """ returns the BibFile of the given bibtex files
+
+        The entries are only read again if the list of files or one of the
+        files changed. All filters and sort fields of the last completion
+        are removed.
+        """
+        with lock:
+            self.used = time.time()
+            bibnames = [os.path.abspath(name) for name in bibnames]
+            if bibnames != self.bibnames:
+                self.bibnames = bibnames
+                self.bibfile = None
+            self.bibcache = cache
+        if not bibnames:
+            return bibtools.BibFile()
+        self.refreshbib(processes)
+        with lock:
+            bibfile = self.bibfile
+        bibfile.reset()
+        return bibfile
+
+    def getlabels(self, prefix=''):
+        """ returns (label, file, line, text) for all labels of the sources """
+        with lock:
+            self.used = time.time()
+            self.refreshtex()
+            return [(label.name, label.fname, label.lineno, label.text)
+                    for (sec, label) in self.sections.labels()
+                    if label.name.startswith(prefix)]
+
+    def getincludes(self):
+        """ returns the files included by every file of the project """
+        with lock:
+            self.used = time.time()
+            self.refreshtex()
+            return dict(self.includes)
+
+
+class IndexService(object):
+    """ the indices of all projects and the thread which refreshes them
+
+    Projects which were not used for maxidle seconds are dropped.
+    """
+    def __init__(self, interval=2.0, maxidle=3600):
+        self.interval = interval
+        self.maxidle = maxidle
+        self.projects = {}
+        self.thread = None
+        self.stats = {'refreshes': 0, 'errors': 0}
+
+    def get(self, mainfile):
+        """ returns the index of a project, creating it if needed """
+        path = os.path.abspath(mainfile)
+        with lock:
+            index = self.projects.get(path)
+            if index is None:
+                index = self.projects[path] = ProjectIndex(path)
+            self.start()
+        return index
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.run,
+                                           name='latex-suite index')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with lock:
+                now = time.time()
+                for path, index in list(self.projects.items()):
+                    if now - index.used > self.maxidle:
+                        del self.projects[path]
+                projects = list(self.projects.values())
+            for index in projects:
+                try:
+                    index.refresh()
+                    counter = 'refreshes'
+                except Exception:
+                    # The next query builds the index in the foreground and
+                    # reports any error there.
+                    counter = 'errors'
+                with lock:
+                    self.stats[counter] += 1
+
+
+service = IndexService()
+
+
+def setinterval(interval):
+    """ sets the polling interval in seconds, 0 disables the thread """
+    service.interval = interval
+    if interval > 0 and service.projects:
+        service.start()
+
+
+def outlinecompletion(mainfile, prefix):
+    """ returns the result of auxoutline.main() for the project of mainfile
+
+    If the index cannot be used, auxoutline.main() is called instead.
+    """
+    try:
+        return service.get(mainfile).getoutline(prefix)
+    except Exception:
+        return auxoutline.main(mainfile, prefix)
+
+
+def bibfile(mainfile, bibnames, cache=None, processes=0):
+    """ returns the BibFile of the bibtex files of the project of mainfile
+
+    bibnames is a newline separated list of files as for bibtools.BibFile.
+    If the index cannot be used, a new BibFile is returned.
+    """
+    bibnames = bibnames.splitlines()
+    try:
+        return service.get(mainfile).getbibfile(bibnames, cache, processes)
+    except Exception:
+        return bibtools.BibFile('\n'.join(bibnames), cache, processes)
+
+
+def getstats():
+    """ returns a summary of the index """
+    with lock:
+        return 'projects: %d, refreshes: %d, errors: %d' % (
+            len(service.projects), service.stats['refreshes'],
+            service.stats['errors'])
+
+
+def benchmark(mainfile, prefix='', repeat=20):
+    """ times outline completions from the index and from auxoutline
+
+    Returns a summary and a list of the failures: the index must give the
+    outline of auxoutline.main().
+    """
+    import texbackend
+
+    index = service.get(mainfile)
+    (indexed, outline) = texbackend.bestTime(lambda: index.getoutline(prefix), repeat)
+    (direct, expected) = texbackend.bestTime(lambda: auxoutline.main(mainfile, prefix), repeat)
+    failures = []
+    if outline != expected:
+        failures.append('the outline of the index differs from auxoutline.main()')
+    return ('best of %d: index %.4f s, auxoutline %.4f s' % (repeat, indexed, direct),
+            failures)
+
+
+if __name__ == "__main__":
+    import texbackend
+
+    setinterval(0)
+    if len(sys.argv) > 2:
+        prefix = sys.argv[2]
+    else:
+        prefix = ''
+    (summary, failures) = benchmark(os.path.abspath(sys.argv[1]), prefix)
+    texbackend.exitChecks(failures, summary)
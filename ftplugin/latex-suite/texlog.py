@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+
+# Part of Latex-Suite
+#
+# Description:
+#   This file reads the errors and warnings of a latex run from its .log file
+#   for the quickfix list, instead of the 'efm' of compiler/tex.vim. The log
+#   is read line by line, keeping track of the files latex opens and closes
+#   with the parentheses it writes, so that every message is attributed to
+#   the file it was found in, also when lines are wrapped.
+
+import re
+import os
+import sys
+
+
+def logicalLines(fp, width=79):
+    """ yields the lines of a log file, joining the lines which tex wrapped
+
+    TeX wraps the lines it writes at width characters, so a line of exactly
+    that length is continued on the next one.
+    """
+    parts = []
+    for line in fp:
+        line = line.rstrip(b'\r\n')
+        if len(line) == width:
+            parts.append(line)
+            continue
+        if parts:
+            parts.append(line)
+            line = b''.join(parts)
+            parts = []
+        yield line
+    if parts:
+        yield b''.join(parts)
+
+
+errorPattern = re.compile(br'! (?:LaTeX Error: )?(.*)')
+fileLineErrorPattern = re.compile(br'((?:[A-Za-z]:)?[^\s:][^:]*):(\d+): (.*)')
+contextPattern = re.compile(br'l\.(\d+)')
+warningPattern = re.compile(br'(?:LaTeX|Package|Class)\b.*?Warning: ')
+warningLinePattern = re.compile(br'(?:on input line|line) (\d+)')
+continuationPattern = re.compile(br'\([^()\s]*\) +\S')
+boxPattern = re.compile(br'(?:Over|Under)full \\[hv]box')
+boxLinePattern = re.compile(br' at lines? (\d+)')
+parenPattern = re.compile(br'\(("[^"]*"|[^\s()]*)|\)')
+fileNamePattern = re.compile(br'(?:\.{0,2}/|[A-Za-z]:[\\/]|~)|[^\d].*\.[A-Za-z]\w*$')
+
+# Messages which do not end before the next empty line are cut off after
+# this many lines.
+maxMessageLines = 50
+
+
+def ignorePattern(patterns):
+    """ returns a regexp for a list of g:Tex_IgnoredWarnings patterns
+
+    In the patterns, %.%# stands for any text as in the 'efm'. A line
+    which contains one of them is ignored.
+    """
+    alternatives = []
+    for pattern in patterns:
+        if not isinstance(pattern, bytes):
+            pattern = pattern.encode('utf-8')
+        pattern = pattern.replace(b'%%', b'%')
+        alternatives.append(b'.*'.join(re.escape(part) for part in pattern.split(b'%.%#')))
+    if not alternatives:
+        return None
+    return re.compile(b'|'.join(alternatives))
+
+
+def decode(text):
+    """ returns a line of the log as a string """
+    if str is bytes:
+        return text
+    try:
+        return text.decode('utf-8')
+    except UnicodeDecodeError:
+        return text.decode('latin1')
+
+
+def skipMessage(lines):
+    """ consumes the lines of a message up to the next empty line
+
+    Returns the number of the first input line given as l.<lineno>, or 0.
+    """
+    lineno = 0
+    for i in range(maxMessageLines):
+        line = next(lines, b'')
+        if not line:
+            break
+        if not lineno:
+            m = contextPattern.match(line)
+            if m:
+                lineno = int(m.group(1))
+    return lineno
+
+
+def parseLog(fp, ignored=(), width=79):
+    """ yields (fname, lineno, type, text) for the messages of a log file
+
+    fp is a log file opened in binary mode, ignored a list of patterns of
+    g:Tex_IgnoredWarnings. type is 'E' for errors and 'W' for warnings and
+    over- or underfull boxes. fname is the name of the file the message is
+    attributed to as written in the log, or None if it is not known. text
+    is the whole first line of the message, or for package warnings all
+    their lines joined, and is what the ignored patterns are searched in.
+    """
+    ignore = ignorePattern(ignored)
+    lines = logicalLines(fp, width)
+    # The files opened by latex, None for parentheses which do not open a
+    # file.
+    stack = []
+
+    def current():
+        for fname in reversed(stack):
+            if fname is not None:
+                return fname
+        return None
+
+    pending = None
+    while True:
+        if pending is not None:
+            (line, pending) = (pending, None)
+        else:
+            line = next(lines, None)
+            if line is None:
+                break
+        if not line:
+            continue
+
+        if line.startswith(b'! '):
+            text = errorPattern.match(line).group(1)
+            lineno = skipMessage(lines)
+            if ignore is None or not ignore.search(line):
+                yield (current(), lineno, 'E', text)
+            continue
+
+        m = fileLineErrorPattern.match(line)
+        if m:
+            skipMessage(lines)
+            if ignore is None or not ignore.search(line):
+                yield (m.group(1), int(m.group(2)), 'E', m.group(3))
+            continue
+
+        if warningPattern.match(line):
+            # Package warnings are continued on lines starting with the
+            # name of the package in parentheses, which end with the input
+            # line. They are joined into a single message.
+            text = line
+            following = next(lines, b'')
+            m = continuationPattern.match(following)
+            while m:
+                text = text + b' ' + following[m.end() - 1:]
+                following = next(lines, b'')
+                m = continuationPattern.match(following)
+            if ignore is None or not ignore.search(text):
+                m = warningLinePattern.search(text)
+                yield (current(), m and int(m.group(1)) or 0, 'W', text)
+            pending = following
+            continue
+
+        if boxPattern.match(line):
+            # The box is followed by its contents up to the next empty line,
+            # whose parentheses are not files.
+            skipMessage(lines)
+            if ignore is None or not ignore.search(line):
+                m = boxLinePattern.search(line)
+                yield (current(), m and int(m.group(1)) or 0, 'W', line)
+            continue
+
+        if b'(' not in line and b')' not in line:
+            continue
+        for m in parenPattern.finditer(line):
+            if m.group(0) == b')':
+                if stack:
+                    stack.pop()
+            else:
+                fname = m.group(1).strip(b'"')
+                if fname and fileNamePattern.match(fname):
+                    stack.append(fname)
+                else:
+                    stack.append(None)
+
+
+def readLog(logfile, ignored=(), width=79):
+    """ returns (fname, lineno, type, text) for the messages of a log file
+
+    The file names are made absolute relative to the directory of the log
+    file.
+    """
+    root = os.path.dirname(os.path.abspath(logfile))
+    names = {}
+    entries = []
+    try:
+        fp = open(logfile, 'rb')
+    except IOError:
+        return entries
+    with fp:
+        for (fname, lineno, kind, text) in parseLog(fp, ignored, width):
+            if fname is not None:
+                if fname not in names:
+                    names[fname] = os.path.normpath(os.path.join(root, decode(fname)))
+                fname = names[fname]
+            entries.append((fname, lineno, kind, decode(text)))
+    return entries
+
+
+def setLogQuickfix(logfile, ignored=()):
+    """ sets the quickfix list of vim to the messages of a log file """
+    import vimbridge
+
+    items = []
+    for (fname, lineno, kind, text) in readLog(logfile, ignored):
+        item = {'lnum': lineno, 'type': kind, 'text': text}
+        if fname is not None:
+            item['filename'] = fname
+        items.append(item)
+    return vimbridge.setQuickfixList(items, ' ')
+
+
+# A log of pdflatex, used by selftest() and benchmark(). It has a file name and a warning
+# wrapped at 79 characters, and package warnings continued on more lines.
+sampleLog = br"""This is pdfTeX, Version 3.141592653-2.6-1.40.25 (TeX Live 2023) (preloaded format=pdflatex)
+entering extended mode
+ restricted \write18 enabled.
+ %&-line parsing enabled.
+**sample.tex
+(./sample.tex
+LaTeX2e <2022-11-01> patch level 1
+L3 programming layer <2023-02-22>
+(/usr/local/texlive/2023/texmf-dist/tex/latex/base/article.cls
+Document Class: article 2022/07/02 v1.4n Standard LaTeX document class
+(/usr/local/texlive/2023/texmf-dist/tex/latex/base/size10.clo
+File: size10.clo 2022/07/02 v1.4n Standard LaTeX file (size option)
+)
+\c@part=\count185
+)
+(/usr/local/texlive/2023/texmf-dist/tex/latex/hyperref/hyperref.sty
+Package: hyperref 2023-02-07 v7.00v Hypertext links for LaTeX
+)
+(./sample.aux)
+(./chapters/introduction-and-motivation-of-the-problem/overview-of-the-system.t
+ex
+
+LaTeX Warning: Reference `sec:missing' on page 1 undefined on input line 7.
+
+
+Package hyperref Warning: Token not allowed in a PDF string (Unicode):
+(hyperref)                removing `math shift' on input line 9.
+
+
+Package biblatex Warning: Please (re)run Biber on the file:
+(biblatex)                sample
+(biblatex)                and rerun LaTeX afterwards.
+
+Overfull \hbox (15.0pt too wide) in paragraph at lines 14--16
+[]\OT1/cmr/m/n/10 A very long line (with parentheses) that does not fit
+ []
+
+! Undefined control sequence.
+l.18 \foo
+
+The control sequence at the end of the top line
+of your error message was never \def'ed.
+
+)
+
+LaTeX Warning: Reference `fig:overview-of-the-whole-system' on page 2 undefined
+ on input line 31.
+
+[1{/usr/local/texlive/2023/texmf-var/fonts/map/pdftex/updmap/pdftex.map}]
+(./sample.aux) )
+Output written on sample.pdf (2 pages, 31337 bytes).
+"""
+
+
+sampleChapter = b'./chapters/introduction-and-motivation-of-the-problem/overview-of-the-system.tex'
+sampleMessages = [
+    (sampleChapter, 7, 'W', b"LaTeX Warning: Reference `sec:missing' on page 1 undefined on input line 7."),
+    (sampleChapter, 9, 'W', b"Package hyperref Warning: Token not allowed in a PDF string (Unicode): "
+                      b"removing `math shift' on input line 9."),
+    (sampleChapter, 0, 'W', b"Package biblatex Warning: Please (re)run Biber on the file: "
+                      b"sample and rerun LaTeX afterwards."),
+    (sampleChapter, 14, 'W', b"Overfull \\hbox (15.0pt too wide) in paragraph at lines 14--16"),
+    (sampleChapter, 18, 'E', b"Undefined control sequence."),
+    (b'./sample.tex', 31, 'W', b"LaTeX Warning: Reference `fig:overview-of-the-whole-system' "
+                               b"on page 2 undefined on input line 31."),
+]
+
+
+def benchmark(logfile=None, repeat=5):
+    """ times reading a log file, sampleLog repeated 1000 times by default
+
+    Returns a summary and a list of the failures: the messages of the
+    repeated sample must be the ones of the sample, repeated.
+    """
+    import shutil
+    import tempfile
+
+    import texbackend
+
+    tmpdir = tempfile.mkdtemp()
+    failures = []
+    try:
+        if logfile is None:
+            logfile = os.path.join(tmpdir, 'sample.log')
+            with open(logfile, 'wb') as fp:
+                fp.write(sampleLog)
+            expected = readLog(logfile) * 1000
+            with open(logfile, 'wb') as fp:
+                fp.write(sampleLog * 1000)
+        else:
+            expected = None
+        size = os.path.getsize(logfile)
+        (best, entries) = texbackend.bestTime(lambda: readLog(logfile), repeat)
+    finally:
+        shutil.rmtree(tmpdir)
+    if expected is not None and entries != expected:
+        failures.append('the messages of the repeated sample differ')
+    errors = len([entry for entry in entries if entry[2] == 'E'])
+    return ('%d bytes, %d errors, %d warnings: best of %d %.4f s (%.1f MB/s)' % (
+        size, errors, len(entries) - errors, repeat, best,
+        size / best / 1e6 if best else 0), failures)
+
+
+def selftest():
+    """ checks the messages read from sampleLog, returns a list of the
+    failures """
+    import io
+
+    expected = sampleMessages
+    # The ignored patterns are found in a continued line, in a wrapped line
+    # and in the line of a box.
+    ignored = ['Overfull', 'rerun LaTeX', 'Reference %.%# on page 2']
+
+    failures = []
+    for (patterns, wanted) in (([], expected), (ignored, expected[:2] + expected[4:5])):
+        found = list(parseLog(io.BytesIO(sampleLog), patterns))
+        if len(found) != len(wanted):
+            failures.append('ignoring %r: %d messages instead of %d'
+                            % (patterns, len(found), len(wanted)))
+        for (entry, want) in zip(found, wanted):
+            if entry != want:
+                failures.append('ignoring %r: %r instead of %r' % (patterns, entry, want))
+    return failures
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in ('--selftest', '--benchmark'):
+        import texbackend
+
+        if sys.argv[1] == '--selftest':
+            texbackend.exitChecks(selftest())
+        (summary, failures) = benchmark(*sys.argv[2:3] + [int(arg) for arg in sys.argv[3:4]])
+        texbackend.exitChecks(failures, summary)
+    for (fname, lineno, kind, text) in readLog(sys.argv[1], sys.argv[2:]):
+        print('%s:%d: %s: %s' % (fname or '', lineno, kind, text))
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+# Part of Latex-Suite
+#
+# Description:
+#   This file finds the packages, commands and environments of a latex file
+#   for Tex_ScanForPackages() in packages.vim. The file is read in a single
+#   pass with its comments removed, so that \usepackage lines split across
+#   lines or commented out are handled like latex does. The results are
+#   kept by b:changedtick for buffers and by modification time for files.
+
+import hashlib
+import os
+import re
+import sys
+
+
+commentPattern = re.compile(r'(?<!\\)((?:\\\\)*)%.*')
+beginDocumentPattern = re.compile(r'\\begin\s*\{document\}')
+endDocumentPattern = re.compile(r'\\end\s*\{document\}')
+documentclassPattern = re.compile(
+    r'\\documentclass\s*(?:\[([^\]]*)\])?\s*\{([^}]*)\}')
+usepackagePattern = re.compile(
+    r'\\(?:usepackage|RequirePackage)\s*(?:\[([^\]]*)\])?\s*\{([^}]*)\}')
+newcommandPattern = re.compile(r'^[ \t]*\\newcommand\*?\{\\([^}]*)\}', re.M)
+newenvironmentPattern = re.compile(r'^[ \t]*\\newenvironment\*?\{([^}]*)\}', re.M)
+
+
+def stripComment(line):
+    """ returns a line without its comment, keeping escaped % """
+    if '%' not in line:
+        return line
+    return commentPattern.sub(r'\1', line)
+
+
+def splitList(text):
+    """ returns the items of a comma separated list, without whitespace """
+    return [item.strip() for item in text.split(',') if item.strip()]
+
+
+class Scan(object):
+    """ the packages, commands and environments found in a latex file
+
+    packages is a list of (name, options) in the order of the file, options
+    being the comma separated options of the \\usepackage line.
+    """
+    def __init__(self, documentclass='', classoptions='', packages=(),
+                 commands=(), environments=()):
+        self.documentclass = documentclass
+        self.classoptions = classoptions
+        self.packages = list(packages)
+        self.commands = list(commands)
+        self.environments = list(environments)
+
+    def key(self):
+        """ returns a digest of the scan, which changes with its result """
+        text = repr((self.documentclass, self.classoptions, self.packages,
+                     self.commands, self.environments))
+        return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+def scanLines(lines, whole=False):
+    """ returns the Scan of the lines of a latex file
+
+    As in Tex_ScanForPackages(), packages are looked for up to the line of
+    \\begin{document}, and commands and environments up to the line of
+    \\end{document}, nothing being found in a file without them. If whole
+    is true, as for package files, all lines are scanned.
+    """
+    text = [stripComment(line) for line in lines]
+    if whole:
+        preamble = body = len(text)
+    else:
+        preamble = body = 0
+        for (lnum, line) in enumerate(text):
+            if not preamble and '\\begin' in line and beginDocumentPattern.search(line):
+                preamble = lnum + 1
+            if preamble and '\\end' in line and endDocumentPattern.search(line):
+                body = lnum + 1
+                break
+    head = '\n'.join(text[:preamble])
+
+    scan = Scan()
+    m = documentclassPattern.search(head)
+    if m:
+        scan.documentclass = m.group(2).strip()
+        scan.classoptions = ','.join(splitList(m.group(1) or ''))
+    for m in usepackagePattern.finditer(head):
+        options = ','.join(splitList(m.group(1) or ''))
+        for name in splitList(re.sub(r'\s+', '', m.group(2))):
+            scan.packages.append((name, options))
+
+    if body:
+        if body > preamble:
+            head = head + '\n' + '\n'.join(text[preamble:body])
+        scan.commands = newcommandPattern.findall(head)
+        scan.environments = newenvironmentPattern.findall(head)
+    return scan
+
+
+def readLines(fname):
+    with open(fname, 'rb') as fp:
+        contents = fp.read()
+    try:
+        contents = contents.decode('utf-8')
+    except UnicodeDecodeError:
+        contents = contents.decode('latin1')
+    return contents.splitlines()
+
+
+# The last scan of every buffer and file, by (source, whole), with the
+# changedtick or modification time it was made for.
+scans = {}
+
+
+def cachedScan(source, stamp, whole, getLines):
+    cached = scans.get((source, whole))
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    scan = scanLines(getLines(), whole)
+    scans[(source, whole)] = (stamp, scan)
+    return scan
+
+
+def scanFile(fname, whole=False):
+    """ returns the Scan of a file, which is read again only if it changed """
+    fname = os.path.abspath(fname)
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return Scan()
+    return cachedScan(fname, (st.st_mtime, st.st_size), whole,
+                      lambda: readLines(fname))
+
+
+def scanBuffer(buf, changedtick, whole=False):
+    """ returns the Scan of a vim buffer, which is scanned again only if
+    changedtick changed """
+    return cachedScan(('buffer', buf.number), changedtick, whole,
+                      lambda: buf[:])
+
+
+def setScanResult(scan):
+    """ sets the local variable retval of vim to a dictionary of a Scan """
+    import vimbridge
+
+    vimbridge.setVar('retval', {
+        'key': scan.key(), 'documentclass': scan.documentclass,
+        'classoptions': scan.classoptions,
+        'packages': [[name, options] for (name, options) in scan.packages],
+        'commands': list(scan.commands),
+        'environments': list(scan.environments)})
+
+
+def setBufferScan(whole=False):
+    """ scans the current buffer of vim, see setScanResult() """
+    import vim
+
+    buf = vim.current.buffer
+    setScanResult(scanBuffer(buf, int(vim.eval('b:changedtick')), whole))
+
+
+def setFileScan(fname, whole=False):
+    """ scans a file, see setScanResult()
+
+    If the file is loaded in vim, its buffer is scanned instead, so that
+    changes which were not written are seen.
+    """
+    import vim
+
+    path = os.path.abspath(fname)
+    for buf in vim.buffers:
+        if buf.name and os.path.abspath(buf.name) == path \
+                and int(vim.eval('bufloaded(%d)' % buf.number)):
+            changedtick = int(vim.eval('getbufvar(%d, "changedtick")' % buf.number))
+            setScanResult(scanBuffer(buf, changedtick, whole))
+            return
+    setScanResult(scanFile(path, whole))
+
+
+def benchmark(fname, repeat=5):
+    """ times scanning a file, and looking it up again unchanged
+
+    Returns a summary and a list of the failures: the scan looked up must be
+    the one of the lines of the file.
+    """
+    import texbackend
+
+    lines = readLines(fname)
+    (best, scan) = texbackend.bestTime(lambda: scanLines(lines), repeat)
+    scanFile(fname)
+    (cached, found) = texbackend.bestTime(lambda: scanFile(fname), 1)
+    failures = []
+    if found.key() != scan.key():
+        failures.append('the scan looked up differs from the scan of the lines')
+    return ('%d lines, %d packages: best of %d %.4f s, cached %.6f s' % (
+        len(lines), len(scan.packages), repeat, best, cached), failures)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == '--benchmark':
+        import texbackend
+
+        (summary, failures) = benchmark(sys.argv[2])
+        texbackend.exitChecks(failures, summary)
+    else:
+        scan = scanFile(sys.argv[1], '--whole' in sys.argv[2:])
+        print('documentclass: %s [%s]' % (scan.documentclass, scan.classoptions))
+        for (name, options) in scan.packages:
+            print('package: %s [%s]' % (name, options))
+        print('commands: %s' % ','.join(scan.commands))
+        print('environments: %s' % ','.join(scan.environments))
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+# Part of Latex-Suite
+#
+# Description:
+#   This file compiles the files of packages/ into the index packages.index,
+#   which Tex_pack_check() in packages.vim reads instead of sourcing the
+#   files. Only files which do nothing else than defining the option and
+#   command lists g:TeX_package_option_<name> and g:TeX_package_<name> are
+#   compiled, all others are sourced as before. The index has a line
+#       <name><Tab><guard><Tab><options><Tab><commands><Tab><size><Tab><sha256>
+#   for every compiled package, so that vim can read it with readfile().
+#   Vim uses an entry only while the file still has the size it had, and
+#   checks the digest of a file which is newer than the index, since git and
+#   cp do not keep the modification times of the files.
+#
+#   Run it after changing a file of packages/:
+#       python texpackindex.py
+#   or time loading the packages with and without the index:
+#       python texpackindex.py --benchmark
+
+import hashlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+
+indexHeader = '" latex-suite package index 3, made by texpackindex.py'
+
+guardIfPattern = re.compile(r'''^if\s+exists\(\s*(["'])(\w+)\1\s*\)$''')
+guardLetPattern = re.compile(r'^let\s+(?:g:)?(\w+)\s*=\s*1$')
+listLetPattern = re.compile(r'^let\s+(?:g:)?TeX_package_(option_)?(\w+)\s*=(.*)$')
+literalPattern = re.compile(r'''\s*(?:'((?:[^']|'')*)'|"((?:[^"\\]|\\[\\"])*)")\s*''')
+
+
+def parseConcatenation(expr):
+    """ returns the value of a concatenation of vim string literals
+
+    Returns None if expr is anything else.
+    """
+    parts = []
+    pos = 0
+    while True:
+        m = literalPattern.match(expr, pos)
+        if not m:
+            return None
+        if m.group(1) is not None:
+            parts.append(m.group(1).replace("''", "'"))
+        else:
+            parts.append(re.sub(r'\\([\\"])', r'\1', m.group(2)))
+        pos = m.end()
+        if pos == len(expr):
+            return ''.join(parts)
+        if expr[pos] != '.':
+            return None
+        pos += 1
+
+
+def statements(lines):
+    """ yields the statements of a vim script, joining continuation lines """
+    statement = None
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or stripped.startswith('"'):
+            continue
+        if stripped.startswith('\\') and statement is not None:
+            statement += stripped[1:]
+            continue
+        if statement is not None:
+            yield statement
+        statement = stripped
+    if statement is not None:
+        yield statement
+
+
+def compilePackage(fname):
+    """ returns the index entry of a package file, or None if the file has
+    to be sourced """
+    name = os.path.basename(fname)
+    with open(fname, 'rb') as fp:
+        contents = fp.read()
+    text = contents.decode('latin1')
+    entry = {'guard': '', 'options': None, 'commands': None,
+             'size': len(contents), 'digest': hashlib.sha256(contents).hexdigest()}
+    for statement in statements(text.splitlines()):
+        m = guardIfPattern.match(statement)
+        if m:
+            entry['guard'] = m.group(2)
+            continue
+        if statement in ('finish', 'endif'):
+            continue
+        m = guardLetPattern.match(statement)
+        if m and m.group(1) == entry['guard']:
+            continue
+        m = listLetPattern.match(statement)
+        if m and m.group(2) == name:
+            value = parseConcatenation(m.group(3))
+            if value is not None:
+                entry[m.group(1) and 'options' or 'commands'] = value
+                continue
+        return None
+    # Tex_pack() needs both lists.
+    if entry['options'] is None or entry['commands'] is None:
+        return None
+    # The lists are written as they are, in ascii.
+    for c in entry['options'] + entry['commands']:
+        if ord(c) > 127 or c in '\t\n\r':
+            return None
+    return entry
+
+
+def buildIndex(directory):
+    """ returns (compiled, sourced) for the package files in directory
+
+    compiled is a list of (name, entry) of the files which can be compiled,
+    sourced the list of the names of all others.
+    """
+    compiled = []
+    sourced = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            continue
+        entry = compilePackage(path)
+        if entry is None:
+            sourced.append(name)
+        else:
+            compiled.append((name, entry))
+    return (compiled, sourced)
+
+
+def writeIndex(directory, indexfile):
+    (compiled, sourced) = buildIndex(directory)
+    with open(indexfile, 'w') as fp:
+        fp.write(indexHeader + '\n')
+        fp.write('" sourced: %s\n' % ','.join(sourced))
+        for (name, entry) in compiled:
+            fp.write('\t'.join([name, entry['guard'], entry['options'],
+                                entry['commands'], '%d' % entry['size'],
+                                entry['digest']]) + '\n')
+    return (compiled, sourced)
+
+
+def benchmark(root, repeat=10):
+    """ times vim defining the lists of the compiled packages as
+    Tex_pack_check() does, by sourcing the package files and from the index
+
+    The packages are looked up in a 'runtimepath' of 30 directories besides
+    root, like the one of a vim with a few plugins. Returns a summary and a
+    list of the packages whose lists differ between both ways.
+    """
+    from texbackend import bestVimTime, vimString
+
+    with open(os.path.join(root, 'packages.index')) as fp:
+        names = [line.split('\t', 1)[0] for line in fp if not line.startswith('"')]
+    rtp = os.path.dirname(os.path.dirname(root))
+    tmpdir = tempfile.mkdtemp()
+    for i in range(30):
+        os.makedirs(os.path.join(tmpdir, 'plugin%d' % i, 'ftplugin'))
+        rtp += ',' + os.path.join(tmpdir, 'plugin%d' % i)
+
+    sourcing = ['for name in s:names',
+                "\tif globpath(&rtp, 'ftplugin/latex-suite/packages/'.name) != ''",
+                "\t\texe 'runtime! ftplugin/latex-suite/packages/'.name",
+                '\tendif',
+                'endfor']
+    loading = ['let s:index = {}',
+               'for line in readfile(%s)' % vimString(os.path.join(root, 'packages.index')),
+               '\tlet s:index[matchstr(line, "^[^\\t]*")] = line',
+               'endfor',
+               'for name in s:names',
+               "\tif globpath(&rtp, 'ftplugin/latex-suite/packages/'.name) != ''",
+               '\t\tlet entry = split(s:index[name], "\\t", 1)',
+               '\t\tlet g:TeX_package_option_{name} = entry[2]',
+               '\t\tlet g:TeX_package_{name} = entry[3]',
+               '\tendif',
+               'endfor']
+    output = os.path.join(tmpdir, 'lists')
+    # The lists of every package are written as a line of the output.
+    writing = ['let s:lists = []',
+               'for name in s:names',
+               "\tcall add(s:lists, name.\"\\t\".get(g:, 'TeX_package_option_'.name, '')"
+               ".\"\\t\".get(g:, 'TeX_package_'.name, ''))",
+               'endfor',
+               'call writefile(s:lists, %s)' % vimString(output)]
+    results = []
+    failures = []
+    try:
+        for count in (5, len(names)):
+            timings = []
+            lists = []
+            for script in (sourcing, loading):
+                timings.append(bestVimTime(
+                    ['let &rtp = %s' % vimString(rtp),
+                     'let s:names = [%s]' % ', '.join(vimString(name) for name in names[:count])]
+                    + script, repeat, writing))
+                with open(output) as fp:
+                    lists.append(fp.read().splitlines())
+            failures.extend('%s: the index differs from the file' % sourced.split('\t', 1)[0]
+                            for (sourced, indexed) in zip(*lists) if sourced != indexed)
+            results.append('%d packages: sourcing %.4f s, index %.4f s' % (
+                count, timings[0], timings[1]))
+    finally:
+        shutil.rmtree(tmpdir)
+    return ('best of %d, %s' % (repeat, '; '.join(results)), failures)
+
+
+if __name__ == "__main__":
+    root = os.path.dirname(os.path.abspath(__file__))
+    directory = os.path.join(root, 'packages')
+    indexfile = os.path.join(root, 'packages.index')
+    if len(sys.argv) > 1 and sys.argv[1] == '--benchmark':
+        import texbackend
+
+        (summary, failures) = benchmark(root)
+        texbackend.exitChecks(failures, summary)
+    else:
+        (compiled, sourced) = writeIndex(directory, indexfile)
+        print('%s: %d packages compiled, %d sourced' % (
+            indexfile, len(compiled), len(sourced)))
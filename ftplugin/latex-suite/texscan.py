@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+
+# Part of Latex-Suite
+#
+# Description:
+#   This file scans a latex document and all the files it \input's or
+#   \include's for labels, bibliographies and citation keys, without opening
+#   the files in vim. It replaces the split/vimgrep walks of
+#   Tex_ScanFileForLabels(), Tex_ScanFileForCite() and Tex_FindBibFiles()
+#   when python is available.
+
+import re
+import os
+import sys
+
+import texdeps
+
+
+def byteColumn(line, pos):
+    """ returns the column of pos in line as counted by vim, i.e. in bytes """
+    if str is bytes:
+        return pos + 1
+    return len(line[:pos].encode('utf-8')) + 1
+
+
+def matchLines(contents, pattern):
+    """ returns (key, lineno, col, text) for all matches of pattern
+
+    key is the first group of the match, text the line it was found in.
+    """
+    matches = []
+    lineno = 1
+    lastpos = 0
+    for m in pattern.finditer(contents):
+        start = contents.rfind('\n', 0, m.start()) + 1
+        lineno += contents.count('\n', lastpos, start)
+        lastpos = start
+        end = contents.find('\n', start)
+        if end < 0:
+            end = len(contents)
+        line = contents[start:end].rstrip('\r')
+        matches.append((m.group(1), lineno, byteColumn(line, m.start() - start), line))
+    return matches
+
+
+# The items of a vim regexp with 'magic' set, and what they are in python.
+# ( ) | + ? { } are literal in vim.
+vimItemPattern = re.compile(r'\\%\(|\\\{(-?)(\d*(?:,\d*)?)\\?}|\\.|\[(?:\\.|[^]\\])*\]|.', re.S)
+vimItems = {
+    '\\|': '|', '\\(': '(', '\\)': ')', '\\+': '+', '\\=': '?', '\\?': '?',
+    '\\<': r'\b', '\\>': r'\b', '\\s': r'\s', '\\S': r'\S', '\\d': r'\d',
+    '\\D': r'\D', '\\w': r'\w', '\\W': r'\W', '\\a': '[A-Za-z]', '\\l': '[a-z]',
+    '\\u': '[A-Z]', '\\h': '[A-Za-z_]', '\\x': '[0-9A-Fa-f]', '\\t': '\t',
+    '.': '.', '*': '*', '^': '^', '$': '$',
+}
+
+
+def vimRegexp(pattern):
+    """ returns a python regexp for a vim regexp
+
+    Only the items of vim regexps used in completion prefixes are
+    translated, other escaped characters are taken literally. A pattern
+    which is no valid regexp is searched for literally.
+    """
+    def translate(m):
+        item = m.group(0)
+        if item == '\\%(':
+            return '(?:'
+        if m.group(2) is not None:
+            count = m.group(2) and '{%s}' % m.group(2) or '*'
+            return m.group(1) and count + '?' or count
+        if item in vimItems:
+            return vimItems[item]
+        if item.startswith('[') and len(item) > 1:
+            return item
+        return re.escape(item[-1])
+
+    try:
+        return re.compile(vimItemPattern.sub(translate, pattern))
+    except re.error:
+        return re.compile(re.escape(pattern))
+
+
+def firstPerLine(matches, prefix):
+    """ returns the matches whose key starts with a match of the vim regexp
+    prefix, one per line
+
+    Like vimgrep without the g flag, only the first match in every line is
+    kept.
+    """
+    regexp = vimRegexp(prefix)
+    result = []
+    lastline = 0
+    for match in matches:
+        if match[1] != lastline and regexp.match(match[0]):
+            result.append(match)
+            lastline = match[1]
+    return result
+
+
+labelPattern = re.compile(r'\\(?:nl)?label{([^}\n]*)')
+bibitemPattern = re.compile(r'\\bibitem[ \t]*(?:\[[^]\n]*\])?[ \t]*{([^}\n]*)')
+bibEntryPattern = re.compile(
+    r'@[ \t]*(?!(?:string|comment|preamble)\b)\w+[ \t]*[{(][ \t]*([^,\s{}()]*)',
+    re.I)
+thebibliographyPattern = re.compile(r'^[ \t]*\\begin{thebibliography}', re.M)
+
+
+def parseTex(contents):
+    """ returns the labels and \\bibitem's of a file """
+    return {'labels': matchLines(contents, labelPattern),
+            'bibitems': matchLines(contents, bibitemPattern),
+            'thebibliography': thebibliographyPattern.search(contents) is not None}
+
+
+def parseBib(contents):
+    """ returns (key, lineno, col, text) for all entries of a .bib file """
+    return matchLines(contents, bibEntryPattern)
+
+
+def parseBbl(contents):
+    """ returns (key, lineno, col, text) for all \\bibitem's of a .bbl file """
+    return matchLines(contents, bibitemPattern)
+
+
+def walkIncludes(graph, buffers=None):
+    """ yields (fname, record, deps) for all latex files of a project
+
+    record is the result of parseTex(), deps the one of texdeps.parseTex().
+    The files are returned in the order of a depth first walk of the
+    \\input's and \\include's, every file only once.
+    """
+    for fname in graph.texfiles():
+        rec = texdeps.getParsed(fname, parseTex, buffers)
+        deps = texdeps.getParsed(fname, texdeps.parseTex, buffers)
+        if rec is not None and deps is not None:
+            yield (fname, rec, deps)
+
+
+def scanLabels(fname, prefix='', path='', buffers=None):
+    """ returns (fname, lineno, col, text) of the labels of a document
+
+    The labels of fname starting with prefix are followed by the labels of
+    every file it \\input's or \\include's, in order, recursively. Included
+    files are searched for as described in texdeps.ProjectGraph, with
+    path in place of $TEXINPUTS. buffers maps the names of files which are
+    modified in vim to their contents.
+    """
+    graph = texdeps.getGraph(fname, path, '', buffers)
+    matches = []
+    for (name, rec, deps) in walkIncludes(graph, buffers):
+        matches.extend((name, lineno, col, text) for (key, lineno, col, text)
+                       in firstPerLine(rec['labels'], prefix))
+    return matches
+
+
+def findBibFiles(fname, bibpath='', texpath='', recursive=True, buffers=None):
+    """ returns the .bib files of the bibliography commands of a document
+
+    Like Tex_FindBibFiles(), the files included by fname are only searched
+    if recursive is true.
+    """
+    graph = texdeps.getGraph(fname, texpath, bibpath, buffers)
+    if recursive:
+        return graph.bibfiles()
+    return [name for name in graph.children(graph.mainfile, 'bibliography')
+            if name.endswith('.bib')]
+
+
+def scanCites(fname, prefix='', bibpath='', texpath='', buffers=None,
+              unresolved=None):
+    """ returns (fname, lineno, col, text) of the citation keys of a document
+
+    The keys are searched for like Tex_ScanFileForCite() does: in the .bib
+    (or else .bbl) files of the first file with a bibliography command, or
+    in the \\bibitem's of the first file with a thebibliography
+    environment, taking fname before the files it includes. The names of
+    the bibliography command which are not found as files, such as URLs,
+    are appended to the list unresolved, for vim to open them.
+    """
+    graph = texdeps.getGraph(fname, texpath, bibpath, buffers)
+    matches = []
+    for (name, rec, deps) in walkIncludes(graph, buffers):
+        if deps['bibnames']:
+            if unresolved is not None:
+                unresolved.extend(graph.children(name, 'unresolved'))
+            for found in graph.children(name, 'bibliography'):
+                if found.endswith('.bib'):
+                    entries = texdeps.getParsed(found, parseBib)
+                else:
+                    entries = texdeps.getParsed(found, parseBbl)
+                matches.extend((found, lineno, col, text) for (key, lineno, col, text)
+                               in firstPerLine(entries or [], prefix))
+            return matches
+        if rec['thebibliography']:
+            return [(name, lineno, col, text) for (key, lineno, col, text)
+                    in firstPerLine(rec['bibitems'], prefix)]
+    return matches
+
+
+def getModifiedBuffers():
+    """ returns the contents of all modified buffers of vim by file name """
+    import vim
+
+    buffers = {}
+    for buf in vim.buffers:
+        try:
+            if buf.name and buf.options['modified']:
+                buffers[os.path.abspath(buf.name)] = '\n'.join(buf[:])
+        except (KeyError, AttributeError):
+            pass
+    return buffers
+
+
+def setQuickfixList(matches):
+    """ appends (fname, lineno, col, text) to the quickfix list of vim """
+    import vimbridge
+
+    return vimbridge.setQuickfixList(
+        [{'filename': name, 'lnum': lineno, 'col': col, 'text': text}
+         for (name, lineno, col, text) in matches], 'a')
+
+
+def setLabelList(fname, prefix='', path=''):
+    """ appends the labels of a document to the quickfix list of vim """
+    return setQuickfixList(scanLabels(fname, prefix, path, getModifiedBuffers()))
+
+
+def setCiteList(fname, prefix='', bibpath='', texpath=''):
+    """ appends the citation keys of a document to the quickfix list of vim
+
+    The local variable retval is set to the bibliographies which were not
+    found as files.
+    """
+    import vimbridge
+
+    unresolved = []
+    count = setQuickfixList(scanCites(fname, prefix, bibpath, texpath,
+                                      getModifiedBuffers(), unresolved))
+    vimbridge.setVar('retval', unresolved)
+    return count
+
+
+def setBibFiles(fname, bibpath='', texpath='', recursive=True):
+    """ sets the local variable retval to the list of .bib files """
+    import vimbridge
+
+    bibfiles = findBibFiles(fname, bibpath, texpath, recursive,
+                            getModifiedBuffers())
+    vimbridge.setVar('retval', list(bibfiles))
+    return bibfiles
+
+
+def benchmark(fname, prefix='', path='', repeat=5):
+    """ times scanLabels and scanCites on a document, without and with cache
+
+    Returns a summary and a list of the failures: the matches found with
+    the cache must be the ones found from scratch.
+    """
+    import texbackend
+
+    scans = (('labels', lambda: scanLabels(fname, prefix, path)),
+             ('citations', lambda: scanCites(fname, prefix, '', path)))
+    timings = []
+    failures = []
+    for (name, scan) in scans:
+        texdeps.clearCaches()
+        (first, found) = texbackend.bestTime(scan, 1)
+        (best, cached) = texbackend.bestTime(scan, repeat)
+        if cached != found:
+            failures.append('%s: the cache changes the matches' % name)
+        timings.append('%s: %d found, first %.4f s, cached %.4f s'
+                       % (name, len(found), first, best))
+    return ('\n'.join(timings), failures)
+
+
+def selftest():
+    """ checks that prefixes are matched as the vim regexps of vimgrep,
+    returns a list of the failures """
+    contents = '\n'.join([r'\label{eq:1} \label{eq:2}', r'\label{eq:10}',
+                          r'\label{fig:a}', r'\label{tab:b}', r'\label{sec:a+b}',
+                          r'\label{sec:(x)}', r'\label{Eq.3}'])
+    expected = [('', ['eq:1', 'eq:10', 'fig:a', 'tab:b', 'sec:a+b', 'sec:(x)', 'Eq.3']),
+                ('eq', ['eq:1', 'eq:10']),
+                ('eq.*', ['eq:1', 'eq:10']),
+                ('eq:\\d\\{2}', ['eq:10']),
+                ('fig:\\|tab:', ['fig:a', 'tab:b']),
+                ('\\(fig\\|tab\\):[ab]', ['fig:a', 'tab:b']),
+                ('sec:a+b', ['sec:a+b']),
+                ('sec:(x)', ['sec:(x)']),
+                ('\\u\\l\\.', ['Eq.3']),
+                ('eq\\(', [])]
+    matches = matchLines(contents, labelPattern)
+    failures = []
+    for (prefix, keys) in expected:
+        found = [key for (key, lineno, col, text) in firstPerLine(matches, prefix)]
+        if found != keys:
+            failures.append('prefix %r: %r instead of %r' % (prefix, found, keys))
+    return failures
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in ('--selftest', '--benchmark'):
+        import texbackend
+
+        if sys.argv[1] == '--selftest':
+            texbackend.exitChecks(selftest())
+        (summary, failures) = benchmark(*sys.argv[2:5])
+        texbackend.exitChecks(failures, summary)
+    else:
+        for (name, lineno, col, text) in scanLabels(*sys.argv[1:4]):
+            print('%s:%d:%d:%s' % (name, lineno, col, text))
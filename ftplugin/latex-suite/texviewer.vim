@@ -551,6 +551,25 @@ endfunction " }}}
 " Tex_GrepHelper: grep main filename for \\bibitem's or \\label's {{{
 " Description: 
 function! Tex_GrepHelper(prefix, what)
+	if Tex_UsePython()
+		" Scan the main file and all included files in one go and fill the
+		" quickfix list with a single call to setqflist().
+		let args = 'r"""' . Tex_GetMainFileName(':p') . '""", r"""' . a:prefix . '""", '
+		if a:what =~ 'bib'
+			exec g:Tex_PythonCmd . ' texscan.setCiteList(' . args . 'r"""' . g:Tex_BIBINPUTS . '""", r"""' . Tex_GetVarValue('Tex_TEXINPUTS') . '""")'
+			" Bibliographies which are no files, such as URLs, are opened
+			" by vim as in Tex_ScanFileForCite().
+			for bibname in retval
+				exec 'split '.fnameescape(bibname)
+				call Tex_Grepadd('@.*{'.a:prefix, "%")
+				q
+			endfor
+		else
+			exec g:Tex_PythonCmd . ' texscan.setLabelList(' . args . 'r"""' . Tex_GetVarValue('Tex_TEXINPUTS') . '""")'
+		endif
+		return
+	endif
+
 	let _path = &path
 	let _suffixesadd = &suffixesadd
 	let _hidden = &hidden
@@ -766,19 +785,23 @@ endfunction " }}}
 " these lines need to be outside the function.
 let s:path = expand('<sfile>:p:h')
 if Tex_UsePython()
-	exec g:Tex_PythonCmd . " import sys, re"
-	exec g:Tex_PythonCmd . " sys.path += [r'". s:path . "']"
-	exec g:Tex_PythonCmd . " import auxoutline"
+	exec g:Tex_PythonCmd . " texbackend.onLoad('texindex', 'setinterval', " . Tex_GetVarValue('Tex_ProjectIndexInterval', 2) . ")"
 endif
 
 function! Tex_StartOutlineCompletion()
 	let mainfname = Tex_GetMainFileName(':p')
 
 	if Tex_UsePython()
-		exec g:Tex_PythonCmd . ' retval = auxoutline.main("""' . mainfname . '""", """' . s:prefix . '""")'
+		if Tex_GetVarValue('Tex_UseProjectIndex', 1) == 1
+			" The labels are taken from the index of the project, which
+			" reads the .aux file only if it changed.
+			exec g:Tex_PythonCmd . ' retval = texindex.outlinecompletion("""' . mainfname . '""", """' . s:prefix . '""")'
+		else
+			exec g:Tex_PythonCmd . ' retval = auxoutline.main("""' . mainfname . '""", """' . s:prefix . '""")'
+		endif
 
 		" transfer variable from python to a local variable.
-		exec g:Tex_PythonCmd . ' vim.command("""let retval = "%s" """ % re.sub(r"\"|\\", r"\\\g<0>", retval))'
+		exec g:Tex_PythonCmd . ' vimbridge.setVar("retval", retval)'
 	else
 		let retval = system(shellescape(s:path.'/auxoutline.py').' '.shellescape(mainfname).' '.shellescape(s:prefix))
 	endif
@@ -885,6 +908,13 @@ endfunction " }}}
 function! Tex_FindBibFiles( currfile, recursive )
 	call Tex_Debug(":Tex_FindBibFiles: ", "view")
 
+	if Tex_UsePython()
+		let fname = a:currfile !=# "" ? fnamemodify(a:currfile, ':p') : expand('%:p')
+		exec g:Tex_PythonCmd . ' texscan.setBibFiles(r"""' . fname . '""", r"""' . g:Tex_BIBINPUTS . '""", r"""' . Tex_GetVarValue('Tex_TEXINPUTS') . '""", ' . a:recursive . ')'
+		call Tex_Debug(":Tex_FindBibFiles: found [".join(retval, ', ')."]", "view")
+		return empty(retval) ? '' : join(retval, "\n") . "\n"
+	endif
+
 	if a:currfile !=# ""
 		split
 		exec 'silent! e '.fnameescape(a:currfile)
@@ -977,14 +1007,6 @@ function! Tex_FindBibFiles( currfile, recursive )
 endfunction " }}}
 " Tex_StartBibtexOutline: sets up an outline window {{{
 
-" get the place where this plugin resides for setting cpt and dict options.
-" these lines need to be outside the function.
-if Tex_UsePython()
-	exec g:Tex_PythonCmd . " import sys, re"
-	exec g:Tex_PythonCmd . " sys.path += [r'". s:path . "']"
-	exec g:Tex_PythonCmd . " import bibtools"
-endif
-
 function! Tex_StartCiteCompletion()
 	let bibfiles = Tex_FindBibFiles( Tex_GetMainFileName(':p'), 1 )
 	if bibfiles !~ '\S'
@@ -996,13 +1018,24 @@ function! Tex_StartCiteCompletion()
     bot split __OUTLINE__
 	exec Tex_GetVarValue('Tex_OutlineWindowHeight', 15).' wincmd _'
 
-	exec g:Tex_PythonCmd . ' Tex_BibFile = bibtools.BibFile(r"""'.bibfiles.'""")'
+	if Tex_GetVarValue('Tex_UseBibCache', 1) == 1
+		exec g:Tex_PythonCmd . ' Tex_BibCache = bibtools.getcache(r"""'.Tex_GetVarValue('Tex_BibCacheFile', '').'""", '.Tex_GetVarValue('Tex_BibCacheSize', 64).')'
+	else
+		exec g:Tex_PythonCmd . ' Tex_BibCache = None'
+	endif
+	if Tex_GetVarValue('Tex_UseProjectIndex', 1) == 1
+		" The entries are kept in the index of the project between
+		" completions, and only read again if a bibtex file changed.
+		exec g:Tex_PythonCmd . ' Tex_BibFile = texindex.bibfile(r"""'.Tex_GetMainFileName(':p').'""", r"""'.bibfiles.'""", Tex_BibCache, '.Tex_GetVarValue('Tex_BibLoadProcesses', 0).')'
+	else
+		exec g:Tex_PythonCmd . ' Tex_BibFile = bibtools.BibFile(r"""'.bibfiles.'""", Tex_BibCache, '.Tex_GetVarValue('Tex_BibLoadProcesses', 0).')'
+	endif
 	exec g:Tex_PythonCmd . ' Tex_BibFile.addfilter(r"key ^'.s:prefix.'")'
 	
 	call Tex_DisplayBibList()
 	"call Tex_EchoBibShortcuts()
 
-	nnoremap <buffer> <Plug>Tex_JumpToNextBibEntry :call search('^\S.*\]$', 'W')<CR>z.:call Tex_EchoBibShortcuts()<CR>
+	nnoremap <buffer> <Plug>Tex_JumpToNextBibEntry :call Tex_AppendBibPage(0)<CR>:call search('^\S.*\]$', 'W')<CR>z.:call Tex_EchoBibShortcuts()<CR>
 	nnoremap <buffer> <Plug>Tex_JumpToPrevBibEntry :call search('^\S.*\]$', 'bW')<CR>z.:call Tex_EchoBibShortcuts()<CR>
 	nnoremap <buffer> <Plug>Tex_FilterBibEntries   :call Tex_HandleBibShortcuts('filter')<CR>
 	nnoremap <buffer> <Plug>Tex_RemoveBibFilters   :call Tex_HandleBibShortcuts('remove_filters')<CR>
@@ -1014,6 +1047,7 @@ function! Tex_StartCiteCompletion()
 	nmap <buffer> <silent> f		<Plug>Tex_FilterBibEntries
 	nmap <buffer> <silent> s		<Plug>Tex_SortBibEntries
 	nmap <buffer> <silent> a		<Plug>Tex_RemoveBibFilters
+	nnoremap <buffer> <silent> G	:call Tex_AppendBibPage(1)<CR>G
 	nmap <buffer> <silent> q		:close<CR>:call Tex_SwitchToInsertMode()<CR>
 	nmap <buffer> <silent> <CR>		<Plug>Tex_CompleteCiteEntry
 
@@ -1041,7 +1075,17 @@ function! Tex_DisplayBibList()
 	" delete everything in it to the blackhole
 	% d _
 
-	exec g:Tex_PythonCmd . ' vim.current.buffer[:] = Tex_BibFile.__str__().splitlines()'
+	" Only the first page of entries is put into the buffer. The remaining
+	" entries are appended by Tex_AppendBibPage() when the window is scrolled
+	" towards the end of the buffer.
+	exec g:Tex_PythonCmd . ' Tex_BibPages = Tex_BibFile.pages('.(2 * winheight(0)).')'
+	exec g:Tex_PythonCmd . ' vimbridge.setLines(vim.current.buffer, next(Tex_BibPages, []))'
+	let b:Tex_BibPagesLeft = 1
+
+	augroup LatexSuiteBibList
+		au! * <buffer>
+		au CursorMoved <buffer> call Tex_AppendBibPage(0)
+	augroup END
 
 	call Tex_SetupBibSyntax()
 
@@ -1055,6 +1099,22 @@ function! Tex_DisplayBibList()
     let &lazyredraw = _lazyredraw
 
 endfunction " }}}
+" Tex_AppendBibPage: appends the next page of bibtex entries {{{
+" Description: Called when the cursor moves in the list of bibtex entries.
+" 	Appends further entries until the buffer extends at least one window
+" 	height beyond the last visible line. With a:all = 1, all the remaining
+" 	entries are appended.
+function! Tex_AppendBibPage(all)
+	while exists('b:Tex_BibPagesLeft') && b:Tex_BibPagesLeft
+		\ && (a:all || line('$') - line('w$') < winheight(0))
+		setlocal modifiable
+		exec g:Tex_PythonCmd . ' Tex_BibPage = next(Tex_BibPages, [])'
+		exec g:Tex_PythonCmd . ' if Tex_BibPage: vimbridge.setLines(vim.current.buffer, Tex_BibPage, True)'
+		exec g:Tex_PythonCmd . ' vimbridge.setVar("b:Tex_BibPagesLeft", int(len(Tex_BibPage) > 0))'
+		setlocal nomodifiable
+		setlocal nomodified
+	endwhile
+endfunction " }}}
 " Tex_EchoBibShortcuts: echos all the shortcuts in the status line {{{
 " Description:
 function! Tex_EchoBibShortcuts()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+# Part of Latex-Suite
+#
+# Description:
+#   This file hands the results of the python helpers back to vim. Values
+#   are stored into the dictionaries of vim variables returned by
+#   vim.bindeval(), and vim functions are called through vim.Function, so
+#   that vim converts python strings, numbers, lists and dictionaries itself
+#   instead of parsing them again from an Ex command. A vim whose python
+#   interface has neither falls back to :let and :call with quoted values.
+#
+#   Time handing the contents of a file to vim both ways, from within vim:
+#       :py3 import vimbridge; print(vimbridge.benchmark('file.tex')[0])
+#   or, only the quoted way, outside of vim:
+#       python vimbridge.py --benchmark file.tex
+
+import os
+import sys
+
+
+if sys.version_info[0] >= 3:
+    integerTypes = (int,)
+    stringTypes = (str, bytes)
+else:
+    integerTypes = (int, long)
+    stringTypes = (str, unicode)
+
+
+def vimValue(value):
+    """ returns a vim expression for a string, number, list or dictionary
+
+    Strings are quoted with double quotes, their newlines being escaped, so
+    that the expression stays on a single line.
+    """
+    if isinstance(value, bool):
+        return '%d' % value
+    if isinstance(value, integerTypes):
+        return '%d' % value
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        return '[%s]' % ', '.join(vimValue(item) for item in value)
+    if isinstance(value, dict):
+        return '{%s}' % ', '.join('%s: %s' % (vimValue(key), vimValue(item))
+                                  for (key, item) in value.items())
+    if isinstance(value, bytes) and str is not bytes:
+        value = value.decode('latin1')
+    if not isinstance(value, stringTypes):
+        raise TypeError('cannot hand %r to vim' % (value,))
+    return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n').replace('\r', '\\r')
+
+
+def splitName(name):
+    """ returns (scope, name) of a vim variable name, l: by default """
+    if len(name) > 2 and name[1] == ':':
+        return (name[0], name[2:])
+    return ('l', name)
+
+
+def setVar(name, value):
+    """ sets a vim variable to a python value
+
+    name is 'retval' or 'l:retval' for a local variable of the vim function
+    running the python code, or 'b:name', 'g:name' and so on. value may be a
+    string, a number, or a list or dictionary of them.
+    """
+    import vim
+
+    (scope, key) = splitName(name)
+    if hasattr(vim, 'bindeval'):
+        vim.bindeval(scope + ':')[key] = value
+    else:
+        vim.command('let %s:%s = %s' % (scope, key, vimValue(value)))
+
+
+def callFunction(function, *args):
+    """ calls a vim function with python values as arguments """
+    import vim
+
+    if hasattr(vim, 'Function'):
+        return vim.Function(function)(*args)
+    return vim.eval('%s(%s)' % (function, ', '.join(vimValue(arg) for arg in args)))
+
+
+def setQuickfixList(items, action=' '):
+    """ sets the quickfix list of vim to a list of dictionaries, as
+    setqflist() does """
+    callFunction('setqflist', items, action)
+    return len(items)
+
+
+def setLines(buf, lines, append=False):
+    """ writes a list of lines into a vim buffer, replacing its contents
+    unless append is true """
+    if append:
+        buf.append(lines)
+    else:
+        buf[:] = lines
+
+
+def readText(fname):
+    with open(fname, 'rb') as fp:
+        contents = fp.read()
+    try:
+        return contents.decode('utf-8')
+    except UnicodeDecodeError:
+        return contents.decode('latin1')
+
+
+def benchmark(fname, repeat=5):
+    """ times handing the contents of a file to vim as a string and as a
+    list of lines, with :let and with vim.bindeval()
+
+    Returns a summary and a list of the values which vim did not get
+    unchanged. Outside of vim, only :let can be timed, by sourcing the
+    commands in a vim started for it.
+    """
+    import tempfile
+
+    import texbackend
+
+    text = readText(fname)
+    values = (('string', text), ('lines', text.split('\n')))
+    results = []
+    failures = []
+    try:
+        import vim
+    except ImportError:
+        vim = None
+    if vim is not None:
+        scope = vim.bindeval('g:')
+        for (kind, value) in values:
+            timings = []
+            for (how, function) in (
+                    ('let', lambda: vim.command(
+                        'let g:Tex_BridgeBenchmark = %s' % vimValue(value))),
+                    ('bindeval', lambda: scope.__setitem__('Tex_BridgeBenchmark', value))):
+                timings.append(texbackend.bestTime(function, repeat)[0])
+                if vim.eval('g:Tex_BridgeBenchmark') != value:
+                    failures.append('%s: changed by %s' % (kind, how))
+            results.append('%s: let %.4f s, bindeval %.4f s' % ((kind,) + tuple(timings)))
+        vim.command('unlet! g:Tex_BridgeBenchmark')
+    else:
+        (fd, outname) = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            for (kind, value) in values:
+                quoting = texbackend.bestTime(lambda: vimValue(value), repeat)[0]
+                # The value is written back as lines, and read as the text.
+                if kind == 'string':
+                    lines = 'split(g:Tex_BridgeBenchmark, "\\n", 1)'
+                else:
+                    lines = 'g:Tex_BridgeBenchmark'
+                best = texbackend.bestVimTime(
+                    ['let g:Tex_BridgeBenchmark = %s' % vimValue(value)], repeat,
+                    ['call writefile(%s, %s, "b")' % (lines, vimValue(outname))])
+                if readText(outname) != text:
+                    failures.append('%s: changed by let' % kind)
+                results.append('%s: quoting %.4f s, let %.4f s' % (kind, quoting, best))
+        finally:
+            os.remove(outname)
+    return ('%d bytes, %d lines, best of %d; %s' % (
+        len(text), len(values[1][1]), repeat, '; '.join(results)), failures)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == '--benchmark':
+        import texbackend
+
+        (summary, failures) = benchmark(sys.argv[2])
+        texbackend.exitChecks(failures, summary)
+    else:
+        print(vimValue(readText(sys.argv[1])))